@@ -1,10 +1,19 @@
 import argparse
+import hashlib
 import os
 import platform
 import shutil
 import subprocess
 import sys
+import tarfile
 import tempfile
+import time
+import urllib.request
+import zipfile
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from dataclasses import dataclass
 from pathlib import Path
 
 UV_VERSION = "0.9.18"
@@ -12,8 +21,12 @@ PNPM_VERSION = "10.25.0"
 COPIER_VERSION = "==9.11.0"
 COPIER_TEMPLATE_EXTENSIONS_VERSION = "==0.3.3"
 PRE_COMMIT_VERSION = "4.5.0"
+SSM_PLUGIN_VERSION = "1.2.707.0"  # no specific reason for that version, just pinning it for best practice
 GITHUB_WINDOWS_RUNNER_BIN_PATH = r"C:\Users\runneradmin\.local\bin"
 INSTALL_SSM_PLUGIN_BY_DEFAULT = False
+DEFAULT_CACHE_DIR = Path(os.environ.get("CI_TOOLING_CACHE_DIR", Path.home() / ".cache" / "ci-tooling"))
+DOWNLOAD_TIMEOUT_SECONDS = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 parser = argparse.ArgumentParser(description="Install CI tooling for the repo")
 _ = parser.add_argument(
     "--no-python",
@@ -36,42 +49,198 @@ _ = parser.add_argument(
     default=False,
     help="Skip installing the SSM plugin for AWS CLI",
 )
+_ = parser.add_argument(
+    "--cache-dir",
+    type=Path,
+    default=DEFAULT_CACHE_DIR,
+    help="Where to keep downloaded installers and packages between runs (defaults to $CI_TOOLING_CACHE_DIR or ~/.cache/ci-tooling)",
+)
+_ = parser.add_argument(
+    "--offline",
+    action="store_true",
+    default=False,
+    help="Install only from what's already in the cache directory, without using the network",
+)
+_ = parser.add_argument(
+    "--mirror-url",
+    type=str,
+    default=None,
+    help="Download from this mirror instead, e.g. `file:///srv/mirror` fetches https://github.com/... from /srv/mirror/github.com/...",
+)
+
+
+class DownloadCache:
+    """Downloads files once, storing them by the SHA-256 of their content.
+
+    Each URL (which contains the pinned version) points at the digest it was downloaded as, and a cached file is only
+    used if its content still matches that digest.
+    """
+
+    def __init__(self, cache_dir: Path, *, offline: bool, mirror_url: str | None):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.mirror_url = mirror_url
+
+    def _key_path(self, url: str) -> Path:
+        return self.cache_dir / "keys" / hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _lookup(self, url: str) -> Path | None:
+        key_path = self._key_path(url)
+        if not key_path.is_file():
+            return None
+        digest, file_name = key_path.read_text().split(" ", 1)
+        blob_path = self.cache_dir / "blobs" / digest / file_name
+        if not blob_path.is_file() or _sha256_of_file(blob_path) != digest:
+            return None
+        return blob_path
+
+    def fetch(self, url: str) -> Path:
+        """Return the path of a local copy of the URL, downloading it unless it's already in the cache."""
+        cached_path = self._lookup(url)
+        if cached_path is not None:
+            return cached_path
+        if self.offline:
+            raise FileNotFoundError(f"{url} has not been cached in {self.cache_dir}, and --offline was given")  # noqa: TRY003 # not worth a custom exception for this
+        download_url = url if self.mirror_url is None else f"{self.mirror_url.rstrip('/')}/{url.split('://', 1)[1]}"
+        blobs_dir = self.cache_dir / "blobs"
+        blobs_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with (
+            tempfile.NamedTemporaryFile(dir=blobs_dir, delete=False) as tmp_file,
+            urllib.request.urlopen(download_url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response,  # noqa: S310 # the URLs are all pinned in this script, or come from the mirror the caller chose
+        ):
+            while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                _ = tmp_file.write(chunk)
+        blob_path = blobs_dir / digest.hexdigest() / url.rsplit("/", 1)[1]
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        _ = Path(tmp_file.name).replace(blob_path)
+        key_path = self._key_path(url)
+        key_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_key_path = key_path.with_name(f"{key_path.name}.tmp")
+        _ = tmp_key_path.write_text(f"{digest.hexdigest()} {blob_path.name}")
+        _ = tmp_key_path.replace(key_path)
+        return blob_path
+
+
+def _sha256_of_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class TaskResult:
+    name: str
+    seconds: float
+    output: str
+    error: BaseException | None
+
+
+class TaskOutput:
+    """Collects the output of a task's commands, so concurrent tasks don't interleave on the terminal."""
+
+    def __init__(self):
+        super().__init__()
+        self.lines: list[str] = []
+
+    def run(self, command: list[str] | str, *, env: dict[str, str] | None = None, shell: bool = False) -> None:
+        self.lines.append(f"$ {command if isinstance(command, str) else ' '.join(command)}\n")
+        result = subprocess.run(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=False, env=env, shell=shell
+        )
+        self.lines.append(result.stdout)
+        result.check_returncode()
+
+
+def run_task(name: str, task: Callable[[TaskOutput], None]) -> TaskResult:
+    start = time.perf_counter()
+    output = TaskOutput()
+    error: BaseException | None = None
+    try:
+        task(output)
+    except Exception as e:  # noqa: BLE001 # reported along with the rest of the task's output once it finishes
+        error = e
+    return TaskResult(name=name, seconds=time.perf_counter() - start, output="".join(output.lines), error=error)
+
+
+def uv_archive_name(*, is_windows: bool) -> str:
+    machine = platform.machine().lower()
+    arch = {"amd64": "x86_64", "arm64": "aarch64"}.get(machine, machine)
+    if is_windows:
+        return f"uv-{arch}-pc-windows-msvc.zip"
+    if platform.system() == "Darwin":
+        return f"uv-{arch}-apple-darwin.tar.gz"
+    libc = "gnu" if platform.libc_ver()[0] == "glibc" else "musl"
+    return f"uv-{arch}-unknown-linux-{libc}.tar.gz"
+
+
+def install_uv(output: TaskOutput, *, cache: DownloadCache, bin_dir: Path, is_windows: bool) -> Path:
+    """Install the pinned uv release into the bin directory, the same place the official installer puts it."""
+    uv_path = bin_dir / ("uv.exe" if is_windows else "uv")
+    if uv_path.is_file():
+        installed = subprocess.run([str(uv_path), "--version"], capture_output=True, text=True, check=False)  # noqa: S603 # it's the uv binary this script installed
+        if installed.stdout.split()[1:2] == [UV_VERSION]:
+            output.lines.append(f"uv {UV_VERSION} is already installed at {uv_path}\n")
+            return uv_path
+    archive_name = uv_archive_name(is_windows=is_windows)
+    archive_path = cache.fetch(f"https://github.com/astral-sh/uv/releases/download/{UV_VERSION}/{archive_name}")
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    executable_names = {"uv", "uvx", "uvw", "uv.exe", "uvx.exe", "uvw.exe"}
+    if archive_name.endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                if Path(member.filename).name in executable_names:
+                    _ = (bin_dir / Path(member.filename).name).write_bytes(archive.read(member))
+    else:
+        with tarfile.open(archive_path) as archive:
+            for member in archive.getmembers():
+                extracted = archive.extractfile(member) if member.isfile() else None
+                if extracted is not None and Path(member.name).name in executable_names:
+                    target = bin_dir / Path(member.name).name
+                    _ = target.write_bytes(extracted.read())
+                    target.chmod(0o755)
+    output.lines.append(f"Installed uv {UV_VERSION} from {archive_path} into {bin_dir}\n")
+    return uv_path
 
 
 def main():
     args = parser.parse_args(sys.argv[1:])
     is_windows = platform.system() == "Windows"
+    cache = DownloadCache(args.cache_dir, offline=args.offline, mirror_url=args.mirror_url)
     uv_env = dict(os.environ)
-    uv_env.update({"UV_PYTHON": args.python_version, "UV_PYTHON_PREFERENCE": "only-system"})
-    uv_path = ((GITHUB_WINDOWS_RUNNER_BIN_PATH + "\\") if is_windows else "") + "uv"
+    uv_env.update(
+        {
+            "UV_PYTHON": args.python_version,
+            "UV_PYTHON_PREFERENCE": "only-system",
+            "UV_CACHE_DIR": str(args.cache_dir / "uv"),  # uv's own cache is content addressed, and keeps the wheels
+        }
+    )
+    if args.offline:
+        uv_env["UV_OFFLINE"] = "1"
+    bin_dir = (
+        Path(GITHUB_WINDOWS_RUNNER_BIN_PATH)
+        if is_windows
+        else Path(os.environ.get("XDG_BIN_HOME", Path.home() / ".local" / "bin"))
+    )
+    pwsh = ""
     if is_windows:
-        pwsh = shutil.which("pwsh") or shutil.which("powershell")
+        pwsh = shutil.which("pwsh") or shutil.which("powershell") or ""
         if not pwsh:
             raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
-    if not args.no_python:
+
+    def in_shell(command: str) -> list[str] | str:
+        return [pwsh, "-NoProfile", "-NonInteractive", "-Command", command] if is_windows else command
+
+    def install_python_tools(output: TaskOutput) -> None:
         if is_windows:
             uv_env.update({"PATH": rf"{GITHUB_WINDOWS_RUNNER_BIN_PATH};{uv_env['PATH']}"})
-            # invoke installer in a pwsh process
-            _ = subprocess.run(
-                [
-                    pwsh,  # type: ignore[reportPossiblyUnboundVariable] # this matches the conditional above that defines pwsh
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    f"irm https://astral.sh/uv/{UV_VERSION}/install.ps1 | iex",
-                ],
-                check=True,
-                env=uv_env,
-            )
-        else:
-            _ = subprocess.run(
-                f"curl -fsSL --connect-timeout 20 --max-time 40 --retry 3 --retry-delay 5 --retry-connrefused --proto '=https' https://astral.sh/uv/{UV_VERSION}/install.sh | sh",
-                check=True,
-                shell=True,
-                env=uv_env,
-            )
-            # TODO: add uv autocompletion to the shell https://docs.astral.sh/uv/getting-started/installation/#shell-autocompletion
-        _ = subprocess.run(
+        uv_path = str(install_uv(output, cache=cache, bin_dir=bin_dir, is_windows=is_windows))
+        # TODO: add uv autocompletion to the shell https://docs.astral.sh/uv/getting-started/installation/#shell-autocompletion
+        tool_installs = [
             [
                 uv_path,
                 "tool",
@@ -80,84 +249,62 @@ def main():
                 "--with",
                 f"copier-template-extensions{COPIER_TEMPLATE_EXTENSIONS_VERSION}",
             ],
-            check=True,
-            env=uv_env,
-        )
-        _ = subprocess.run(
-            [
-                uv_path,
-                "tool",
-                "install",
-                f"pre-commit=={PRE_COMMIT_VERSION}",
-            ],
-            check=True,
-            env=uv_env,
-        )
-        _ = subprocess.run(
-            [
-                uv_path,
-                "tool",
-                "list",
-            ],
-            check=True,
-            env=uv_env,
-        )
+            [uv_path, "tool", "install", f"pre-commit=={PRE_COMMIT_VERSION}"],
+        ]
+        # the tools are independent of each other once uv itself is installed
+        with ThreadPoolExecutor(max_workers=len(tool_installs)) as executor:
+            tool_outputs = [TaskOutput() for _ in tool_installs]
+            futures = [
+                executor.submit(tool_output.run, command, env=uv_env)
+                for tool_output, command in zip(tool_outputs, tool_installs, strict=True)
+            ]
+            errors = [future.exception() for future in futures]
+        for tool_output in tool_outputs:
+            output.lines.extend(tool_output.lines)
+        for error in errors:
+            if error is not None:
+                raise error
+        output.run([uv_path, "tool", "list"], env=uv_env)
+
+    def install_pnpm(output: TaskOutput) -> None:
+        tarball_path = cache.fetch(f"https://registry.npmjs.org/pnpm/-/pnpm-{PNPM_VERSION}.tgz")
+        output.run(in_shell("npm -v"), shell=not is_windows)
+        # installed from the cached tarball, which npm doesn't need the network for since pnpm has no dependencies
+        output.run(in_shell(f'npm install -g --offline "{tarball_path}"'), shell=not is_windows)
+        output.run(in_shell("pnpm -v"), shell=not is_windows)
+
+    def install_ssm_plugin(output: TaskOutput) -> None:
+        # Based on https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-windows.html and
+        # https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-debian-and-ubuntu.html
+        base_url = f"https://s3.amazonaws.com/session-manager-downloads/plugin/{SSM_PLUGIN_VERSION}"
+        if is_windows:
+            output.run([str(cache.fetch(f"{base_url}/windows/SessionManagerPluginSetup.exe")), "/quiet"])
+        else:
+            output.run(["sudo", "dpkg", "-i", str(cache.fetch(f"{base_url}/ubuntu_64bit/session-manager-plugin.deb"))])
+        output.lines.append("SSM Plugin Manager Version: \n")
+        output.run(["session-manager-plugin", "--version"])
+
+    tasks: dict[str, Callable[[TaskOutput], None]] = {}
+    if not args.no_python:
+        tasks["uv, copier and pre-commit"] = install_python_tools
     if not args.no_node:
-        pnpm_install_sequence = ["npm -v", f"npm install -g pnpm@{PNPM_VERSION}", "pnpm -v"]
-        for cmd in pnpm_install_sequence:
-            cmd = (
-                [
-                    pwsh,  # type: ignore[reportPossiblyUnboundVariable] # this matches the conditional above that defines pwsh
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    cmd,
-                ]
-                if is_windows
-                else [cmd]
-            )
-            _ = subprocess.run(cmd, shell=True, check=True)
+        tasks["pnpm"] = install_pnpm
     if INSTALL_SSM_PLUGIN_BY_DEFAULT and not args.skip_installing_ssm_plugin:
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            if is_windows:
-                local_package_path = Path(tmp_dir) / "SessionManagerPluginSetup.exe"
-                # Based on https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-windows.html
-                # no specific reason for that version, just pinning it for best practice
-                _ = subprocess.run(
-                    [
-                        "curl",
-                        "https://s3.amazonaws.com/session-manager-downloads/plugin/1.2.707.0/windows/SessionManagerPluginSetup.exe",
-                        "-o",
-                        f"{local_package_path}",
-                    ],
-                    check=True,
-                )
-                _ = subprocess.run(
-                    [str(local_package_path), "/quiet"],
-                    check=True,
-                )
-            else:
-                local_package_path = Path(tmp_dir) / "session-manager-plugin.deb"
-                # Based on https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-debian-and-ubuntu.html
-                # no specific reason for that version, just pinning it for best practice
-                _ = subprocess.run(
-                    [
-                        "curl",
-                        "https://s3.amazonaws.com/session-manager-downloads/plugin/1.2.707.0/ubuntu_64bit/session-manager-plugin.deb",
-                        "-o",
-                        f"{local_package_path}",
-                    ],
-                    check=True,
-                )
-                _ = subprocess.run(
-                    ["sudo", "dpkg", "-i", str(local_package_path)],
-                    check=True,
-                )
-            print("SSM Plugin Manager Version: ")
-            _ = subprocess.run(
-                ["session-manager-plugin", "--version"],
-                check=True,
-            )
+        tasks["SSM plugin"] = install_ssm_plugin
+
+    results: list[TaskResult] = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(len(tasks), 1)) as executor:
+        futures = [executor.submit(run_task, name, task) for name, task in tasks.items()]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "ok" if result.error is None else f"failed: {result.error}"
+            print(f"===== {result.name} ({status}, {result.seconds:.1f}s) =====")
+            print(result.output, end="", flush=True)
+    print(f"Installed the CI tooling in {time.perf_counter() - start:.1f}s (cache: {args.cache_dir})")
+    if any(result.error is not None for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
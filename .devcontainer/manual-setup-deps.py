@@ -1,17 +1,28 @@
 import argparse
+import contextlib
 import enum
+import hashlib
 import json
 import os
 import platform
 import shutil
+import signal
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
 REPO_ROOT_DIR = Path(__file__).parent.parent.resolve()
 ENVS_CONFIG = REPO_ROOT_DIR / ".devcontainer" / "envs.json"
 UV_PYTHON_ALREADY_CONFIGURED = "UV_PYTHON" in os.environ
+# kept inside the installed environment, so deleting the environment also discards its stamp
+STAMP_FILE_NAME = ".manual-setup-deps.stamp"
+STAMP_ENV_VARS = ("UV_PYTHON", "UV_PYTHON_PREFERENCE")  # environment variables that change what gets installed
 parser = argparse.ArgumentParser(description="Manual setup for dependencies in the repo")
 _ = parser.add_argument(
     "--python-version",
@@ -38,6 +49,18 @@ _ = parser.add_argument(
 _ = parser.add_argument(
     "--skip-updating-devcontainer-hash", action="store_true", default=False, help="Do not update the devcontainer hash"
 )
+_ = parser.add_argument(
+    "--max-workers",
+    type=int,
+    default=None,
+    help="How many environments to set up at once. Defaults to all of them.",
+)
+_ = parser.add_argument(
+    "--force",
+    action="store_true",
+    default=False,
+    help="Set up every environment, even ones whose lock files, project files and tools haven't changed since they were last set up",
+)
 _ = parser.add_argument(
     "--allow-uv-to-install-python",
     action="store_true",
@@ -58,13 +81,217 @@ class EnvConfig:
         self.path = REPO_ROOT_DIR
         if "relative_directory" in json_dict:
             self.path = REPO_ROOT_DIR / json_dict["relative_directory"]
+        self.description: str = json_dict.get("description", str(self.path))
         if self.package_manager == PackageManager.UV:
             self.lock_file = self.path / "uv.lock"
+            self.stamp_inputs = [
+                self.lock_file,
+                self.path / "pyproject.toml",
+                self.path / ".python-version",
+                REPO_ROOT_DIR / ".python-version",
+            ]
+            self.install_dir = self.path / os.environ.get("UV_PROJECT_ENVIRONMENT", ".venv")
         elif self.package_manager == PackageManager.PNPM:
             self.lock_file = self.path / "pnpm-lock.yaml"
+            self.stamp_inputs = [
+                self.lock_file,
+                self.path / "package.json",
+                self.path / "pnpm-workspace.yaml",
+                self.path / ".npmrc",
+            ]
+            self.install_dir = self.path / "node_modules"
         else:
             raise NotImplementedError(f"Package manager {self.package_manager} is not supported")
 
+    @property
+    def stamp_file(self) -> Path:
+        return self.install_dir / STAMP_FILE_NAME
+
+
+class EnvStatus(str, enum.Enum):
+    OK = "ok"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    UP_TO_DATE = "up to date"
+
+
+@dataclass
+class EnvResult:
+    env: EnvConfig
+    status: EnvStatus
+    seconds: float
+    output: str
+
+
+Command = tuple[list[str], dict[str, str] | None]  # the arguments, and the environment variables to run them with
+
+
+def build_env_commands(
+    env: EnvConfig,
+    *,
+    base_uv_env: dict[str, str],
+    check_lock_file: bool,
+    optionally_check_lock: bool,
+    generate_lock_file_only: bool,
+    python_version: str | None,
+    is_windows: bool,
+) -> list[Command]:
+    commands: list[Command] = []
+    uv_env = dict(base_uv_env)  # each environment gets its own copy, since they may set different Python versions
+    if env.package_manager == PackageManager.UV and not UV_PYTHON_ALREADY_CONFIGURED:
+        if python_version is not None:
+            uv_env.update({"UV_PYTHON": python_version})
+        else:
+            python_version_path = env.lock_file.parent / ".python-version"
+            python_version_path_in_repo_root = REPO_ROOT_DIR / ".python-version"
+            if python_version_path.exists():
+                uv_env.update({"UV_PYTHON": python_version_path.read_text().strip()})
+            elif python_version_path_in_repo_root.exists():
+                uv_env.update({"UV_PYTHON": python_version_path_in_repo_root.read_text().strip()})
+
+    env_check_lock = check_lock_file
+    if optionally_check_lock and env.lock_file.exists():
+        env_check_lock = True
+    if env_check_lock or generate_lock_file_only:
+        if env.package_manager == PackageManager.UV:
+            uv_args = [
+                "uv",
+                "lock",
+            ]
+            if not generate_lock_file_only:
+                uv_args.append("--check")
+            uv_args.extend(["--directory", str(env.path)])
+            commands.append((uv_args, uv_env))
+        elif env.package_manager == PackageManager.PNPM:
+            pass  # doesn't seem to be a way to do this https://github.com/orgs/pnpm/discussions/3202
+        else:
+            raise NotImplementedError(f"Package manager {env.package_manager} does not support lock file checking")
+    if env.package_manager == PackageManager.UV:
+        sync_command = ["uv", "sync", "--directory", str(env.path)]
+        if env_check_lock:
+            sync_command.append("--frozen")
+        if not generate_lock_file_only:
+            commands.append((sync_command, uv_env))
+    elif env.package_manager == PackageManager.PNPM:
+        pnpm_command = ["pnpm", "install", "--dir", str(env.path)]
+        if env_check_lock:
+            pnpm_command.append("--frozen-lockfile")
+        if is_windows:
+            pwsh = shutil.which("pwsh") or shutil.which("powershell")
+            if not pwsh:
+                raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
+            pnpm_command = [
+                pwsh,
+                "-NoProfile",
+                "-NonInteractive",
+                "-Command",
+                " ".join(pnpm_command),
+            ]
+        commands.append((pnpm_command, None))
+    else:
+        raise NotImplementedError(f"Package manager {env.package_manager} is not supported for installation")
+    return commands
+
+
+class EnvRunner:
+    """Runs the commands for each environment, stopping everything as soon as any command fails."""
+
+    def __init__(self, *, is_windows: bool):
+        super().__init__()
+        self.is_windows = is_windows
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes: set[subprocess.Popen[str]] = set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled.set()
+            for process in self._processes:
+                if self.is_windows:
+                    process.terminate()
+                else:
+                    # pnpm and uv start processes of their own, so the whole process group gets stopped
+                    with contextlib.suppress(ProcessLookupError):
+                        os.killpg(process.pid, signal.SIGTERM)
+
+    def run_env(self, env: EnvConfig, commands: list[Command]) -> EnvResult:
+        start = time.perf_counter()
+        output: list[str] = []
+
+        def result(status: EnvStatus) -> EnvResult:
+            return EnvResult(env=env, status=status, seconds=time.perf_counter() - start, output="".join(output))
+
+        for command, command_env in commands:
+            output.append(f"$ {' '.join(command)}\n")
+            with self._lock:
+                if self.cancelled.is_set():
+                    return result(EnvStatus.CANCELLED)
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,  # interleaved just as they would be on a terminal
+                    text=True,
+                    env=command_env,
+                    start_new_session=not self.is_windows,
+                )
+                self._processes.add(process)
+            stdout, _ = process.communicate()
+            with self._lock:
+                self._processes.discard(process)
+            output.append(stdout)
+            if process.returncode != 0:
+                if self.cancelled.is_set():
+                    return result(EnvStatus.CANCELLED)
+                self.cancel()
+                return result(EnvStatus.FAILED)
+        return result(EnvStatus.OK)
+
+
+def get_tool_version(package_manager: PackageManager) -> str:
+    executable = shutil.which(package_manager.value)
+    if executable is None:
+        return "not installed"  # the setup itself will fail and report that
+    result = subprocess.run([executable, "--version"], capture_output=True, text=True, check=False)
+    return result.stdout.strip()
+
+
+def compute_env_stamp(env: EnvConfig, commands: list[Command], tool_version: str) -> str:
+    """Hash everything that determines what setting up the environment would install."""
+    inputs = {
+        "tool_version": tool_version,
+        "commands": [
+            [args, {name: command_env.get(name) for name in STAMP_ENV_VARS} if command_env is not None else None]
+            for args, command_env in commands
+        ],
+        "files": {
+            str(path): hashlib.sha256(path.read_bytes()).hexdigest() if path.is_file() else None
+            for path in env.stamp_inputs
+        },
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_stamp(env: EnvConfig) -> str | None:
+    try:
+        return env.stamp_file.read_text().strip()
+    except OSError:
+        return None
+
+
+def write_stamp(env: EnvConfig, stamp: str) -> None:
+    if not env.install_dir.is_dir():
+        return  # nothing was installed (e.g. a project without dependencies), so there's nothing to keep up to date
+    tmp_path = env.stamp_file.with_name(f"{STAMP_FILE_NAME}.tmp")
+    _ = tmp_path.write_text(stamp)
+    _ = tmp_path.replace(env.stamp_file)
+
+
+def print_summary(results: list[EnvResult], *, wall_seconds: float) -> None:
+    print("Environment setup summary:")
+    for result in results:
+        print(f"  {result.env.description:<30} {result.status.value:<10} {result.seconds:>7.1f}s")
+    print(f"  took {wall_seconds:.1f}s, vs {sum(result.seconds for result in results):.1f}s one after another")
+
 
 def main():
     args = parser.parse_args(sys.argv[1:])
@@ -81,6 +308,7 @@ def main():
     with ENVS_CONFIG.open("r") as f:
         envs = json.load(f)
 
+    planned: list[tuple[EnvConfig, list[Command]]] = []
     for env_dict in envs:
         env = EnvConfig(env_dict)
         if args.no_python and env.package_manager == PackageManager.UV:
@@ -89,75 +317,85 @@ def main():
         if args.no_node and env.package_manager == PackageManager.PNPM:
             print(f"Skipping environment {env.path} as it uses a Node package manager and --no-node is set")
             continue
-        if env.package_manager == PackageManager.UV and not UV_PYTHON_ALREADY_CONFIGURED:
-            if args.python_version is not None:
-                uv_env.update({"UV_PYTHON": args.python_version})
-            else:
-                python_version_path = env.lock_file.parent / ".python-version"
-                python_version_path_in_repo_root = REPO_ROOT_DIR / ".python-version"
-                if python_version_path.exists():
-                    uv_env.update({"UV_PYTHON": python_version_path.read_text().strip()})
-                elif python_version_path_in_repo_root.exists():
-                    uv_env.update({"UV_PYTHON": python_version_path_in_repo_root.read_text().strip()})
-
-        env_check_lock = check_lock_file
-        if args.optionally_check_lock and env.lock_file.exists():
-            env_check_lock = True
-        if env_check_lock or generate_lock_file_only:
-            if env.package_manager == PackageManager.UV:
-                uv_args = [
-                    "uv",
-                    "lock",
-                ]
-                if not generate_lock_file_only:
-                    uv_args.append("--check")
-                uv_args.extend(["--directory", str(env.path)])
-                _ = subprocess.run(uv_args, check=True, env=uv_env)
-            elif env.package_manager == PackageManager.PNPM:
-                pass  # doesn't seem to be a way to do this https://github.com/orgs/pnpm/discussions/3202
-            else:
-                raise NotImplementedError(f"Package manager {env.package_manager} does not support lock file checking")
-        if env.package_manager == PackageManager.UV:
-            sync_command = ["uv", "sync", "--directory", str(env.path)]
-            if env_check_lock:
-                sync_command.append("--frozen")
-            if not generate_lock_file_only:
-                _ = subprocess.run(
-                    sync_command,
-                    check=True,
-                    env=uv_env,
-                )
-        elif env.package_manager == PackageManager.PNPM:
-            pnpm_command = ["pnpm", "install", "--dir", str(env.path)]
-            if env_check_lock:
-                pnpm_command.append("--frozen-lockfile")
-            if is_windows:
-                pwsh = shutil.which("pwsh") or shutil.which("powershell")
-                if not pwsh:
-                    raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
-                pnpm_command = [
-                    pwsh,
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    " ".join(pnpm_command),
-                ]
-            _ = subprocess.run(
-                pnpm_command,
-                check=True,
+        planned.append(
+            (
+                env,
+                build_env_commands(
+                    env,
+                    base_uv_env=uv_env,
+                    check_lock_file=check_lock_file,
+                    optionally_check_lock=args.optionally_check_lock,
+                    generate_lock_file_only=generate_lock_file_only,
+                    python_version=args.python_version,
+                    is_windows=is_windows,
+                ),
             )
-        else:
-            raise NotImplementedError(f"Package manager {env.package_manager} is not supported for installation")
-    if args.skip_updating_devcontainer_hash:
-        return
-    result = subprocess.run(  # update the devcontainer hash after changing lock files
-        [sys.executable, ".github/workflows/hash_git_files.py", ".", "--for-devcontainer-config-update", "--exit-zero"],
+        )
+
+    results: list[EnvResult] = []
+    # only creating the lock files doesn't install anything, so there's nothing for a stamp to vouch for
+    use_stamps = not generate_lock_file_only
+    tool_versions = (
+        {manager: get_tool_version(manager) for manager in {env.package_manager for env, _ in planned}}
+        if use_stamps
+        else {}
+    )
+    if use_stamps and not args.force:
+        to_run: list[tuple[EnvConfig, list[Command]]] = []
+        for env, commands in planned:
+            if read_stamp(env) == compute_env_stamp(env, commands, tool_versions[env.package_manager]):
+                results.append(EnvResult(env=env, status=EnvStatus.UP_TO_DATE, seconds=0, output=""))
+            else:
+                to_run.append((env, commands))
+        planned = to_run
+    commands_by_path = {env.path: commands for env, commands in planned}
+
+    # the environments don't depend on each other, so setup only takes as long as the slowest one
+    runner = EnvRunner(is_windows=is_windows)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_workers or max(len(planned), 1)) as executor:
+        futures = [executor.submit(runner.run_env, env, commands) for env, commands in planned]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result.status == EnvStatus.OK and use_stamps:
+                    # computed afresh, since syncing without --frozen can itself update the lock file
+                    write_stamp(
+                        result.env,
+                        compute_env_stamp(
+                            result.env,
+                            commands_by_path[result.env.path],
+                            tool_versions[result.env.package_manager],
+                        ),
+                    )
+                # each environment's output is printed in one piece, rather than interleaved with the others
+                print(f"===== {result.env.description} ({result.status.value}, {result.seconds:.1f}s) =====")
+                print(result.output, end="", flush=True)
+        # e.g. Ctrl+C, which the commands don't receive themselves since they're in their own sessions
+        except BaseException:
+            runner.cancel()
+            raise
+    print_summary(results, wall_seconds=time.perf_counter() - start)
+    if any(result.status not in (EnvStatus.OK, EnvStatus.UP_TO_DATE) for result in results):
+        sys.exit(1)
+    if args.skip_updating_devcontainer_hash or not planned:
+        return  # when every environment was already up to date, no lock file can have changed
+    hash_result = subprocess.run(  # update the devcontainer hash after changing lock files
+        [
+            sys.executable,
+            ".github/workflows/hash_git_files.py",
+            ".",
+            "--for-devcontainer-config-update",
+            "--use-git-index",
+            "--exit-zero",
+        ],
         capture_output=True,
         text=True,
         check=True,
         cwd=REPO_ROOT_DIR,
     )
-    print(result.stdout)
+    print(hash_result.stdout)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,16 @@
 """Used typically to calculate if all the files in the context of building a Docker image have changed or not."""
 
 import argparse
+import functools
+import json
+import re
 import subprocess
 import sys
 import zlib
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import IO
 
 DEVCONTAINER_COMMENT_LINE_PREFIX = (
     "  // Devcontainer context hash (do not manually edit this, it's managed by a pre-commit hook): "
@@ -14,6 +20,13 @@ DEVCONTAINER_COMMENT_LINE_SUFFIX = (
     " # spellchecker:disable-line"  # the typos hook can sometimes mess with the hash without this
 )
 
+# which tracked files make up the devcontainer context, relative to the repository root
+DEVCONTAINER_CONTEXT_RULES_PATH = Path(".devcontainer") / "context-rules.json"
+
+GIT_OUTPUT_READ_SIZE = 64 * 1024
+PARALLEL_READ_SIZE = 1024 * 1024
+ADLER32_MODULUS = 65521
+
 
 def get_tracked_files(repo_path: Path) -> list[str]:
     """Return a list of files tracked by Git in the given repository folder, using the 'git ls-files' command."""
@@ -31,19 +44,107 @@ def get_tracked_files(repo_path: Path) -> list[str]:
         sys.exit(1)
 
 
-def filter_files_for_devcontainer_context(files: list[str]) -> tuple[list[str], Path]:
-    devcontainer_context: list[str] = []
-    devcontainer_json_file_path: str | None = None
-    for file in files:
-        if file.startswith(".devcontainer/"):
-            if file.endswith("devcontainer.json"):
-                devcontainer_json_file_path = file
-                continue
-            devcontainer_context.append(file)
-        elif file.endswith((".lock", "pnpm-lock.yaml", "hash_git_files.py")) or file == ".pre-commit-config.yaml":
-            devcontainer_context.append(file)
-    if devcontainer_json_file_path is None:
-        raise ValueError("No devcontainer.json file found in the tracked files.")  # noqa: TRY003 # not worth a custom exception for this
+def _iter_nul_delimited(stream: IO[bytes]) -> Iterator[bytes]:
+    """Yield each NUL-terminated record from the stream without buffering the whole output in memory."""
+    remainder = b""
+    while chunk := stream.read(GIT_OUTPUT_READ_SIZE):
+        records = (remainder + chunk).split(b"\0")
+        remainder = records.pop()
+        yield from records
+    if remainder:
+        yield remainder
+
+
+def get_index_object_ids(repo_path: Path) -> dict[str, str]:
+    """Return the blob object ID that Git's index holds for each tracked file, using 'git ls-files -s -z'.
+
+    Git already hashed the contents of every file when it was staged, so this avoids reading any file contents.
+    """
+    object_ids: dict[str, str] = {}
+    with subprocess.Popen(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+        ["git", "-C", str(repo_path), "ls-files", "-s", "-z"],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        stdout=subprocess.PIPE,
+    ) as process:
+        assert process.stdout is not None, "stdout was set to a pipe"
+        for record in _iter_nul_delimited(process.stdout):
+            # each record is "<mode> <object id> <stage>\t<path>"
+            metadata, path = record.decode("utf-8").split("\t", 1)
+            object_ids[path] = metadata.split(" ")[1]
+    if process.returncode != 0:
+        print("Error: The directory does not appear to be a Git repository or Git is not installed.", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        sys.exit(1)
+    return object_ids
+
+
+def get_unstaged_files(repo_path: Path) -> set[str]:
+    """Return the tracked files whose working tree contents differ from the index."""
+    result = subprocess.run(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+        ["git", "-C", str(repo_path), "ls-files", "--modified", "-z"],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        capture_output=True,
+        check=True,
+    )
+    return {path.decode("utf-8") for path in result.stdout.split(b"\0") if path}
+
+
+def hash_working_tree_files(repo_path: Path, files: list[str]) -> dict[str, str]:
+    """Compute the object ID Git would give the current working tree contents of each file, if it were staged."""
+    if not files:
+        return {}
+    result = subprocess.run(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+        ["git", "-C", str(repo_path), "hash-object", "--stdin-paths"],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        input="\n".join(files),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return dict(zip(files, result.stdout.splitlines(), strict=True))
+
+
+def get_staged_files(repo_path: Path) -> list[str]:
+    """Return the files with changes staged in Git's index, including ones staged for deletion."""
+    result = subprocess.run(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+        ["git", "-C", str(repo_path), "diff", "--cached", "--name-only", "--no-renames", "-z"],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        capture_output=True,
+        check=True,
+    )
+    return [path.decode("utf-8") for path in result.stdout.split(b"\0") if path]
+
+
+def load_devcontainer_context_rules(repo_path: Path) -> tuple[re.Pattern[str], str]:
+    """Compile the context rules into a single pattern matching every path in the context, one path per line.
+
+    Returns the pattern and the path of the devcontainer.json file the hash is kept in.
+    """
+    rules_path = repo_path / DEVCONTAINER_CONTEXT_RULES_PATH
+    try:
+        rules = json.loads(rules_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"Error reading the devcontainer context rules in {rules_path}: {e}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        sys.exit(1)
+    alternatives = [
+        *(f"{re.escape(prefix)}.*" for prefix in rules.get("prefixes", [])),
+        *(f".*{re.escape(suffix)}" for suffix in rules.get("suffixes", [])),
+        *(re.escape(path) for path in rules.get("paths", [])),
+    ]
+    return re.compile(f"^(?:{'|'.join(alternatives)})$", re.MULTILINE), rules["devcontainer_json"]
+
+
+def staged_files_are_unrelated(repo_path: Path, context_pattern: re.Pattern[str]) -> bool:
+    """Return whether changes are staged, but none of them are to files in the devcontainer context."""
+    staged_files = get_staged_files(repo_path)
+    # when nothing is staged (e.g. `pre-commit run --all-files`), there's nothing to go by, so they count as related
+    return bool(staged_files) and context_pattern.search("\n".join(staged_files)) is None
+
+
+def filter_files_for_devcontainer_context(
+    files: list[str], context_pattern: re.Pattern[str], devcontainer_json_file_path: str
+) -> tuple[list[str], Path]:
+    # matching all the paths as a single newline-joined string keeps the whole scan inside the regex engine
+    matched = context_pattern.findall("\n".join(files))
+    if devcontainer_json_file_path not in files:
+        raise ValueError(f"{devcontainer_json_file_path} was not found in the tracked files.")  # noqa: TRY003 # not worth a custom exception for this
+    # the hash is stored in the devcontainer.json file, so it can't be part of what's hashed
+    devcontainer_context = [file for file in matched if file != devcontainer_json_file_path]
     return devcontainer_context, Path(devcontainer_json_file_path)
 
 
@@ -72,6 +173,67 @@ def compute_adler32(repo_path: Path, files: list[str]) -> int:
     return checksum
 
 
+def adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+    """Combine two Adler-32 checksums into the checksum of their concatenated data, like zlib's adler32_combine.
+
+    `adler2` must have been computed starting from the default value of 1 over `length2` bytes.
+    """
+    remainder = length2 % ADLER32_MODULUS
+    low1, high1 = adler1 & 0xFFFF, adler1 >> 16
+    low2, high2 = adler2 & 0xFFFF, adler2 >> 16
+    low = (low1 + low2 - 1) % ADLER32_MODULUS
+    high = (remainder * low1 + high1 + high2 - remainder) % ADLER32_MODULUS
+    return (high << 16) | low
+
+
+def _adler32_of_file(repo_path: Path, file: str) -> tuple[int, int]:
+    """Return the Adler-32 checksum and length of the file's name followed by its contents."""
+    name = file.encode("utf-8")
+    checksum = zlib.adler32(name)
+    length = len(name)
+    try:
+        with (repo_path / file).open("rb") as f:
+            while chunk := f.read(PARALLEL_READ_SIZE):
+                checksum = zlib.adler32(chunk, checksum)
+                length += len(chunk)
+    except IsADirectoryError:
+        # Ignore symlinks that on windows sometimes get confused as being directories
+        pass
+    return checksum, length
+
+
+def compute_adler32_parallel(repo_path: Path, files: list[str], max_workers: int | None = None) -> int:
+    """Compute the same checksum as compute_adler32, but checksum each file on a worker thread.
+
+    zlib releases the GIL while checksumming large buffers, and Adler-32 checksums of consecutive pieces of data can be combined afterwards, so the per-file results are folded together in sorted order.
+    """
+    sorted_files = sorted(files)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        file_checksums = executor.map(functools.partial(_adler32_of_file, repo_path), sorted_files)
+        checksum = 1  # Adler-32 default starting value
+        for file_checksum, length in file_checksums:
+            checksum = adler32_combine(checksum, file_checksum, length)
+    return checksum
+
+
+def compute_adler32_from_git_index(repo_path: Path, files: list[str], object_ids: dict[str, str]) -> int:
+    """Compute an overall Adler-32 checksum of the provided files from their Git object IDs instead of their contents.
+
+    Only files with unstaged modifications get read, so that the checksum still reflects the working tree. Files are processed in sorted order to ensure consistent ordering.
+    """
+    files_to_rehash = sorted(
+        file for file in get_unstaged_files(repo_path).intersection(files) if (repo_path / file).is_file()
+    )
+    current_object_ids = object_ids | hash_working_tree_files(repo_path, files_to_rehash)
+    checksum = 1  # Adler-32 default starting value
+
+    for file in sorted(files):
+        checksum = zlib.adler32(file.encode("utf-8"), checksum)
+        checksum = zlib.adler32(current_object_ids[file].encode("utf-8"), checksum)
+
+    return checksum
+
+
 def find_devcontainer_hash_line(lines: list[str]) -> tuple[int, str | None]:
     """Find the line index and current hash in the devcontainer.json file."""
     for i in reversed(range(len(lines))):
@@ -136,6 +298,21 @@ def main():
         help="Update the hash in the devcontainer.json file based on all files relevant to devcontainer context",
     )
     _ = parser.add_argument("--exit-zero", action="store_true", help="Exit with code 0 even if the hash changes")
+    _ = parser.add_argument(
+        "--use-git-index",
+        action="store_true",
+        help="Build the hash from the object IDs in Git's index rather than reading every file (produces a different hash than the default mode)",
+    )
+    _ = parser.add_argument(
+        "--skip-if-staged-files-unrelated",
+        action="store_true",
+        help="With --for-devcontainer-config-update, exit straight away leaving the existing hash in place when changes are staged but none of them are to the devcontainer context (for use in a pre-commit hook)",
+    )
+    _ = parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Read and checksum files on a pool of worker threads (produces the same hash as the default mode)",
+    )
     args = parser.parse_args()
 
     repo_path = args.folder
@@ -143,11 +320,25 @@ def main():
         print(f"Error: {repo_path} is not a valid directory.", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
         sys.exit(1)
 
+    context_pattern: re.Pattern[str] | None = None
+    devcontainer_json_file_path = ""
+    if args.for_devcontainer_config_update:
+        context_pattern, devcontainer_json_file_path = load_devcontainer_context_rules(repo_path)
+        if args.skip_if_staged_files_unrelated and staged_files_are_unrelated(repo_path, context_pattern):
+            sys.exit(0)
+
     # Retrieve the list of Git-tracked files.
-    files = get_tracked_files(repo_path)
+    object_ids: dict[str, str] = {}
+    if args.use_git_index:
+        object_ids = get_index_object_ids(repo_path)
+        files = list(object_ids)
+    else:
+        files = get_tracked_files(repo_path)
     devcontainer_json_file: Path | None = None
-    if args.for_devcontainer_config_update:
-        files, devcontainer_json_file = filter_files_for_devcontainer_context(files)
+    if context_pattern is not None:
+        files, devcontainer_json_file = filter_files_for_devcontainer_context(
+            files, context_pattern, devcontainer_json_file_path
+        )
 
     # If the debug flag is specified, print out all discovered files.
     if args.debug:
@@ -156,7 +347,12 @@ def main():
             print(file)  # noqa: T201 # this just runs as a simple script, so using print instead of log
 
     # Compute the overall Adler-32 checksum.
-    overall_checksum = compute_adler32(repo_path, files)
+    if args.use_git_index:
+        overall_checksum = compute_adler32_from_git_index(repo_path, files, object_ids)
+    elif args.parallel:
+        overall_checksum = compute_adler32_parallel(repo_path, files)
+    else:
+        overall_checksum = compute_adler32(repo_path, files)
     overall_checksum_str = f"{overall_checksum:08x}"  # Format the checksum as an 8-digit hexadecimal value.
     if args.for_devcontainer_config_update:
         assert devcontainer_json_file is not None, (
@@ -0,0 +1,48 @@
+import json
+import logging
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ManifestEntry:
+    source_hash: str
+    size: int
+    content_type: str
+    mtime_ns: int  # not part of what gets uploaded, but lets unchanged files be detected without reading them
+
+
+def load_manifest(manifest_path: Path) -> dict[str, ManifestEntry]:
+    """Load the manifest written by the last successful deploy, keyed by S3 key.
+
+    A missing, unreadable, or outdated manifest is treated as empty, which just means every file gets hashed again.
+    """
+    if not manifest_path.exists():
+        return {}
+    try:
+        raw: dict[str, Any] = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if raw.get("version") != MANIFEST_VERSION:
+            logger.info(f"Ignoring asset manifest {manifest_path} written with a different version")
+            return {}
+        return {key: ManifestEntry(**entry) for key, entry in raw["entries"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring unreadable asset manifest {manifest_path}", exc_info=True)
+        return {}
+
+
+def save_manifest(manifest_path: Path, entries: dict[str, ManifestEntry]) -> None:
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": MANIFEST_VERSION,
+        "entries": {key: asdict(entry) for key, entry in sorted(entries.items())},
+    }
+    # write to a temporary file first so that an interrupted deploy never leaves a half-written manifest behind
+    tmp_path = manifest_path.with_suffix(f"{manifest_path.suffix}.tmp")
+    _ = tmp_path.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+    _ = tmp_path.replace(manifest_path)
@@ -0,0 +1,110 @@
+import logging
+import os
+from collections.abc import Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+from .asset_manifest import ManifestEntry
+from .content_types import guess_content_type
+from .file_hashing import hash_files
+from .hash_cache import HashCache
+from .instrumentation import phase
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class AssetRecord:
+    key: str  # the S3 key, which is the path relative to the scanned directory using forward slashes
+    path: Path
+    size: int
+    mtime_ns: int
+    digest: str
+    content_type: str
+
+    def to_manifest_entry(self) -> ManifestEntry:
+        return ManifestEntry(
+            source_hash=self.digest, size=self.size, content_type=self.content_type, mtime_ns=self.mtime_ns
+        )
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class AssetSnapshot:
+    base_dir: Path
+    records: tuple[AssetRecord, ...]  # sorted by key
+    bytes_read: int  # how much file content actually had to be read to produce this snapshot
+
+
+def _iter_files(base_dir: Path) -> list[tuple[str, os.DirEntry[str]]]:
+    files: list[tuple[str, os.DirEntry[str]]] = []
+    pending: list[tuple[str, str]] = [("", str(base_dir))]
+    while pending:
+        key_prefix, dir_path = pending.pop()
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():  # matching os.walk, symlinked directories are not followed
+                        pending.append((f"{key_prefix}{entry.name}/", entry.path))
+                else:
+                    files.append((f"{key_prefix}{entry.name}", entry))
+    return files
+
+
+def scan_assets(
+    base_dir: Path,
+    *,
+    known_entries: Mapping[str, ManifestEntry],
+    hash_cache: HashCache | None = None,
+    max_workers: int | None = None,
+) -> AssetSnapshot:
+    """Walk the directory once and record everything needed to upload and fingerprint each file.
+
+    Files whose size and modification time match their entry in `known_entries` reuse that entry's digest instead of
+    being read again, as do files found in the `hash_cache`. All other files are hashed concurrently. Content types come
+    from the file extension, and are only sniffed from the content of files without one.
+    """
+    stats: dict[str, tuple[Path, os.stat_result]] = {}
+    reused: dict[str, ManifestEntry] = {}
+    digests: dict[str, str] = {}
+    with phase("walk") as span:
+        for key, entry in _iter_files(base_dir):
+            path = Path(entry.path)
+            file_stat = entry.stat()
+            stats[key] = (path, file_stat)
+            known = known_entries.get(key)
+            if known is not None and known.size == file_stat.st_size and known.mtime_ns == file_stat.st_mtime_ns:
+                reused[key] = known
+            elif hash_cache is not None and (cached_digest := hash_cache.get(path, file_stat)) is not None:
+                digests[key] = cached_digest
+        span.set(files=len(stats), reused=len(reused), cached=len(digests))
+
+    keys_to_hash = [key for key in stats if key not in reused and key not in digests]
+    bytes_read = sum(stats[key][1].st_size for key in keys_to_hash)
+    with phase("hash", files=len(keys_to_hash), bytes=bytes_read):
+        for key, digest in zip(
+            keys_to_hash, hash_files([stats[key][0] for key in keys_to_hash], max_workers=max_workers), strict=True
+        ):
+            digests[key] = digest
+            if hash_cache is not None:
+                hash_cache.put(*stats[key], digest)
+
+    records: list[AssetRecord] = []
+    with phase("content_types", files=len(stats)):
+        for key, (path, file_stat) in sorted(stats.items()):
+            known = reused.get(key)
+            records.append(
+                AssetRecord(
+                    key=key,
+                    path=path,
+                    size=file_stat.st_size,
+                    mtime_ns=file_stat.st_mtime_ns,
+                    digest=digests[key] if known is None else known.source_hash,
+                    # an extension lookup is cheap enough to redo every time, which also picks up changes to the
+                    # registry, so only types that had to be sniffed from the file's content are reused
+                    content_type=known.content_type
+                    if known is not None and not path.suffix
+                    else guess_content_type(path),
+                )
+            )
+    logger.info(f"Scanned {len(records)} assets in {base_dir}, reading {bytes_read} bytes")
+    return AssetSnapshot(base_dir=base_dir, records=tuple(records), bytes_read=bytes_read)
@@ -0,0 +1,381 @@
+"""Benchmarks of the deploy pipeline against synthetic static sites, runnable entirely offline.
+
+Record a baseline, then compare later runs against it:
+`uv --directory=./infrastructure run python -m infrastructure.benchmark run --output baseline.json`
+`uv --directory=./infrastructure run python -m infrastructure.benchmark run --output current.json --baseline baseline.json`
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from datetime import UTC
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+from typing import override
+
+import pulumi
+
+from . import program
+from .asset_scanner import AssetSnapshot
+from .asset_scanner import scan_assets
+from .jinja_constants import APP_DIRECTORY_NAME
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_RESULTS_VERSION = 1
+REPO_ROOT = Path(__file__).parent.parent.parent.parent
+HASH_GIT_FILES_SCRIPT = REPO_ROOT / ".github" / "workflows" / "hash_git_files.py"
+DEFAULT_FILE_COUNTS = (1_000, 10_000, 100_000)
+DEFAULT_MEDIA_FILE_COUNT = 2
+DEFAULT_MEDIA_FILE_SIZE_MB = 256
+TEXT_FILE_EXTENSIONS = ("html", "js", "css", "json", "svg", "txt")
+MEDIA_FILE_EXTENSIONS = ("mp4", "jpg", "png")
+MEDIA_WRITE_BLOCK_SIZE = 1024 * 1024
+# registering resources slows down quadratically with their count, since every Output the Pulumi SDK creates is removed
+# from a global deque once it resolves, so resource construction is only measured on sites up to this size by default
+DEFAULT_MAX_RESOURCE_FILE_COUNT = 2_000
+FILES_PER_DIRECTORY = 200  # roughly how Vite and Nuxt spread a large site across directories
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+# differences smaller than these are within the run-to-run noise, however large they are relatively
+MIN_WALL_TIME_REGRESSION_SECONDS = 0.05
+MIN_PEAK_RSS_REGRESSION_BYTES = 16 * 1024 * 1024
+MIN_READ_REGRESSION_BYTES = (
+    64 * 1024
+)  # reading /proc/self/io itself, and lazy imports, account for a few bytes per phase
+_PROC_SELF_IO = Path("/proc/self/io")
+_PROC_SELF_STATUS = Path("/proc/self/status")
+_PROC_SELF_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class PhaseResult:
+    file_count: int
+    phase: str
+    wall_time_seconds: float
+    peak_rss_bytes: int
+    read_bytes: int | None  # None where the platform doesn't report it
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return self.file_count, self.phase
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Regression:
+    file_count: int
+    phase: str
+    metric: str
+    baseline: float
+    current: float
+
+
+def _read_bytes_so_far() -> int | None:
+    # rchar counts every byte returned by read() calls, whether or not it came from the page cache, which is what
+    # matters here since the pipeline usually runs on files that were just written
+    try:
+        for line in _PROC_SELF_IO.read_text().splitlines():
+            name, value = line.split(":", 1)
+            if name == "rchar":
+                return int(value)
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        _ = _PROC_SELF_CLEAR_REFS.write_text("5")  # resets VmHWM to the current RSS, on Linux
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_bytes(*, since_reset: bool) -> int:
+    if since_reset:
+        for line in _PROC_SELF_STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    # otherwise fall back to the peak of the whole process, which can only show phases that raise the high-water mark
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@contextmanager
+def _measure(results: list[PhaseResult], *, file_count: int, phase: str) -> Iterator[None]:
+    is_reset = _reset_peak_rss()
+    read_before = _read_bytes_so_far()
+    start = time.perf_counter()
+    yield
+    wall_time_seconds = time.perf_counter() - start
+    read_after = _read_bytes_so_far()
+    result = PhaseResult(
+        file_count=file_count,
+        phase=phase,
+        wall_time_seconds=wall_time_seconds,
+        peak_rss_bytes=_peak_rss_bytes(since_reset=is_reset),
+        read_bytes=None if read_before is None or read_after is None else read_after - read_before,
+    )
+    logger.info(
+        f"{file_count} files, {phase}: {result.wall_time_seconds:.3f}s, peak RSS {result.peak_rss_bytes} bytes, read {result.read_bytes} bytes"
+    )
+    results.append(result)
+
+
+def generate_site(
+    site_dir: Path, *, file_count: int, media_file_count: int, media_file_size: int, seed: int = 0
+) -> None:
+    """Write a synthetic static site of mostly small text files, plus a few large media files."""
+    rng = random.Random(seed)  # noqa: S311 # reproducible filler content, nothing to do with security
+    text_file_count = max(file_count - media_file_count, 0)
+    for index in range(text_file_count):
+        extension = TEXT_FILE_EXTENSIONS[index % len(TEXT_FILE_EXTENSIONS)]
+        directory = site_dir / ("_nuxt" if extension in ("js", "css") else "pages") / f"d{index // FILES_PER_DIRECTORY}"
+        directory.mkdir(parents=True, exist_ok=True)
+        _ = (directory / f"file{index}.{extension}").write_bytes(rng.randbytes(rng.randint(200, 50_000)))
+    media_dir = site_dir / "media"
+    media_dir.mkdir(parents=True, exist_ok=True)
+    # writing a single random block repeatedly is far quicker than generating hundreds of MB of random data, and makes no
+    # difference to how long the files take to read and hash
+    block = rng.randbytes(MEDIA_WRITE_BLOCK_SIZE)
+    for index in range(media_file_count):
+        extension = MEDIA_FILE_EXTENSIONS[index % len(MEDIA_FILE_EXTENSIONS)]
+        with (media_dir / f"media{index}.{extension}").open("wb") as file:
+            remaining = media_file_size
+            while remaining > 0:
+                _ = file.write(block[:remaining])
+                remaining -= MEDIA_WRITE_BLOCK_SIZE
+
+
+class _Mocks(pulumi.runtime.Mocks):
+    @override
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs) -> tuple[str, dict[str, Any]]:
+        inputs: dict[str, Any] = args.inputs  # pyright: ignore[reportUnknownMemberType,reportUnknownVariableType] # the inputs are untyped in the Pulumi SDK
+        return f"{args.name}_id", inputs
+
+    @override
+    def call(self, args: pulumi.runtime.MockCallArgs) -> tuple[dict[str, Any], list[tuple[str, str]] | None]:
+        _ = args
+        return {}, None
+
+
+def _register_upload_resources(snapshot: AssetSnapshot, *, manifest_path: Path, root_dir: Path) -> None:
+    @pulumi.runtime.test  # pyright: ignore[reportUnknownMemberType] # the decorator is untyped in the Pulumi SDK
+    def register() -> pulumi.Output[list[str]]:
+        uploaded_assets = program.upload_assets_to_s3(
+            bucket_id=pulumi.Output.from_input("benchmark-bucket"),
+            snapshot=snapshot,
+            previous_manifest={},
+            manifest_path=manifest_path,
+            compressed_variants={},
+            root_dir=root_dir,
+        )
+        # returning every ID makes the decorator wait until the mocks have registered all the resources
+        return pulumi.Output.all(*[upload.id for upload in uploaded_assets.resources])
+
+    _ = register()
+
+
+def _load_hash_git_files() -> ModuleType:
+    # the script lives with the workflows that run it, rather than in an importable package
+    spec = importlib.util.spec_from_file_location("hash_git_files", HASH_GIT_FILES_SCRIPT)
+    assert spec is not None, f"Could not load {HASH_GIT_FILES_SCRIPT}"
+    assert spec.loader is not None, f"Could not load {HASH_GIT_FILES_SCRIPT}"
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run_phases(work_dir: Path, *, file_count: int, max_resource_file_count: int, results: list[PhaseResult]) -> None:
+    site_dir = work_dir / APP_DIRECTORY_NAME / ".output" / "public"
+    hash_git_files = _load_hash_git_files()
+    compute_adler32: Callable[[Path, list[str]], int] = hash_git_files.compute_adler32
+    compute_adler32_parallel: Callable[[Path, list[str]], int] = hash_git_files.compute_adler32_parallel
+
+    with _measure(results, file_count=file_count, phase="scan_cold"):
+        snapshot = scan_assets(site_dir, known_entries={})
+    with _measure(results, file_count=file_count, phase="directory_hash"):
+        _ = program.compute_directory_hash(snapshot)
+    known_entries = {record.key: record.to_manifest_entry() for record in snapshot.records}
+    with _measure(results, file_count=file_count, phase="scan_warm"):
+        _ = scan_assets(site_dir, known_entries=known_entries)
+    if file_count <= max_resource_file_count:
+        with _measure(results, file_count=file_count, phase="upload_resources"):
+            _register_upload_resources(snapshot, manifest_path=work_dir / "asset-manifest.json", root_dir=work_dir)
+    else:
+        logger.warning(
+            f"Skipping upload_resources for {file_count} files, above the limit of {max_resource_file_count} (raise it with --max-resource-file-count)"
+        )
+    keys = [record.key for record in snapshot.records]
+    with _measure(results, file_count=file_count, phase="adler32"):
+        _ = compute_adler32(site_dir, keys)
+    with _measure(results, file_count=file_count, phase="adler32_parallel"):
+        _ = compute_adler32_parallel(site_dir, keys)
+
+
+def run_benchmarks(
+    *,
+    file_counts: Sequence[int],
+    media_file_count: int,
+    media_file_size: int,
+    max_resource_file_count: int = DEFAULT_MAX_RESOURCE_FILE_COUNT,
+    work_dir: Path | None = None,
+) -> list[PhaseResult]:
+    """Generate a synthetic site of each size and measure every phase of the deploy pipeline against it."""
+    pulumi.runtime.set_mocks(_Mocks(), project="benchmark", stack="benchmark", preview=False)
+    pulumi.runtime.set_all_config(
+        {
+            "proj:git_repository_url": "https://example.com/benchmark.git",
+            "proj:pulumi_project_name": "benchmark",
+            "proj:github_repo_name": "benchmark",
+            "proj:env": "benchmark",
+        }
+    )
+    results: list[PhaseResult] = []
+    for file_count in file_counts:
+        with tempfile.TemporaryDirectory(dir=work_dir, prefix="deploy-benchmark-") as tmp_dir:
+            logger.info(f"Generating a synthetic site of {file_count} files in {tmp_dir}")
+            generate_site(
+                Path(tmp_dir) / APP_DIRECTORY_NAME / ".output" / "public",
+                file_count=file_count,
+                media_file_count=media_file_count,
+                media_file_size=media_file_size,
+            )
+            _run_phases(
+                Path(tmp_dir),
+                file_count=file_count,
+                max_resource_file_count=max_resource_file_count,
+                results=results,
+            )
+    return results
+
+
+def save_results(path: Path, results: Sequence[PhaseResult], *, max_resource_file_count: int) -> None:
+    _ = path.write_text(
+        json.dumps(
+            {
+                "version": BENCHMARK_RESULTS_VERSION,
+                "created_at": datetime.now(tz=UTC).isoformat(),
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                # sites larger than this have no upload_resources result, rather than one that's comparable to a deploy
+                "max_resource_file_count": max_resource_file_count,
+                "results": [asdict(result) for result in results],
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+
+def load_results(path: Path) -> list[PhaseResult]:
+    raw: dict[str, Any] = json.loads(path.read_text(encoding="utf-8"))
+    if raw.get("version") != BENCHMARK_RESULTS_VERSION:
+        raise ValueError(f"{path} holds results in an unsupported format version {raw.get('version')}")  # noqa: TRY003 # not worth a custom exception for this
+    return [PhaseResult(**result) for result in raw["results"]]
+
+
+def find_regressions(
+    baseline: Sequence[PhaseResult],
+    current: Sequence[PhaseResult],
+    *,
+    threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+) -> list[Regression]:
+    """Return every metric that got worse by more than the threshold, for phases measured in both runs."""
+    baseline_by_key = {result.key: result for result in baseline}
+    regressions: list[Regression] = []
+    for result in current:
+        previous = baseline_by_key.get(result.key)
+        if previous is None:
+            continue
+        metrics: list[tuple[str, float, float, float]] = [
+            (
+                "wall_time_seconds",
+                previous.wall_time_seconds,
+                result.wall_time_seconds,
+                MIN_WALL_TIME_REGRESSION_SECONDS,
+            ),
+            ("peak_rss_bytes", previous.peak_rss_bytes, result.peak_rss_bytes, MIN_PEAK_RSS_REGRESSION_BYTES),
+        ]
+        if previous.read_bytes is not None and result.read_bytes is not None:
+            metrics.append(("read_bytes", previous.read_bytes, result.read_bytes, MIN_READ_REGRESSION_BYTES))
+        regressions.extend(
+            Regression(
+                file_count=result.file_count,
+                phase=result.phase,
+                metric=metric,
+                baseline=baseline_value,
+                current=current_value,
+            )
+            for metric, baseline_value, current_value, min_difference in metrics
+            if current_value > baseline_value * (1 + threshold) and current_value - baseline_value >= min_difference
+        )
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the deploy pipeline against synthetic static sites.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the results")
+    _ = run_parser.add_argument("--file-counts", type=int, nargs="+", default=list(DEFAULT_FILE_COUNTS))
+    _ = run_parser.add_argument("--media-file-count", type=int, default=DEFAULT_MEDIA_FILE_COUNT)
+    _ = run_parser.add_argument("--media-file-size-mb", type=int, default=DEFAULT_MEDIA_FILE_SIZE_MB)
+    _ = run_parser.add_argument(
+        "--max-resource-file-count",
+        type=int,
+        default=DEFAULT_MAX_RESOURCE_FILE_COUNT,
+        help="Only measure resource construction on sites up to this many files",
+    )
+    _ = run_parser.add_argument("--work-dir", type=Path, default=None, help="Where to generate the synthetic sites")
+    _ = run_parser.add_argument("--output", type=Path, required=True, help="Where to save the results as JSON")
+    _ = run_parser.add_argument("--baseline", type=Path, default=None, help="Results to compare this run against")
+    _ = run_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    compare_parser = subparsers.add_parser("compare", help="Compare two saved sets of results")
+    _ = compare_parser.add_argument("baseline", type=Path)
+    _ = compare_parser.add_argument("current", type=Path)
+    _ = compare_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "run":
+        current = run_benchmarks(
+            file_counts=args.file_counts,
+            media_file_count=args.media_file_count,
+            media_file_size=args.media_file_size_mb * 1024 * 1024,
+            max_resource_file_count=args.max_resource_file_count,
+            work_dir=args.work_dir,
+        )
+        save_results(args.output, current, max_resource_file_count=args.max_resource_file_count)
+        if args.baseline is None:
+            return 0
+        baseline = load_results(args.baseline)
+    else:
+        baseline = load_results(args.baseline)
+        current = load_results(args.current)
+
+    regressions = find_regressions(baseline, current, threshold=args.threshold)
+    for regression in regressions:
+        logger.error(
+            f"Regression in {regression.phase} for {regression.file_count} files: {regression.metric} went from {regression.baseline} to {regression.current}"
+        )
+    if not regressions:
+        logger.info("No regressions found")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import fnmatch
+import re
+from collections.abc import Iterable
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# how long CloudFront keeps the files browsers revalidate on every use, since each deploy invalidates the ones it changes
+EDGE_REVALIDATE_MAX_AGE = 300
+REVALIDATE_CACHE_CONTROL = f"public, max-age=0, s-maxage={EDGE_REVALIDATE_MAX_AGE}, must-revalidate"
+MEDIA_CACHE_CONTROL = "public, max-age=604800"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CacheRule:
+    pattern: str  # case-insensitive glob matched against the whole S3 key, where `*` also matches across `/`
+    cache_control: str
+
+
+# The first matching rule wins
+CACHE_RULES: tuple[CacheRule, ...] = (
+    # the build manifests are rewritten in place on every build, unlike everything else Vite puts in _nuxt
+    CacheRule(pattern="_nuxt/builds/*", cache_control=REVALIDATE_CACHE_CONTROL),
+    # every other file in _nuxt has a content hash in its name
+    CacheRule(pattern="_nuxt/*", cache_control=IMMUTABLE_CACHE_CONTROL),
+    # the image derivatives are named after the digest of their source photo, other than the manifest listing them
+    CacheRule(pattern="_derived/manifest.json", cache_control=REVALIDATE_CACHE_CONTROL),
+    CacheRule(pattern="_derived/*", cache_control=IMMUTABLE_CACHE_CONTROL),
+    CacheRule(pattern="*.html", cache_control=REVALIDATE_CACHE_CONTROL),
+    CacheRule(pattern="*_payload.json", cache_control=REVALIDATE_CACHE_CONTROL),
+    *(
+        CacheRule(pattern=f"*.{extension}", cache_control=MEDIA_CACHE_CONTROL)
+        for extension in ("avif", "gif", "ico", "jpeg", "jpg", "mp4", "png", "svg", "webm", "webp")
+    ),
+)
+
+
+class CacheControlPolicy:
+    """Resolves the Cache-Control header for S3 keys from an ordered table of glob rules.
+
+    All the rules are compiled into a single regular expression up front, so each key is resolved with one match.
+    """
+
+    def __init__(self, rules: Sequence[CacheRule], *, default: str):
+        super().__init__()
+        self._rules = tuple(rules)
+        self._default = default
+        # regex alternation tries each branch in order, so the first rule that matches is the group that gets captured
+        self._pattern = re.compile(
+            "|".join(f"(?P<rule{index}>{fnmatch.translate(rule.pattern)})" for index, rule in enumerate(self._rules)),
+            flags=re.IGNORECASE,  # file extensions from cameras are often upper case
+        )
+
+    def resolve(self, s3_key: str) -> str:
+        match = self._pattern.match(s3_key) if self._rules else None
+        if match is None or match.lastgroup is None:
+            return self._default
+        return self._rules[int(match.lastgroup.removeprefix("rule"))].cache_control
+
+    def resolve_all(self, s3_keys: Iterable[str]) -> dict[str, str]:
+        return {s3_key: self.resolve(s3_key) for s3_key in s3_keys}
+
+
+DEFAULT_CACHE_CONTROL_POLICY = CacheControlPolicy(CACHE_RULES, default=DEFAULT_CACHE_CONTROL)
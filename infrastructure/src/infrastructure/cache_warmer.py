@@ -0,0 +1,207 @@
+"""Warms CloudFront's caches after a deploy, so the first visitor to each route doesn't wait on the S3 website origin.
+
+What gets requested is every page prerendered into the built site and every page of the Nuxt Content collections,
+followed by the assets the prerendered pages link to. Requests go out concurrently over a bounded pool of kept-alive
+connections, no faster than a rate limit, with the Accept-Encoding of a browser so that the variant cached is the one
+browsers get. A run warms the edge location nearest to where it runs, along with the regional edge cache (and Origin
+Shield, when enabled) that every other edge location fills from.
+
+Warm a deployed site, or without `--base-url`, a local edge emulator serving the built site:
+`uv --directory=./infrastructure run python -m infrastructure.cache_warmer --base-url https://www.example.com`
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+from collections.abc import Sequence
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import override
+from urllib.parse import urlsplit
+
+from .constants import DEPLOY_CACHE_DIRECTORY_NAME
+from .content_routes import CONTENT_CONFIG_FILE_NAME
+from .content_routes import CONTENT_DIRECTORY_NAME
+from .content_routes import load_collections
+from .content_routes import page_routes
+from .jinja_constants import APP_DIRECTORY_NAME
+from .load_generator import LoadReport
+from .load_generator import run_load
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(__file__).parent.parent.parent.parent
+APP_DIR = REPO_ROOT / APP_DIRECTORY_NAME
+DEFAULT_PUBLIC_DIR = APP_DIR / ".output" / "public"
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_REQUESTS_PER_SECOND = 20.0
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 30.0
+DEFAULT_DEADLINE_SECONDS = 600.0  # warming is only an optimization, so it mustn't hold up the deploy for long
+INDEX_DOCUMENT = "index.html"
+# the attributes that load something as part of the page, rather than linking to another page
+_ASSET_ATTRIBUTES = frozenset(
+    {("script", "src"), ("img", "src"), ("img", "srcset"), ("source", "src"), ("source", "srcset"), ("video", "poster")}
+)
+_ASSET_LINK_RELS = frozenset(
+    {"apple-touch-icon", "icon", "manifest", "modulepreload", "prefetch", "preload", "stylesheet"}
+)
+
+
+class _LinkedAssetParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.assets: set[str] = set()
+
+    def _add(self, url: str) -> None:
+        # only what's served from the site itself, since other hosts aren't behind the distribution
+        if url.startswith("/") and not url.startswith("//"):
+            self.assets.add(url.split("#")[0])
+
+    @override
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        attributes = {name: value for name, value in attrs if value is not None}
+        if tag == "link":
+            if "href" in attributes and _ASSET_LINK_RELS.intersection(attributes.get("rel", "").lower().split()):
+                self._add(attributes["href"])
+            return
+        for name, value in attributes.items():
+            if (tag, name) not in _ASSET_ATTRIBUTES:
+                continue
+            if name == "srcset":
+                for candidate in value.split(","):
+                    if candidate.strip():
+                        self._add(candidate.split()[0])
+            else:
+                self._add(value)
+
+
+def linked_assets(html: str) -> set[str]:
+    """Return the same-origin URLs a page loads, such as its scripts, stylesheets and images."""
+    parser = _LinkedAssetParser()
+    parser.feed(html)
+    parser.close()
+    return parser.assets
+
+
+def prerendered_pages(static_files_dir: Path) -> dict[str, Path]:
+    """Find the prerendered page of every route in the built site, keyed by the route the site links to it as."""
+    pages: dict[str, Path] = {}
+    for path in sorted(static_files_dir.rglob(INDEX_DOCUMENT)):
+        directory = path.parent.relative_to(static_files_dir).as_posix()
+        pages["/" if directory == "." else f"/{directory}"] = path
+    return pages
+
+
+def collect_urls(static_files_dir: Path, *, app_dir: Path = APP_DIR) -> list[str]:
+    """List the URLs to warm, with every page before any of the assets they load."""
+    pages = prerendered_pages(static_files_dir)
+    content_routes = page_routes(app_dir / CONTENT_DIRECTORY_NAME, load_collections(app_dir / CONTENT_CONFIG_FILE_NAME))
+    if not_prerendered := sorted(set(content_routes) - pages.keys()):
+        logger.warning(f"Content pages missing from the built site, which will be warmed as errors: {not_prerendered}")
+    urls: dict[str, None] = {}  # a dict rather than a set, to keep the order
+    for route in sorted(pages.keys() | set(content_routes)):
+        urls[route] = None
+        if route != "/":
+            # the S3 website origin redirects here when serving from the root of the bucket, rather than from a release
+            urls[f"{route}/"] = None
+    for route in sorted(pages):
+        for asset in sorted(linked_assets(pages[route].read_text(encoding="utf-8", errors="replace"))):
+            urls.setdefault(asset)
+    return list(urls)
+
+
+def format_warm_report(report: LoadReport) -> str:
+    lines = [f"{'url':<64} {'status':>6} {'ttfb ms':>9} {'total ms':>9} {'KiB':>8}  cache"]
+    lines.extend(
+        f"{sample.route:<64} {sample.status:>6} {sample.ttfb_seconds * 1000:>9.1f} {sample.total_seconds * 1000:>9.1f} {sample.body_bytes / 1024:>8.1f}  {sample.cache_status or '-'}"
+        for stats in report.routes
+        for sample in stats.samples
+    )
+    hits = sum(stats.hit_ratio for stats in report.routes if stats.samples)
+    lines.append(
+        f"Warmed {report.request_count} URLs in {report.elapsed_seconds:.1f}s, {hits:.0f} of them were already cached, {report.errors} failed and {report.abandoned} were abandoned at the deadline"
+    )
+    return "\n".join(lines)
+
+
+async def warm_cache(  # noqa: PLR0913 # all keyword arguments besides what is being warmed
+    base_url: str,
+    urls: Sequence[str],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_requests_per_second: float = DEFAULT_MAX_REQUESTS_PER_SECOND,
+    request_timeout_seconds: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+) -> LoadReport:
+    return await run_load(
+        base_url,
+        urls,
+        requests_per_route=1,
+        concurrency=concurrency,
+        max_requests_per_second=max_requests_per_second,
+        request_timeout_seconds=request_timeout_seconds,
+        deadline_seconds=deadline_seconds,
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Request every page and asset of the site to fill CloudFront's caches."
+    )
+    _ = parser.add_argument(
+        "--base-url", default=None, help="The site to warm, instead of an edge emulator started for the run"
+    )
+    _ = parser.add_argument("--public-dir", type=Path, default=DEFAULT_PUBLIC_DIR, help="The built site to warm")
+    _ = parser.add_argument(
+        "--app-dir", type=Path, default=APP_DIR, help="Where the Nuxt Content collections are declared"
+    )
+    _ = parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    _ = parser.add_argument("--max-requests-per-second", type=float, default=DEFAULT_MAX_REQUESTS_PER_SECOND)
+    _ = parser.add_argument(
+        "--request-timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT_SECONDS, help="Seconds before a request fails"
+    )
+    _ = parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE_SECONDS,
+        help="Seconds before the rest of the URLs are skipped",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    urls = collect_urls(args.public_dir, app_dir=args.app_dir)
+    base_url: str | None = args.base_url
+    server = None
+    if base_url is None:
+        # deliberately deferred, since the emulator imports the Pulumi and AWS SDKs to share the deploy's upload logic,
+        # which warming a deployed site (and the route_dependencies CLI, which imports this module) has no need for
+        from .edge_emulator import create_server  # noqa: PLC0415 # see above
+        from .edge_emulator import load_site  # noqa: PLC0415 # see above
+
+        deploy_cache_dir = args.app_dir / DEPLOY_CACHE_DIRECTORY_NAME
+        server = create_server(load_site(args.public_dir, deploy_cache_dir=deploy_cache_dir), port=0)
+        _ = threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    try:
+        report = asyncio.run(
+            warm_cache(
+                base_url,
+                urls,
+                concurrency=args.concurrency,
+                max_requests_per_second=args.max_requests_per_second,
+                request_timeout_seconds=args.request_timeout,
+                deadline_seconds=args.deadline,
+            )
+        )
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    logger.info(f"Cache warming against {urlsplit(base_url).netloc}:\n{format_warm_report(report)}")
+    return 1 if report.errors or report.abandoned else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+from collections.abc import Mapping
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from ephemeral_pulumi_deploy import append_resource_suffix
+from pulumi import Input
+from pulumi_aws_native import cloudfront
+
+from .cache_control import EDGE_REVALIDATE_MAX_AGE
+
+# https://docs.aws.amazon.com/AmazonCloudFront/latest/DeveloperGuide/using-managed-cache-policies.html#managed-cache-caching-optimized
+CACHING_OPTIMIZED_MANAGED_POLICY_ID = "658327ea-f89d-4fab-a63d-7e88639e58f6"
+HTTP_VERSION = "http2and3"
+ALLOWED_METHODS = ("GET", "HEAD")
+
+
+@dataclass(frozen=True, kw_only=True)
+class CacheTtls:
+    # within these bounds, CloudFront follows the Cache-Control headers set on the S3 objects
+    min_ttl: int
+    default_ttl: int
+    max_ttl: int
+
+
+@dataclass(frozen=True, kw_only=True)
+class BehaviorSpec:
+    name: str
+    path_pattern: str | None  # None for the default behavior
+    managed_cache_policy_id: str | None = None
+    ttls: CacheTtls | None = None  # creates a custom cache policy, when not using a managed one
+
+    def __post_init__(self):
+        if (self.managed_cache_policy_id is None) == (self.ttls is None):
+            raise ValueError(f"Behavior {self.name} must have exactly one of a managed cache policy or custom TTLs")  # noqa: TRY003 # not worth a custom exception for this
+
+
+BEHAVIOR_SPECS: tuple[BehaviorSpec, ...] = (
+    # file names in _nuxt are fingerprinted by Vite, so they can be cached for as long as CloudFront allows
+    BehaviorSpec(
+        name="nuxt-assets", path_pattern="/_nuxt/*", managed_cache_policy_id=CACHING_OPTIMIZED_MANAGED_POLICY_ID
+    ),
+    # derived image names contain the digest of their source photo, so they never change either
+    BehaviorSpec(
+        name="derived-images", path_pattern="/_derived/*", managed_cache_policy_id=CACHING_OPTIMIZED_MANAGED_POLICY_ID
+    ),
+    BehaviorSpec(name="images", path_pattern="/images/*", ttls=CacheTtls(min_ttl=0, default_ttl=86400, max_ttl=604800)),
+    # HTML routes have no file extension to match a path pattern on, so the default behavior is what serves them. Their
+    # s-maxage keeps them at the edge between deploys, while browsers still revalidate them on every visit
+    BehaviorSpec(
+        name="html",
+        path_pattern=None,
+        ttls=CacheTtls(min_ttl=0, default_ttl=EDGE_REVALIDATE_MAX_AGE, max_ttl=3600),
+    ),
+)
+
+
+def cache_policy_config(spec: BehaviorSpec) -> cloudfront.CachePolicyConfigArgs:
+    assert spec.ttls is not None, f"Behavior {spec.name} uses a managed cache policy"
+    return cloudfront.CachePolicyConfigArgs(
+        name=append_resource_suffix(spec.name),
+        min_ttl=spec.ttls.min_ttl,
+        default_ttl=spec.ttls.default_ttl,
+        max_ttl=spec.ttls.max_ttl,
+        parameters_in_cache_key_and_forwarded_to_origin=cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginArgs(
+            # the Accept-Encoding header is needed in the cache key for CloudFront to compress responses at the edge
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+            cookies_config=cloudfront.CachePolicyCookiesConfigArgs(cookie_behavior="none"),
+            headers_config=cloudfront.CachePolicyHeadersConfigArgs(header_behavior="none"),
+            query_strings_config=cloudfront.CachePolicyQueryStringsConfigArgs(query_string_behavior="none"),
+        ),
+    )
+
+
+def create_cache_policies(specs: Sequence[BehaviorSpec] = BEHAVIOR_SPECS) -> dict[str, Input[str]]:
+    """Return the cache policy ID for each behavior, creating custom cache policies where needed."""
+    policy_ids: dict[str, Input[str]] = {}
+    for spec in specs:
+        if spec.managed_cache_policy_id is not None:
+            policy_ids[spec.name] = spec.managed_cache_policy_id
+            continue
+        policy_ids[spec.name] = cloudfront.CachePolicy(
+            append_resource_suffix(f"{spec.name}-cache"), cache_policy_config=cache_policy_config(spec)
+        ).aws_id
+    return policy_ids
+
+
+def build_cache_behaviors(
+    *,
+    target_origin_id: str,
+    cache_policy_ids: Mapping[str, Input[str]],
+    specs: Sequence[BehaviorSpec] = BEHAVIOR_SPECS,
+) -> tuple[cloudfront.DistributionDefaultCacheBehaviorArgs, list[cloudfront.DistributionCacheBehaviorArgs]]:
+    """Build the default and path-specific cache behaviors for the distribution, without creating any resources."""
+    default_behavior: cloudfront.DistributionDefaultCacheBehaviorArgs | None = None
+    behaviors: list[cloudfront.DistributionCacheBehaviorArgs] = []
+    for spec in specs:
+        if spec.path_pattern is None:
+            default_behavior = cloudfront.DistributionDefaultCacheBehaviorArgs(
+                target_origin_id=target_origin_id,
+                viewer_protocol_policy="redirect-to-https",
+                allowed_methods=list(ALLOWED_METHODS),
+                cached_methods=list(ALLOWED_METHODS),
+                cache_policy_id=cache_policy_ids[spec.name],
+                compress=True,
+            )
+            continue
+        behaviors.append(
+            cloudfront.DistributionCacheBehaviorArgs(
+                path_pattern=spec.path_pattern,
+                target_origin_id=target_origin_id,
+                viewer_protocol_policy="redirect-to-https",
+                allowed_methods=list(ALLOWED_METHODS),
+                cached_methods=list(ALLOWED_METHODS),
+                cache_policy_id=cache_policy_ids[spec.name],
+                compress=True,
+            )
+        )
+    if default_behavior is None:
+        raise ValueError("One behavior spec must have no path pattern, to be used as the default behavior")  # noqa: TRY003 # not worth a custom exception for this
+    return default_behavior, behaviors
+
+
+def build_origin_shield(region: str) -> cloudfront.DistributionOriginShieldArgs | None:
+    """Build the Origin Shield configuration, or None to leave it disabled when no region is given."""
+    if not region:
+        return None
+    return cloudfront.DistributionOriginShieldArgs(enabled=True, origin_shield_region=region)
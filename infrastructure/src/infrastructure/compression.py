@@ -0,0 +1,117 @@
+import gzip
+import json
+import logging
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+from .asset_scanner import AssetRecord
+from .content_types import TEXT_MEDIA_TYPES
+
+logger = logging.getLogger(__name__)
+
+# besides text, the binary formats that still compress well
+COMPRESSIBLE_CONTENT_TYPES = TEXT_MEDIA_TYPES | frozenset({"application/wasm", "font/otf", "font/ttf", "image/x-icon"})
+MIN_SIZE_TO_COMPRESS = 1024  # below this the savings are lost in the overhead of a single TCP packet anyway
+MIN_SAVINGS_RATIO = 0.1  # only serve the compressed copy if it is at least this much smaller than the original
+GZIP_SUFFIX = ".gz"
+SKIPPED_SUFFIX = ".skip"  # marks content that was already found not to be worth compressing
+# the cache is shared by every stack deployed from the checkout, so each records the content it still needs in here
+REFERENCES_DIRECTORY_NAME = "references"
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompressedVariant:
+    path: Path
+    content_encoding: str
+    size: int
+
+
+def _is_compressible(record: AssetRecord) -> bool:
+    media_type = record.content_type.split(";", 1)[0].strip()
+    return media_type in COMPRESSIBLE_CONTENT_TYPES and record.size >= MIN_SIZE_TO_COMPRESS
+
+
+def compress_asset(record: AssetRecord, *, cache_dir: Path) -> CompressedVariant | None:
+    """Return a gzipped copy of the asset, or None if it isn't worth compressing.
+
+    Results are cached by content digest, so unchanged files are never compressed twice. Only gzip is produced, since the
+    S3 website origin can't negotiate encodings and every browser accepts gzip.
+    """
+    if not _is_compressible(record):
+        return None
+    variant_path = cache_dir / f"{record.digest}{GZIP_SUFFIX}"
+    skipped_path = cache_dir / f"{record.digest}{SKIPPED_SUFFIX}"
+    if skipped_path.exists():
+        return None
+    if not variant_path.exists():
+        data = record.path.read_bytes()
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)  # a fixed mtime keeps the output reproducible
+        if len(compressed) > len(data) * (1 - MIN_SAVINGS_RATIO):
+            skipped_path.touch()
+            return None
+        tmp_path = variant_path.with_suffix(".tmp")
+        _ = tmp_path.write_bytes(compressed)
+        _ = tmp_path.replace(variant_path)
+    return CompressedVariant(path=variant_path, content_encoding="gzip", size=variant_path.stat().st_size)
+
+
+def _referenced_digests(references_dir: Path, *, excluding_owner: str) -> set[str] | None:
+    """Return the digests every other owner of the cache still needs, or None if that can't be determined."""
+    digests: set[str] = set()
+    for references_path in references_dir.glob("*.json"):
+        if references_path.stem == excluding_owner:
+            continue
+        try:
+            digests.update(json.loads(references_path.read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            logger.warning(f"Not pruning the compression cache, since {references_path} is corrupt", exc_info=True)
+            return None
+    return digests
+
+
+def _save_references(references_dir: Path, *, owner: str, digests: set[str]) -> None:
+    references_dir.mkdir(parents=True, exist_ok=True)
+    references_path = references_dir / f"{owner}.json"
+    tmp_path = references_path.with_suffix(".json.tmp")
+    _ = tmp_path.write_text(json.dumps(sorted(digests)), encoding="utf-8")
+    _ = tmp_path.replace(references_path)
+
+
+def compress_assets(
+    records: Sequence[AssetRecord], *, cache_dir: Path, owner: str, max_workers: int | None = None
+) -> dict[str, CompressedVariant]:
+    """Compress every asset worth compressing, returning the compressed variants keyed by S3 key.
+
+    The owner (e.g. the stack being deployed) records which cached variants it uses. Cached variants that neither it nor
+    any other owner still uses are removed.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # identical files only need compressing once (and mustn't race each other writing the same cache entry)
+    unique_records = list({record.digest: record for record in records}.values())
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compress-asset") as executor:
+        variants_by_digest = dict(
+            zip(
+                [record.digest for record in unique_records],
+                executor.map(partial(compress_asset, cache_dir=cache_dir), unique_records),
+                strict=True,
+            )
+        )
+    references_dir = cache_dir / REFERENCES_DIRECTORY_NAME
+    _save_references(references_dir, owner=owner, digests=set(variants_by_digest))
+    other_owners_digests = _referenced_digests(references_dir, excluding_owner=owner)
+    if other_owners_digests is not None:
+        for cached_path in cache_dir.iterdir():
+            digest = cached_path.name.split(".", 1)[0]
+            if cached_path.is_file() and digest not in variants_by_digest and digest not in other_owners_digests:
+                cached_path.unlink()
+
+    compressed = {
+        record.key: variant for record in records if (variant := variants_by_digest[record.digest]) is not None
+    }
+    original_bytes = sum(record.size for record in records if record.key in compressed)
+    compressed_bytes = sum(variant.size for variant in compressed.values())
+    logger.info(f"Compressed {len(compressed)} assets from {original_bytes} to {compressed_bytes} bytes")
+    return compressed
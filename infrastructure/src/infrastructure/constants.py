@@ -0,0 +1,3 @@
+"""Constants shared by the deploy and the local tools, kept free of imports so that the tools start quickly."""
+
+DEPLOY_CACHE_DIRECTORY_NAME = ".deploy-cache"  # local state kept between deploys, inside the app directory
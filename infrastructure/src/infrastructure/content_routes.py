@@ -0,0 +1,181 @@
+"""The routes Nuxt Content serves the files in `content/` at, from the collections declared in `content.config.ts`.
+
+The config is TypeScript, so rather than evaluating it, the object literal passed to each `defineCollection(...)` is
+scanned for its `type` and `source`, which are always written out as literals.
+"""
+
+import re
+from collections.abc import Iterator
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from pathlib import PurePosixPath
+
+CONTENT_DIRECTORY_NAME = "content"
+CONTENT_CONFIG_FILE_NAME = "content.config.ts"
+PAGE_COLLECTION_TYPE = "page"
+_COLLECTION_PATTERN = re.compile(r"(\w+)\s*:\s*defineCollection\s*\(")
+_STRING_LITERAL_PATTERN = re.compile(r"""^(["'`])(.*)\1$""", flags=re.DOTALL)
+_ORDERING_PREFIX_PATTERN = re.compile(r"^\d+\.")  # e.g. `1.getting-started.md`, which Nuxt Content leaves out of routes
+_GLOB_CHARACTERS = frozenset("*?[{")
+_OPENING_BRACKETS = "([{"
+_CLOSING_BRACKETS = ")]}"
+_QUOTES = "\"'`"
+
+
+class ContentConfigError(Exception):
+    def __init__(self, *, config_path: Path, collection_name: str, reason: Exception):
+        super().__init__(f"{config_path}: Can't read collection {collection_name}: {reason}")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CollectionSource:
+    include: str  # glob relative to the content directory
+    exclude: tuple[str, ...] = ()
+    prefix: str | None = None  # replaces the directories `include` starts with in the routes, as in Nuxt Content
+
+    @property
+    def fixed_directory(self) -> str:
+        """Return the directories `include` starts with before its first glob, e.g. `blog` for `blog/*.md`."""
+        directories: list[str] = []
+        for segment in self.include.split("/")[:-1]:
+            if _GLOB_CHARACTERS.intersection(segment):
+                break
+            directories.append(segment)
+        return "/".join(directories)
+
+    def matches(self, relative_path: str) -> bool:
+        path = PurePosixPath(relative_path)
+        return path.full_match(self.include) and not any(path.full_match(pattern) for pattern in self.exclude)
+
+    def route_for(self, relative_path: str) -> str:
+        fixed_directory = self.fixed_directory
+        prefix = f"/{fixed_directory}" if self.prefix is None else self.prefix
+        path = PurePosixPath(relative_path.removeprefix(f"{fixed_directory}/") if fixed_directory else relative_path)
+        segments = [_ORDERING_PREFIX_PATTERN.sub("", segment) for segment in (*path.parent.parts, path.stem)]
+        if segments[-1] == "index":
+            _ = segments.pop()
+        return "/" + "/".join(part for part in (*prefix.split("/"), *segments) if part)
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ContentCollection:
+    name: str
+    type: str  # only "page" collections are served at a route of their own, "data" ones are just queried
+    sources: tuple[CollectionSource, ...]
+
+    def source_for(self, relative_path: str) -> CollectionSource | None:
+        return next((source for source in self.sources if source.matches(relative_path)), None)
+
+
+def _closing_index(text: str, opening_index: int) -> int:
+    """Find the bracket closing the one at `opening_index`, skipping over any brackets within string literals."""
+    depth = 0
+    quote: str | None = None
+    index = opening_index
+    while index < len(text):
+        character = text[index]
+        if quote is not None:
+            if character == "\\":
+                index += 1
+            elif character == quote:
+                quote = None
+        elif character in _QUOTES:
+            quote = character
+        elif character in _OPENING_BRACKETS:
+            depth += 1
+        elif character in _CLOSING_BRACKETS:
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+    raise ValueError(f"Unbalanced {text[opening_index]} at offset {opening_index}")  # noqa: TRY003 # not worth a custom exception for this
+
+
+def _string_end(text: str, opening_index: int) -> int:
+    index = opening_index + 1
+    while text[index] != text[opening_index]:
+        index += 2 if text[index] == "\\" else 1
+    return index
+
+
+def _split_top_level(text: str) -> Iterator[str]:
+    """Split the contents of an object or array literal at the commas that aren't nested in anything else."""
+    start = 0
+    index = 0
+    while index < len(text):
+        character = text[index]
+        if character in _OPENING_BRACKETS or character in _QUOTES:
+            index = _closing_index(text, index) if character in _OPENING_BRACKETS else _string_end(text, index)
+        elif character == ",":
+            if part := text[start:index].strip():
+                yield part
+            start = index + 1
+        index += 1
+    if part := text[start:].strip():
+        yield part
+
+
+def _object_properties(literal: str) -> dict[str, str]:
+    properties: dict[str, str] = {}
+    for part in _split_top_level(literal.strip()[1:-1]):
+        name, separator, value = part.partition(":")
+        if separator:  # shorthand properties and spreads can't hold a literal type or source
+            properties[name.strip().strip(_QUOTES)] = value.strip()
+    return properties
+
+
+def _string_value(literal: str) -> str:
+    match = _STRING_LITERAL_PATTERN.match(literal.strip())
+    if match is None:
+        raise ValueError(f"Expected a string literal, but found {literal}")  # noqa: TRY003 # not worth a custom exception for this
+    return match.group(2)
+
+
+def _parse_source(literal: str) -> tuple[CollectionSource, ...]:
+    literal = literal.strip()
+    if literal.startswith("["):
+        return tuple(source for part in _split_top_level(literal[1:-1]) for source in _parse_source(part))
+    if not literal.startswith("{"):
+        return (CollectionSource(include=_string_value(literal)),)
+    properties = _object_properties(literal)
+    exclude = properties.get("exclude", "[]").strip()
+    return (
+        CollectionSource(
+            include=_string_value(properties["include"]),
+            exclude=tuple(_string_value(pattern) for pattern in _split_top_level(exclude[1:-1])),
+            prefix=_string_value(properties["prefix"]) if "prefix" in properties else None,
+        ),
+    )
+
+
+def load_collections(config_path: Path) -> tuple[ContentCollection, ...]:
+    """Read the name, type and sources of every collection declared in the Nuxt Content config."""
+    text = config_path.read_text(encoding="utf-8")
+    collections: list[ContentCollection] = []
+    for match in _COLLECTION_PATTERN.finditer(text):
+        call_end = _closing_index(text, match.end() - 1)
+        argument = text[match.end() : call_end].strip()
+        try:
+            properties = _object_properties(argument)
+            sources = _parse_source(properties["source"])
+            collection_type = _string_value(properties["type"])
+        except (KeyError, ValueError) as e:
+            raise ContentConfigError(config_path=config_path, collection_name=match.group(1), reason=e) from e
+        collections.append(ContentCollection(name=match.group(1), type=collection_type, sources=sources))
+    return tuple(collections)
+
+
+def content_files(content_dir: Path) -> list[str]:
+    """List every file in the content directory, relative to it with forward slashes."""
+    return sorted(path.relative_to(content_dir).as_posix() for path in content_dir.rglob("*") if path.is_file())
+
+
+def page_routes(content_dir: Path, collections: Sequence[ContentCollection]) -> list[str]:
+    """Return the route of every file in the page collections, which Nuxt Content resolves each page query by."""
+    routes: set[str] = set()
+    for relative_path in content_files(content_dir):
+        for collection in collections:
+            if collection.type == PAGE_COLLECTION_TYPE and (source := collection.source_for(relative_path)):
+                routes.add(source.route_for(relative_path))
+    return sorted(routes)
@@ -0,0 +1,156 @@
+"""The Content-Type every uploaded file is served with, independent of the MIME database of the machine deploying it."""
+
+from collections.abc import Mapping
+from pathlib import Path
+from types import MappingProxyType
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+TEXT_CHARSET = "utf-8"  # the static site generator only ever writes UTF-8
+SNIFF_LENGTH = 512  # enough to see past a BOM and leading whitespace to the first tag of a markup file
+
+_MEDIA_TYPES_BY_EXTENSION = {
+    # documents and data
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".css": "text/css",
+    # the site has always served JavaScript as application/javascript, and changing it would re-upload every script
+    ".js": "application/javascript",
+    ".mjs": "application/javascript",
+    ".cjs": "application/javascript",
+    ".map": "application/json",
+    ".json": "application/json",
+    ".jsonld": "application/ld+json",
+    ".webmanifest": "application/manifest+json",
+    ".xml": "application/xml",
+    ".rss": "application/rss+xml",
+    ".atom": "application/atom+xml",
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".csv": "text/csv",
+    ".ics": "text/calendar",
+    ".vtt": "text/vtt",
+    ".pdf": "application/pdf",
+    ".wasm": "application/wasm",
+    ".zip": "application/zip",
+    # images
+    ".avif": "image/avif",
+    ".webp": "image/webp",
+    ".png": "image/png",
+    ".apng": "image/apng",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+    ".bmp": "image/bmp",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+    ".heic": "image/heic",
+    # fonts
+    ".woff2": "font/woff2",
+    ".woff": "font/woff",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    # audio and video
+    ".mp4": "video/mp4",
+    ".m4v": "video/mp4",
+    ".webm": "video/webm",
+    ".mov": "video/quicktime",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+}
+# the media types that are text, and so get a charset (as does anything else under text/)
+TEXT_MEDIA_TYPES = frozenset(
+    {
+        "application/atom+xml",
+        "application/javascript",
+        "application/json",
+        "application/ld+json",
+        "application/manifest+json",
+        "application/rss+xml",
+        "application/xml",
+        "image/svg+xml",
+        "text/calendar",
+        "text/css",
+        "text/csv",
+        "text/html",
+        "text/javascript",
+        "text/markdown",
+        "text/plain",
+        "text/vtt",
+        "text/xml",
+    }
+)
+
+
+def _with_charset(media_type: str) -> str:
+    if media_type.startswith("text/") or media_type in TEXT_MEDIA_TYPES:
+        return f"{media_type}; charset={TEXT_CHARSET}"
+    return media_type
+
+
+CONTENT_TYPES_BY_EXTENSION: Mapping[str, str] = MappingProxyType(
+    {extension: _with_charset(media_type) for extension, media_type in _MEDIA_TYPES_BY_EXTENSION.items()}
+)
+
+# (offset, signature, media type), checked in order
+_MAGIC_BYTES: tuple[tuple[int, bytes, str], ...] = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),  # after the RIFF header and its length
+    (4, b"ftypavif", "image/avif"),
+    (4, b"ftypavis", "image/avif"),
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftyp", "video/mp4"),  # any other ISO base media file
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"wOF2", "font/woff2"),
+    (0, b"wOFF", "font/woff"),
+    (0, b"\x00\x01\x00\x00", "font/ttf"),
+    (0, b"OTTO", "font/otf"),
+    (0, b"\x00asm", "application/wasm"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"\x00\x00\x01\x00", "image/x-icon"),
+)
+_MARKUP_PREFIXES: tuple[tuple[bytes, str], ...] = (
+    (b"<!doctype html", "text/html"),
+    (b"<html", "text/html"),
+    (b"<svg", "image/svg+xml"),
+    (b"<?xml", "application/xml"),
+)
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Identify content from its first bytes, for files that have no extension to go by."""
+    for offset, signature, media_type in _MAGIC_BYTES:
+        if head.startswith(signature, offset):
+            return media_type
+    text = head.removeprefix(b"\xef\xbb\xbf").lstrip().lower()
+    for prefix, media_type in _MARKUP_PREFIXES:
+        if text.startswith(prefix):
+            return _with_charset(media_type)
+    if b"\x00" in head:
+        return DEFAULT_CONTENT_TYPE
+    try:
+        _ = head.decode(TEXT_CHARSET)
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:  # not just a multi-byte character cut off at the end of the sniffed bytes
+            return DEFAULT_CONTENT_TYPE
+    return _with_charset("text/plain")
+
+
+def guess_content_type(path: Path) -> str:
+    """Return the Content-Type to serve the file with.
+
+    Files are identified by their extension alone, and only read when they have no extension.
+    """
+    extension = path.suffix.lower()
+    if extension:
+        return CONTENT_TYPES_BY_EXTENSION.get(extension, DEFAULT_CONTENT_TYPE)
+    with path.open("rb") as file:
+        return sniff_content_type(file.read(SNIFF_LENGTH))
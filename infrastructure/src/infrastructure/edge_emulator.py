@@ -0,0 +1,369 @@
+"""Serves the built site locally as S3 and CloudFront would once deployed, to measure caching and compression.
+
+Objects get the same bodies and Content-Type, Content-Encoding and Cache-Control headers the deploy stores them with,
+and are resolved like the S3 website endpoint resolves them (index documents, redirects to add a trailing slash, and
+the error document for anything missing). In front of that sits an approximation of CloudFront: each request is matched
+to a cache behavior, cached for the TTL its cache policy allows, and gzipped at the edge when CloudFront would compress
+it. Brotli isn't in the standard library, so the emulated edge only ever compresses with gzip.
+
+Serve the site, then generate load against it (or against a deployed environment, with `--base-url`):
+`uv --directory=./infrastructure run python -m infrastructure.edge_emulator serve`
+`uv --directory=./infrastructure run python -m infrastructure.edge_emulator load --base-url http://127.0.0.1:8080`
+Without `--base-url`, `load` starts its own emulator in the background.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import fnmatch
+import gzip
+import logging
+import re
+import sys
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from email.utils import formatdate
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from typing import override
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from .asset_scanner import scan_assets
+from .cloudfront_behaviors import BEHAVIOR_SPECS
+from .cloudfront_behaviors import CACHING_OPTIMIZED_MANAGED_POLICY_ID
+from .cloudfront_behaviors import BehaviorSpec
+from .cloudfront_behaviors import CacheTtls
+from .compression import COMPRESSIBLE_CONTENT_TYPES
+from .compression import compress_assets
+from .constants import DEPLOY_CACHE_DIRECTORY_NAME
+from .hash_cache import HashCache
+from .jinja_constants import APP_DIRECTORY_NAME
+from .load_generator import DEFAULT_ACCEPT_ENCODING
+from .load_generator import DEFAULT_CONCURRENCY
+from .load_generator import DEFAULT_REQUESTS_PER_ROUTE
+from .load_generator import run_load
+from .s3_sync import SyncEntry
+from .s3_sync import build_sync_entries
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(__file__).parent.parent.parent.parent
+DEFAULT_PUBLIC_DIR = REPO_ROOT / APP_DIRECTORY_NAME / ".output" / "public"
+DEFAULT_DEPLOY_CACHE_DIR = REPO_ROOT / APP_DIRECTORY_NAME / DEPLOY_CACHE_DIRECTORY_NAME
+COMPRESSION_CACHE_OWNER = "edge-emulator"  # shares the cache with the stacks deployed from this checkout
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# matching the website configuration of the app bucket
+INDEX_DOCUMENT = "index.html"
+ERROR_DOCUMENT = "404.html"
+# https://docs.aws.amazon.com/AmazonCloudFront/latest/DeveloperGuide/using-managed-cache-policies.html#managed-cache-caching-optimized
+MANAGED_POLICY_TTLS = {
+    CACHING_OPTIMIZED_MANAGED_POLICY_ID: CacheTtls(min_ttl=1, default_ttl=86400, max_ttl=31536000),
+}
+ERROR_CACHING_MIN_TTL = 10  # how long CloudFront caches 4xx responses from the origin by default
+# https://docs.aws.amazon.com/AmazonCloudFront/latest/DeveloperGuide/ServingCompressedFiles.html
+EDGE_COMPRESSION_MIN_SIZE = 1000
+EDGE_COMPRESSION_MAX_SIZE = 10_000_000
+_MAX_AGE_PATTERN = re.compile(r"(?:^|,)\s*(s-maxage|max-age)\s*=\s*(\d+)", flags=re.IGNORECASE)
+_UNCACHEABLE_DIRECTIVES = frozenset({"no-cache", "no-store", "private"})
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Response:
+    status: HTTPStatus
+    headers: dict[str, str]
+    body: bytes
+
+
+class S3WebsiteOrigin:
+    """Resolves requests the way the S3 website endpoint resolves them against the bucket's objects."""
+
+    def __init__(self, entries: Sequence[SyncEntry]):
+        super().__init__()
+        self._entries = {entry.key: entry for entry in entries}
+
+    def _object_response(self, entry: SyncEntry, *, status: HTTPStatus = HTTPStatus.OK) -> Response:
+        path = Path(entry.path)
+        headers = {
+            "Content-Type": entry.content_type,
+            "Cache-Control": entry.cache_control,
+            "ETag": f'"{entry.etag}"',
+            "Last-Modified": formatdate(path.stat().st_mtime, usegmt=True),
+        }
+        if entry.content_encoding is not None:
+            headers["Content-Encoding"] = entry.content_encoding
+        return Response(status=status, headers=headers, body=path.read_bytes())
+
+    def get(self, request_path: str) -> Response:
+        key = unquote(request_path).removeprefix("/")
+        if key == "" or key.endswith("/"):
+            key += INDEX_DOCUMENT
+        if (entry := self._entries.get(key)) is not None:
+            return self._object_response(entry)
+        if f"{key}/{INDEX_DOCUMENT}" in self._entries:
+            return Response(status=HTTPStatus.FOUND, headers={"Location": f"{request_path}/"}, body=b"")
+        if (error_entry := self._entries.get(ERROR_DOCUMENT)) is not None:
+            return self._object_response(error_entry, status=HTTPStatus.NOT_FOUND)
+        return Response(status=HTTPStatus.NOT_FOUND, headers={"Content-Type": "text/plain"}, body=b"Not Found")
+
+
+def find_behavior(request_path: str, specs: Sequence[BehaviorSpec] = BEHAVIOR_SPECS) -> BehaviorSpec:
+    """Return the first behavior whose path pattern matches, as CloudFront does, falling back to the default one."""
+    for spec in specs:
+        # CloudFront patterns are case sensitive, and `*` matches across `/`
+        if spec.path_pattern is not None and fnmatch.fnmatchcase(request_path, spec.path_pattern):
+            return spec
+    return next(spec for spec in specs if spec.path_pattern is None)
+
+
+def _behavior_ttls(spec: BehaviorSpec) -> CacheTtls:
+    if spec.ttls is not None:
+        return spec.ttls
+    assert spec.managed_cache_policy_id is not None
+    return MANAGED_POLICY_TTLS[spec.managed_cache_policy_id]
+
+
+def cache_ttl(response: Response, ttls: CacheTtls) -> int:
+    """Return how long CloudFront keeps a response, given the origin's Cache-Control and the cache policy's bounds."""
+    if response.status >= HTTPStatus.BAD_REQUEST:
+        return ERROR_CACHING_MIN_TTL
+    cache_control = response.headers.get("Cache-Control", "")
+    directives = {directive.strip().split("=")[0].lower() for directive in cache_control.split(",")}
+    if directives & _UNCACHEABLE_DIRECTIVES and ttls.min_ttl == 0:
+        return 0
+    max_ages = {name.lower(): int(value) for name, value in _MAX_AGE_PATTERN.findall(cache_control)}
+    ttl = max_ages.get("s-maxage", max_ages.get("max-age", ttls.default_ttl))
+    return min(max(ttl, ttls.min_ttl), ttls.max_ttl)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return parameters.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _edge_compressed(response: Response) -> Response:
+    if (
+        response.status != HTTPStatus.OK
+        or "Content-Encoding" in response.headers
+        or not (EDGE_COMPRESSION_MIN_SIZE <= len(response.body) <= EDGE_COMPRESSION_MAX_SIZE)
+        or response.headers.get("Content-Type", "").split(";")[0].strip() not in COMPRESSIBLE_CONTENT_TYPES
+    ):
+        return response
+    headers = {**response.headers, "Content-Encoding": "gzip"}
+    # CloudFront weakens the ETag of anything it compresses, since the bytes no longer match the origin's
+    if (etag := headers.get("ETag")) is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+    return Response(status=response.status, headers=headers, body=gzip.compress(response.body, compresslevel=6))
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class _CachedResponse:
+    response: Response
+    stored_at: float
+    ttl: int
+
+
+class EmulatedEdge:
+    """Caches and compresses origin responses per cache behavior, roughly as a single CloudFront edge location would."""
+
+    def __init__(
+        self,
+        origin: S3WebsiteOrigin,
+        *,
+        specs: Sequence[BehaviorSpec] = BEHAVIOR_SPECS,
+        origin_latency_seconds: float = 0,
+    ):
+        super().__init__()
+        self._origin = origin
+        self._specs = tuple(specs)
+        self._origin_latency_seconds = origin_latency_seconds
+        self._cache: dict[tuple[str, bool], _CachedResponse] = {}
+        self._lock = threading.Lock()
+
+    def get(self, request_path: str, *, accept_encoding: str) -> Response:
+        path = urlsplit(request_path).path  # none of the cache policies forward the query string
+        spec = find_behavior(path, self._specs)
+        # with gzip enabled in the cache policy, CloudFront normalizes Accept-Encoding down to whether it includes gzip
+        accepts_gzip = _accepts_gzip(accept_encoding)
+        cache_key = (path, accepts_gzip)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(cache_key)
+        if cached is not None and now - cached.stored_at < cached.ttl:
+            age = int(now - cached.stored_at)
+            return _with_edge_headers(cached.response, cache_status="Hit", age=age, behavior=spec.name)
+
+        if self._origin_latency_seconds:
+            time.sleep(self._origin_latency_seconds)
+        response = self._origin.get(path)
+        if accepts_gzip:  # compress is enabled on every behavior
+            response = _edge_compressed(response)
+        ttl = cache_ttl(response, _behavior_ttls(spec))
+        if ttl > 0:
+            with self._lock:
+                self._cache[cache_key] = _CachedResponse(response=response, stored_at=now, ttl=ttl)
+        return _with_edge_headers(response, cache_status="Miss", age=None, behavior=spec.name)
+
+
+def _with_edge_headers(response: Response, *, cache_status: str, age: int | None, behavior: str) -> Response:
+    headers = {**response.headers, "X-Cache": f"{cache_status} from cloudfront", "X-Edge-Behavior": behavior}
+    if age is not None:
+        headers["Age"] = str(age)
+    return Response(status=response.status, headers=headers, body=response.body)
+
+
+class EdgeEmulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], *, origin: S3WebsiteOrigin, edge: EmulatedEdge | None):
+        super().__init__(address, _EdgeRequestHandler)
+        self.origin = origin
+        self.edge = edge  # None to serve straight from the emulated origin
+
+    def resolve(self, request_path: str, *, accept_encoding: str) -> Response:
+        if self.edge is None:
+            return self.origin.get(urlsplit(request_path).path)
+        return self.edge.get(request_path, accept_encoding=accept_encoding)
+
+
+class _EdgeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # so that load generators can keep connections alive
+    server: EdgeEmulatorServer  # pyright: ignore[reportIncompatibleVariableOverride] # narrowing to the server this handler is always created by
+
+    def _respond(self, *, include_body: bool) -> None:
+        response = self.server.resolve(self.path, accept_encoding=self.headers.get("Accept-Encoding", ""))
+        etag = response.headers.get("ETag")
+        if response.status == HTTPStatus.OK and etag is not None and self.headers.get("If-None-Match") == etag:
+            response = Response(status=HTTPStatus.NOT_MODIFIED, headers=response.headers, body=b"")
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        if include_body:
+            _ = self.wfile.write(response.body)
+
+    def do_GET(self) -> None:
+        self._respond(include_body=True)
+
+    def do_HEAD(self) -> None:
+        self._respond(include_body=False)
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def load_site(public_dir: Path, *, deploy_cache_dir: Path) -> list[SyncEntry]:
+    """Describe the built site as the objects a deploy would store, sharing the deploy's hash and compression caches."""
+    hash_cache = HashCache(deploy_cache_dir / "file-hashes.json")
+    snapshot = scan_assets(public_dir, known_entries={}, hash_cache=hash_cache)
+    hash_cache.save()
+    return build_sync_entries(
+        snapshot.records,
+        compress_assets(snapshot.records, cache_dir=deploy_cache_dir / "compressed", owner=COMPRESSION_CACHE_OWNER),
+    )
+
+
+def site_routes(entries: Sequence[SyncEntry]) -> list[str]:
+    """List the URL a visitor would request each object by, with index documents requested as their directory."""
+    routes: list[str] = []
+    for entry in entries:
+        if entry.key == INDEX_DOCUMENT or entry.key.endswith(f"/{INDEX_DOCUMENT}"):
+            routes.append(f"/{entry.key.removesuffix(INDEX_DOCUMENT)}")
+        elif entry.key != ERROR_DOCUMENT:
+            routes.append(f"/{entry.key}")
+    return routes
+
+
+def create_server(
+    entries: Sequence[SyncEntry],
+    *,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    emulate_edge: bool = True,
+    origin_latency_seconds: float = 0,
+) -> EdgeEmulatorServer:
+    origin = S3WebsiteOrigin(entries)
+    edge = EmulatedEdge(origin, origin_latency_seconds=origin_latency_seconds) if emulate_edge else None
+    return EdgeEmulatorServer((host, port), origin=origin, edge=edge)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the built site as S3 and CloudFront would, and load test it.")
+    _ = parser.add_argument("--public-dir", type=Path, default=DEFAULT_PUBLIC_DIR, help="The built site to serve")
+    _ = parser.add_argument(
+        "--deploy-cache-dir",
+        type=Path,
+        default=DEFAULT_DEPLOY_CACHE_DIR,
+        help="Where the hashes and compressed variants are cached, shared with the deploy by default",
+    )
+    _ = parser.add_argument(
+        "--no-edge", action="store_true", help="Serve straight from the emulated S3 origin, without CloudFront"
+    )
+    _ = parser.add_argument(
+        "--origin-latency-ms", type=float, default=0, help="Added to every request the edge forwards to the origin"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Serve the site until interrupted")
+    _ = serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    _ = serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load_parser = subparsers.add_parser("load", help="Request every route of the site and report per route")
+    _ = load_parser.add_argument(
+        "--base-url", default=None, help="The server to load test, instead of an emulator started for the run"
+    )
+    _ = load_parser.add_argument("--routes", nargs="+", default=None, help="Defaults to every route of the site")
+    _ = load_parser.add_argument("--requests-per-route", type=int, default=DEFAULT_REQUESTS_PER_ROUTE)
+    _ = load_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    _ = load_parser.add_argument("--accept-encoding", default=DEFAULT_ACCEPT_ENCODING)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    needs_site = args.command == "serve" or args.base_url is None or args.routes is None
+    entries = load_site(args.public_dir, deploy_cache_dir=args.deploy_cache_dir) if needs_site else []
+    server_options: dict[str, Any] = {
+        "emulate_edge": not args.no_edge,
+        "origin_latency_seconds": args.origin_latency_ms / 1000,
+    }
+    if args.command == "serve":
+        with create_server(entries, host=args.host, port=args.port, **server_options) as server:
+            logger.info(f"Serving {len(entries)} objects from {args.public_dir} on http://{args.host}:{args.port}")
+            with contextlib.suppress(KeyboardInterrupt):
+                server.serve_forever()
+        return 0
+
+    server: EdgeEmulatorServer | None = None
+    base_url: str = args.base_url
+    if args.base_url is None:
+        server = create_server(entries, port=0, **server_options)  # any free port
+        _ = threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://{DEFAULT_HOST}:{server.server_address[1]}"
+    try:
+        report = asyncio.run(
+            run_load(
+                base_url,
+                args.routes or site_routes(entries),
+                requests_per_route=args.requests_per_route,
+                concurrency=args.concurrency,
+                accept_encoding=args.accept_encoding,
+            )
+        )
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    logger.info(f"Load against {base_url}:\n{report.format_summary()}")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import hashlib
+from collections.abc import Iterable
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MIN_FILES_FOR_THREAD_POOL = 8  # below this, the overhead of spinning up threads outweighs any gain
+
+
+def hash_file(file_path: Path, *, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute the MD5 digest of a file by streaming it through a fixed-size buffer.
+
+    Memory use stays constant no matter how large the file is (e.g. raw video footage).
+    """
+    file_hash = hashlib.md5()  # noqa: S324 # we're just using this for change detection, not security
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with file_path.open("rb", buffering=0) as f:
+        while bytes_read := f.readinto(buffer):
+            file_hash.update(view[:bytes_read])
+    return file_hash.hexdigest()
+
+
+def hash_files(file_paths: Sequence[Path], *, max_workers: int | None = None) -> list[str]:
+    """Hash many files concurrently, returning the digests in the same order as the paths.
+
+    hashlib releases the GIL while digesting large buffers, so threads give real parallelism here.
+    """
+    if len(file_paths) < MIN_FILES_FOR_THREAD_POOL:
+        return [hash_file(file_path) for file_path in file_paths]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hash-file") as executor:
+        return list(executor.map(hash_file, file_paths))
+
+
+def combine_digests(keyed_digests: Iterable[tuple[str, str]]) -> str:
+    """Fold per-file digests into a single digest that is independent of the order they were computed in."""
+    combined_hash = hashlib.md5()  # noqa: S324 # we're just using this for change detection, not security
+    for key, digest in sorted(keyed_digests):
+        combined_hash.update(key.encode())
+        combined_hash.update(digest.encode())
+    return combined_hash.hexdigest()
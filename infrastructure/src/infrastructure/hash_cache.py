@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+HASH_CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 250_000
+
+
+class HashCache:
+    """File digests persisted between runs, keyed by each file's path and stat information.
+
+    A file is only trusted to be unchanged if its path, size, mtime and inode all still match, so any rewrite of the
+    file misses the cache. Entries are kept in least-recently-used order, and the least recently used ones are evicted
+    once there are more than `max_entries`, which naturally drops the entries for files that have since changed.
+
+    Only new entries or evictions get the cache written back, so a run where nothing changed doesn't rewrite it just
+    to record the order of its hits. That order is still kept in memory for when something else gets it written.
+    """
+
+    def __init__(self, cache_path: Path, *, max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        self._cache_path = cache_path
+        self._max_entries = max_entries
+        self._entries = self._load()
+        self._is_dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> OrderedDict[str, str]:
+        if not self._cache_path.exists():
+            return OrderedDict()
+        try:
+            raw: dict[str, Any] = json.loads(self._cache_path.read_text(encoding="utf-8"))
+            entries: OrderedDict[str, str] = OrderedDict()
+            for key, digest in raw["entries"]:
+                if not isinstance(key, str) or not isinstance(digest, str):
+                    raise TypeError(f"Unexpected entry {key!r}: {digest!r}")  # noqa: TRY301,TRY003 # handled right below the same way as any other corruption
+                entries[key] = digest
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring corrupt hash cache {self._cache_path}, all files will be hashed", exc_info=True)
+            return OrderedDict()
+        return entries
+
+    @staticmethod
+    def _key(file_path: Path, file_stat: os.stat_result) -> str:
+        # the version is part of every key, so entries written by an older format can never be mistaken for current ones
+        return f"{HASH_CACHE_VERSION}:{file_stat.st_size}:{file_stat.st_mtime_ns}:{file_stat.st_ino}:{file_path}"
+
+    def get(self, file_path: Path, file_stat: os.stat_result) -> str | None:
+        key = self._key(file_path, file_stat)
+        digest = self._entries.get(key)
+        if digest is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return digest
+
+    def put(self, file_path: Path, file_stat: os.stat_result, digest: str) -> None:
+        key = self._key(file_path, file_stat)
+        self._entries[key] = digest
+        self._entries.move_to_end(key)
+        self._is_dirty = True
+
+    def save(self) -> None:
+        while len(self._entries) > self._max_entries:
+            _ = self._entries.popitem(last=False)
+            self._is_dirty = True
+        if not self._is_dirty:
+            return
+        self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._cache_path.with_suffix(f"{self._cache_path.suffix}.tmp")
+        _ = tmp_path.write_text(json.dumps({"entries": list(self._entries.items())}), encoding="utf-8")
+        _ = tmp_path.replace(self._cache_path)
+        self._is_dirty = False
@@ -0,0 +1,272 @@
+"""Build stage that creates width-bucketed WebP/AVIF copies of the site's photos.
+
+Run it before generating the static site:
+`uv --directory=./infrastructure run python -m infrastructure.image_derivatives`
+"""
+
+import argparse
+import json
+import logging
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+from PIL import ImageOps
+from PIL import features
+
+from .constants import DEPLOY_CACHE_DIRECTORY_NAME
+from .file_hashing import hash_files
+from .hash_cache import HashCache
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIRECTORY_NAME = "_derived"
+DERIVED_MANIFEST_NAME = "manifest.json"
+DERIVED_MANIFEST_VERSION = 1
+WIDTH_BUCKETS = (320, 640, 960, 1280, 1920, 2560)
+SOURCE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp"})
+DIGEST_LENGTH_IN_NAME = 12  # plenty to tell apart every version of a photo, while keeping the URLs short
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60  # AVIF holds up at lower quality settings than WebP for the same visual result
+AVIF_SPEED = 6  # the encoder is very slow at its default speed, and the size gains past this point are marginal
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class OutputFormat:
+    extension: str
+    mime_type: str
+    pillow_format: str
+    save_options: tuple[tuple[str, Any], ...]
+
+
+WEBP = OutputFormat(
+    extension="webp",
+    mime_type="image/webp",
+    pillow_format="WEBP",
+    save_options=(("quality", WEBP_QUALITY), ("method", 6)),
+)
+AVIF = OutputFormat(
+    extension="avif",
+    mime_type="image/avif",
+    pillow_format="AVIF",
+    save_options=(("quality", AVIF_QUALITY), ("speed", AVIF_SPEED)),
+)
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class DerivedVariant:
+    src: str  # the public URL path
+    width: int
+    height: int
+    type: str
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class DerivedImage:
+    digest: str
+    width: int
+    height: int
+    variants: tuple[DerivedVariant, ...]  # ordered by format preference, then by width
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class _TranscodeJob:
+    source_path: Path
+    digest: str
+    output_dir: Path
+    formats: tuple[OutputFormat, ...]
+
+
+def available_formats() -> tuple[OutputFormat, ...]:
+    """Return the output formats this Pillow build can encode, most compact first."""
+    formats: list[OutputFormat] = []
+    if features.check("avif"):
+        formats.append(AVIF)
+    else:
+        logger.warning("Pillow was built without AVIF support, only WebP derivatives will be created")
+    formats.append(WEBP)
+    return tuple(formats)
+
+
+def _target_widths(original_width: int) -> list[int]:
+    # never upscale, but always offer the full resolution (up to the largest bucket), since the buckets below it would
+    # otherwise leave browsers that need more pixels than the nearest smaller bucket with a blurry, upscaled image
+    largest_width = min(original_width, WIDTH_BUCKETS[-1])
+    return [width for width in WIDTH_BUCKETS if width < largest_width] + [largest_width]
+
+
+def _derived_name(source_path: Path, digest: str, width: int, output_format: OutputFormat) -> str:
+    return f"{source_path.stem}-{digest[:DIGEST_LENGTH_IN_NAME]}-{width}w.{output_format.extension}"
+
+
+def _transcode(job: _TranscodeJob) -> DerivedImage:
+    # runs in a worker process, so it only gets picklable arguments and returns a picklable result
+    with Image.open(job.source_path) as opened:
+        # bake the EXIF orientation into the pixels, since the EXIF data itself (camera details, GPS, etc.) is dropped
+        image = ImageOps.exif_transpose(opened)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    variants: list[DerivedVariant] = []
+    for output_format in job.formats:
+        for width in _target_widths(image.width):
+            height = round(image.height * width / image.width)
+            name = _derived_name(job.source_path, job.digest, width, output_format)
+            output_path = job.output_dir / name
+            if not output_path.exists():  # the name contains the source digest, so an existing file is always current
+                resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)  # pyright: ignore[reportUnknownMemberType] # Pillow's stubs leave the numpy array size type unresolved
+                tmp_path = output_path.with_name(f".{name}.tmp")
+                # no exif/icc_profile arguments are passed, so none of the source metadata is written to the output
+                resized.save(tmp_path, format=output_format.pillow_format, **dict(output_format.save_options))
+                _ = tmp_path.replace(output_path)
+            variants.append(
+                DerivedVariant(
+                    src=f"/{DERIVED_DIRECTORY_NAME}/{name}", width=width, height=height, type=output_format.mime_type
+                )
+            )
+    return DerivedImage(digest=job.digest, width=image.width, height=image.height, variants=tuple(variants))
+
+
+def find_source_images(public_dir: Path) -> dict[str, Path]:
+    """Find every photo in the public directory, keyed by the URL path the site references it by."""
+    sources: dict[str, Path] = {}
+    for dir_path, dir_names, file_names in os.walk(public_dir):
+        if Path(dir_path) == public_dir:
+            dir_names[:] = [name for name in dir_names if name != DERIVED_DIRECTORY_NAME]
+        for file_name in file_names:
+            path = Path(dir_path) / file_name
+            if path.suffix.lower() in SOURCE_EXTENSIONS:
+                sources[f"/{path.relative_to(public_dir).as_posix()}"] = path
+    return dict(sorted(sources.items()))
+
+
+def _load_derived_manifest(manifest_path: Path) -> dict[str, DerivedImage]:
+    if not manifest_path.exists():
+        return {}
+    try:
+        raw: dict[str, Any] = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if raw.get("version") != DERIVED_MANIFEST_VERSION:
+            return {}
+        return {
+            public_path: DerivedImage(
+                digest=image["digest"],
+                width=image["width"],
+                height=image["height"],
+                variants=tuple(DerivedVariant(**variant) for variant in image["variants"]),
+            )
+            for public_path, image in raw["images"].items()
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring corrupt derived image manifest {manifest_path}", exc_info=True)
+        return {}
+
+
+def build_image_derivatives(
+    public_dir: Path,
+    *,
+    hash_cache: HashCache | None = None,
+    formats: Sequence[OutputFormat] | None = None,
+    max_workers: int | None = None,
+) -> dict[str, DerivedImage]:
+    """Create the derivatives for every photo in the public directory and write the manifest describing them.
+
+    Only photos whose content isn't already in the previous manifest are transcoded. Derivatives of photos that have
+    since been changed or removed are deleted.
+    """
+    output_dir = public_dir / DERIVED_DIRECTORY_NAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / DERIVED_MANIFEST_NAME
+    formats = tuple(formats) if formats is not None else available_formats()
+    previous = _load_derived_manifest(manifest_path)
+
+    sources = find_source_images(public_dir)
+    digests: dict[str, str] = {}
+    paths_to_hash: dict[str, Path] = {}
+    for public_path, source_path in sources.items():
+        cached_digest = hash_cache.get(source_path, source_path.stat()) if hash_cache is not None else None
+        if cached_digest is None:
+            paths_to_hash[public_path] = source_path
+        else:
+            digests[public_path] = cached_digest
+    for public_path, digest in zip(
+        paths_to_hash, hash_files(list(paths_to_hash.values()), max_workers=max_workers), strict=True
+    ):
+        digests[public_path] = digest
+        if hash_cache is not None:
+            hash_cache.put(paths_to_hash[public_path], paths_to_hash[public_path].stat(), digest)
+
+    derived: dict[str, DerivedImage] = {}
+    jobs: dict[str, _TranscodeJob] = {}
+    expected_types = {output_format.mime_type for output_format in formats}
+    for public_path, source_path in sources.items():
+        known = previous.get(public_path)
+        if (
+            known is not None
+            and known.digest == digests[public_path]
+            and {variant.type for variant in known.variants} == expected_types
+            and all((public_dir / variant.src.lstrip("/")).exists() for variant in known.variants)
+        ):
+            derived[public_path] = known
+            continue
+        jobs[public_path] = _TranscodeJob(
+            source_path=source_path, digest=digests[public_path], output_dir=output_dir, formats=formats
+        )
+    if jobs:
+        logger.info(f"Transcoding {len(jobs)} of {len(sources)} images")
+        # decoding, resizing and encoding are all CPU bound, and a separate process per core keeps every core busy
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            derived.update(zip(jobs, executor.map(_transcode, jobs.values()), strict=True))
+    derived = dict(sorted(derived.items()))
+
+    referenced_names = {DERIVED_MANIFEST_NAME} | {
+        Path(variant.src).name for image in derived.values() for variant in image.variants
+    }
+    for output_path in output_dir.iterdir():
+        if output_path.name not in referenced_names:
+            output_path.unlink()
+
+    tmp_path = manifest_path.with_name(f".{DERIVED_MANIFEST_NAME}.tmp")
+    _ = tmp_path.write_text(
+        json.dumps(
+            {
+                "version": DERIVED_MANIFEST_VERSION,
+                "images": {public_path: asdict(image) for public_path, image in derived.items()},
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    _ = tmp_path.replace(manifest_path)
+    source_bytes = sum(path.stat().st_size for path in sources.values())
+    derived_bytes = sum((output_dir / name).stat().st_size for name in referenced_names)
+    logger.info(
+        f"{len(derived)} images have derivatives, {source_bytes} bytes of originals vs {derived_bytes} bytes derived"
+    )
+    return derived
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    repo_root = Path(__file__).parent.parent.parent.parent
+    app_dir = repo_root / "rytermedia_app"
+    parser = argparse.ArgumentParser(description="Create responsive WebP/AVIF derivatives of the site's photos.")
+    _ = parser.add_argument("--public-dir", type=Path, default=app_dir / "public")
+    _ = parser.add_argument(
+        "--hash-cache",
+        type=Path,
+        default=app_dir / DEPLOY_CACHE_DIRECTORY_NAME / "file-hashes.json",
+        help="Where to cache digests",
+    )
+    _ = parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    hash_cache = HashCache(args.hash_cache)
+    _ = build_image_derivatives(args.public_dir, hash_cache=hash_cache, max_workers=args.max_workers)
+    hash_cache.save()
+
+
+if __name__ == "__main__":
+    main()
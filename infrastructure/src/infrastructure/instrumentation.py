@@ -0,0 +1,162 @@
+"""Records how long each phase of a deploy takes, and how much it read and allocated.
+
+Phases are marked with `phase(...)` anywhere in the program. Outside of `record_phases(...)` that returns a shared
+no-op context, so the markers cost next to nothing when tracing is disabled.
+
+The trace is written in the Chrome trace event format, which Perfetto (https://ui.perfetto.dev) and chrome://tracing
+can open directly.
+"""
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import AbstractContextManager
+from contextlib import contextmanager
+from contextlib import nullcontext
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from typing import Any
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMAT_VERSION = 1
+
+type AttributeValue = int | str
+
+
+class PhaseSpan(Protocol):
+    def set(self, **attributes: AttributeValue) -> None: ...
+
+
+class _DisabledSpan:
+    def set(self, **attributes: AttributeValue) -> None:
+        pass
+
+
+@dataclass(kw_only=True, slots=True)
+class RecordedPhase:
+    name: str
+    depth: int  # how many phases this one is nested inside
+    start_ns: int  # relative to when recording started
+    duration_ns: int = 0
+    memory_peak_bytes: int | None = None  # only recorded when tracing memory
+    attributes: dict[str, AttributeValue] = field(default_factory=dict[str, AttributeValue])
+
+    def set(self, **attributes: AttributeValue) -> None:
+        self.attributes.update(attributes)
+
+
+_DISABLED_PHASE = nullcontext(_DisabledSpan())
+
+
+class PhaseRecorder:
+    def __init__(self, *, trace_memory: bool) -> None:
+        super().__init__()
+        self.trace_memory = trace_memory
+        self.phases: list[RecordedPhase] = []  # in the order they started
+        self._started_ns = time.perf_counter_ns()
+        self._open: list[tuple[RecordedPhase, int]] = []  # with the highest peak seen in any of its nested phases
+
+    @contextmanager
+    def phase(self, name: str, **attributes: AttributeValue) -> Iterator[RecordedPhase]:
+        recorded = RecordedPhase(
+            name=name,
+            depth=len(self._open),
+            start_ns=time.perf_counter_ns() - self._started_ns,
+            attributes=dict(attributes),
+        )
+        self.phases.append(recorded)
+        self._open.append((recorded, 0))
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        try:
+            yield recorded
+        finally:
+            recorded.duration_ns = time.perf_counter_ns() - self._started_ns - recorded.start_ns
+            _, nested_peak = self._open.pop()
+            if self.trace_memory:
+                # tracemalloc only has a single peak counter, which every nested phase resets, so the nested phases'
+                # peaks are carried up to their parents
+                recorded.memory_peak_bytes = max(tracemalloc.get_traced_memory()[1], nested_peak)
+                if self._open:
+                    parent, parent_peak = self._open[-1]
+                    self._open[-1] = (parent, max(parent_peak, recorded.memory_peak_bytes))
+
+    def to_trace(self) -> dict[str, Any]:
+        pid = os.getpid()
+        events: list[dict[str, Any]] = []
+        for recorded in self.phases:
+            args: dict[str, Any] = dict(recorded.attributes)
+            if recorded.memory_peak_bytes is not None:
+                args["memory_peak_bytes"] = recorded.memory_peak_bytes
+            events.append(
+                {
+                    "name": recorded.name,
+                    "ph": "X",  # a complete event, with both its start and its duration
+                    "ts": recorded.start_ns / 1000,
+                    "dur": recorded.duration_ns / 1000,
+                    "pid": pid,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"version": TRACE_FORMAT_VERSION, "trace_memory": self.trace_memory},
+        }
+
+    def write_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        _ = tmp_path.write_text(json.dumps(self.to_trace(), indent=2), encoding="utf-8")
+        _ = tmp_path.replace(path)
+
+    def format_summary(self) -> str:
+        lines = [f"{'phase':<40} {'ms':>10} {'peak MiB':>10}  details"]
+        for recorded in self.phases:
+            name = f"{'  ' * recorded.depth}{recorded.name}"
+            peak = "" if recorded.memory_peak_bytes is None else f"{recorded.memory_peak_bytes / 2**20:.1f}"
+            details = " ".join(f"{key}={value}" for key, value in recorded.attributes.items())
+            lines.append(f"{name:<40} {recorded.duration_ns / 1e6:>10.1f} {peak:>10}  {details}")
+        return "\n".join(lines)
+
+
+_active_recorder: PhaseRecorder | None = None
+
+
+def phase(name: str, **attributes: AttributeValue) -> AbstractContextManager[PhaseSpan]:
+    """Mark a phase of the deploy, whose span can be given more attributes (e.g. counts) once they're known."""
+    if _active_recorder is None:
+        return _DISABLED_PHASE
+    return _active_recorder.phase(name, **attributes)
+
+
+@contextmanager
+def record_phases(*, trace_path: Path | None, trace_memory: bool = False) -> Iterator[PhaseRecorder | None]:
+    """Record every phase marked within this context, then write the trace and log a summary of it.
+
+    Nothing is recorded when no `trace_path` is given.
+    """
+    global _active_recorder  # noqa: PLW0603 # a module level recorder saves threading it through every function
+    if trace_path is None:
+        yield None
+        return
+    started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    recorder = PhaseRecorder(trace_memory=trace_memory)
+    _active_recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _active_recorder = None
+        if started_tracemalloc:
+            tracemalloc.stop()
+        recorder.write_trace(trace_path)
+        logger.info(f"Deploy phases (trace written to {trace_path}):\n{recorder.format_summary()}")
@@ -0,0 +1,84 @@
+import shlex
+from collections.abc import Iterable
+from urllib.parse import quote
+
+INDEX_DOCUMENT = "index.html"
+ALL_PATHS = "/*"
+CACHE_WARMER_MODULE = "infrastructure.cache_warmer"
+
+
+def paths_for_key(s3_key: str) -> list[str]:
+    """Return every viewer-facing path that could be serving the object stored at the given S3 key.
+
+    The S3 website origin serves `blog/index.html` for `/blog/` (and redirects `/blog` there), so CloudFront can have
+    each of those cached separately. Paths are URL-encoded, as CloudFront requires for anything outside of ASCII letters,
+    digits and a few punctuation characters.
+    """
+    path = "/" + quote(s3_key.replace("\\", "/"))
+    if path == f"/{INDEX_DOCUMENT}":
+        return ["/", path]
+    if path.endswith(f"/{INDEX_DOCUMENT}"):
+        route = path.removesuffix(f"/{INDEX_DOCUMENT}")
+        return [route, f"{route}/", path]
+    return [path]
+
+
+def _collapse_to_depth(paths: Iterable[str], depth: int) -> set[str]:
+    collapsed: set[str] = set()
+    for path in paths:
+        segments = path.strip("/").split("/")
+        if len(segments) > depth:
+            collapsed.add("/" + "".join(f"{segment}/" for segment in segments[:depth]) + "*")
+        else:
+            collapsed.add(path)
+    return collapsed
+
+
+def compute_invalidation_paths(changed_keys: Iterable[str], *, max_paths: int) -> list[str]:
+    """Compute the CloudFront paths to invalidate for the S3 keys that were added, changed or deleted.
+
+    If there are more than `max_paths` individual paths, they get collapsed into wildcards on progressively shallower
+    directory prefixes until they fit, which ultimately ends at `/*`.
+    """
+    paths = {path for key in changed_keys for path in paths_for_key(key)}
+    if len(paths) <= max_paths:
+        return sorted(paths)
+    max_depth = max(len(path.strip("/").split("/")) for path in paths)
+    for depth in reversed(range(max_depth)):
+        collapsed = _collapse_to_depth(paths, depth)
+        if len(collapsed) <= max_paths:
+            return sorted(collapsed)
+    return [ALL_PATHS]  # only reachable if max_paths is less than 1
+
+
+def create_invalidation_command(*, distribution_id: str, paths: list[str], wait: bool = False) -> str:
+    """Build the command that invalidates the paths, and with `wait`, only exits once CloudFront has completed it."""
+    if not paths:
+        return "echo 'No changed assets, so nothing to invalidate'"
+    quoted_paths = " ".join(shlex.quote(path) for path in paths)
+    command = f"aws cloudfront create-invalidation --distribution-id {distribution_id} --paths {quoted_paths}"
+    if not wait:
+        return command
+    invalidation_id = f"$({command} --query Invalidation.Id --output text)"
+    wait_command = (
+        f'aws cloudfront wait invalidation-completed --distribution-id {distribution_id} --id "$INVALIDATION_ID"'
+    )
+    # the waiter gives up after 10 minutes, and the invalidation carries on regardless, so that's no reason to fail
+    return f"INVALIDATION_ID={invalidation_id} && ({wait_command} || echo 'Gave up waiting for the invalidation to complete')"
+
+
+def create_cache_warming_command(*, base_url: str, concurrency: int, max_requests_per_second: int) -> str:
+    # run through uv from the directory the deploy runs in, rather than by the path of this machine's interpreter, which
+    # would show up as a change in the Command whenever the deploy runs from another machine
+    arguments = [
+        "uv",
+        "run",
+        "python",
+        "-m",
+        CACHE_WARMER_MODULE,
+        f"--base-url={base_url}",
+        f"--concurrency={concurrency}",
+        f"--max-requests-per-second={max_requests_per_second}",
+    ]
+    # warming is only ever an optimization, so failing to isn't worth failing the deploy over
+    return f"{shlex.join(arguments)} || echo 'Failed to warm the cache'"
@@ -0,0 +1,261 @@
+"""Drives concurrent GET requests at an HTTP server with asyncio and measures each route it requested.
+
+Requests are written directly onto kept-alive connections, rather than going through an HTTP client library, so the
+time to first byte measured is as close to what the server took as this process can observe.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import ssl
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import field
+from urllib.parse import urlsplit
+
+DEFAULT_ACCEPT_ENCODING = "gzip, deflate, br"  # what browsers send
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS_PER_ROUTE = 20
+READ_LIMIT = 2**20  # the largest header line the stream reader will buffer
+# covers connecting, sending the request and reading the whole response, so a server that stops responding can't hang
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 30.0
+
+
+class IncompleteResponseError(Exception):
+    def __init__(self, path: str):
+        super().__init__(f"The connection closed before the response to {path} was complete")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Sample:
+    route: str
+    status: int
+    ttfb_seconds: float  # from writing the request to reading the status line
+    total_seconds: float
+    body_bytes: int  # as sent over the wire, so compressed when the response was
+    cache_status: str  # the X-Cache header, where the server sets one
+
+
+def _percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    return sorted_values[round(fraction * (len(sorted_values) - 1))]
+
+
+@dataclass(kw_only=True, slots=True)
+class RouteStats:
+    route: str
+    samples: list[Sample] = field(default_factory=list[Sample])
+
+    @property
+    def statuses(self) -> str:
+        return ",".join(sorted({str(sample.status) for sample in self.samples}))
+
+    @property
+    def body_bytes(self) -> int:
+        return sum(sample.body_bytes for sample in self.samples)
+
+    @property
+    def hit_ratio(self) -> float:
+        return sum(sample.cache_status.lower().startswith("hit") for sample in self.samples) / len(self.samples)
+
+    def ttfb_percentile(self, fraction: float) -> float:
+        return _percentile(sorted(sample.ttfb_seconds for sample in self.samples), fraction)
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class LoadReport:
+    routes: tuple[RouteStats, ...]  # in the order they were given
+    errors: int  # requests that never got a complete response, including those that timed out
+    abandoned: int  # requests never made (or cut short) because the deadline passed
+    elapsed_seconds: float
+
+    @property
+    def request_count(self) -> int:
+        return sum(len(stats.samples) for stats in self.routes)
+
+    @property
+    def body_bytes(self) -> int:
+        return sum(stats.body_bytes for stats in self.routes)
+
+    def format_summary(self) -> str:
+        columns = ("reqs", "status", "ttfb p50 ms", "ttfb p95 ms", "KiB/resp", "hit %")
+        lines = [" ".join([f"{'route':<48}", *(f"{column:>12}" for column in columns)])]
+        for stats in self.routes:
+            if not stats.samples:
+                continue
+            values = (
+                str(len(stats.samples)),
+                stats.statuses,
+                f"{stats.ttfb_percentile(0.5) * 1000:.2f}",
+                f"{stats.ttfb_percentile(0.95) * 1000:.2f}",
+                f"{stats.body_bytes / len(stats.samples) / 1024:.1f}",
+                f"{stats.hit_ratio * 100:.0f}",
+            )
+            lines.append(" ".join([f"{stats.route:<48}", *(f"{value:>12}" for value in values)]))
+        throughput = f"{self.request_count / self.elapsed_seconds:.0f} req/s"
+        bandwidth = f"{self.body_bytes / self.elapsed_seconds / 2**20:.1f} MiB/s of response bodies"
+        lines.append(
+            f"{self.request_count} requests ({self.errors} failed, {self.abandoned} abandoned) in {self.elapsed_seconds:.2f}s: {throughput}, {bandwidth}"
+        )
+        return "\n".join(lines)
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+async def _read_chunked_body(reader: asyncio.StreamReader) -> int:
+    body_bytes = 0
+    while chunk_size := int((await reader.readline()).split(b";")[0], 16):
+        body_bytes += len(await reader.readexactly(chunk_size))
+        _ = await reader.readline()  # the CRLF ending the chunk
+    _ = await _read_headers(reader)  # any trailers
+    return body_bytes
+
+
+class _Connection:
+    def __init__(self, *, host: str, port: int, ssl_context: ssl.SSLContext | None) -> None:
+        super().__init__()
+        self._host = host
+        self._port = port
+        self._ssl_context = ssl_context
+        self._streams: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None = None
+
+    async def close(self) -> None:
+        if self._streams is not None:
+            _, writer = self._streams
+            self._streams = None
+            writer.close()
+            with contextlib.suppress(OSError):  # the server already dropped it
+                await writer.wait_closed()
+
+    async def get(self, route: str, *, request: bytes) -> Sample:
+        if self._streams is None:
+            self._streams = await asyncio.open_connection(
+                self._host, self._port, ssl=self._ssl_context, limit=READ_LIMIT
+            )
+        reader, writer = self._streams
+        started = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        ttfb = time.perf_counter() - started
+        if not status_line:
+            raise IncompleteResponseError(route)
+        status = int(status_line.split()[1])
+        headers = await _read_headers(reader)
+        if "content-length" in headers:
+            body_bytes = len(await reader.readexactly(int(headers["content-length"])))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body_bytes = await _read_chunked_body(reader)
+        else:  # the body runs until the server closes the connection
+            body_bytes = len(await reader.read())
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return Sample(
+            route=route,
+            status=status,
+            ttfb_seconds=ttfb,
+            total_seconds=time.perf_counter() - started,
+            body_bytes=body_bytes,
+            cache_status=headers.get("x-cache", ""),
+        )
+
+
+class _RateLimiter:
+    """Spaces out requests evenly, however many workers are making them."""
+
+    def __init__(self, requests_per_second: float) -> None:
+        super().__init__()
+        self._interval = 1 / requests_per_second
+        self._next_slot = time.perf_counter()
+
+    async def wait(self) -> None:
+        # the event loop runs one worker at a time, so claiming the next slot needs no lock
+        now = time.perf_counter()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def run_load(  # noqa: PLR0913 # all keyword arguments besides what's being loaded
+    base_url: str,
+    routes: Sequence[str],
+    *,
+    requests_per_route: int = DEFAULT_REQUESTS_PER_ROUTE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    accept_encoding: str = DEFAULT_ACCEPT_ENCODING,
+    max_requests_per_second: float | None = None,
+    request_timeout_seconds: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    deadline_seconds: float | None = None,
+) -> LoadReport:
+    """Request every route `requests_per_route` times, interleaved, over `concurrency` kept-alive connections.
+
+    Routes are requested in the order given, and no faster than `max_requests_per_second` across all the connections.
+    Each request fails after `request_timeout_seconds`, and whatever is left once `deadline_seconds` have passed is
+    abandoned, with the report covering the requests made until then.
+    """
+    url = urlsplit(base_url)
+    is_https = url.scheme == "https"
+    host = url.hostname or "localhost"
+    port = url.port or (443 if is_https else 80)
+    ssl_context = ssl.create_default_context() if is_https else None
+    path_prefix = url.path.rstrip("/")
+    stats = {route: RouteStats(route=route) for route in routes}
+    pending: asyncio.Queue[str] = asyncio.Queue()
+    for route in itertools.chain.from_iterable(itertools.repeat(routes, requests_per_route)):
+        pending.put_nowait(route)
+    total_requests = pending.qsize()
+    errors = 0
+    rate_limiter = None if max_requests_per_second is None else _RateLimiter(max_requests_per_second)
+
+    async def worker() -> None:
+        nonlocal errors
+        connection = _Connection(host=host, port=port, ssl_context=ssl_context)
+        try:
+            while not pending.empty():
+                route = pending.get_nowait()
+                if rate_limiter is not None:
+                    await rate_limiter.wait()
+                request_lines = (
+                    f"GET {path_prefix}{route} HTTP/1.1",
+                    f"Host: {url.netloc}",
+                    f"Accept-Encoding: {accept_encoding}",
+                    "Connection: keep-alive",
+                )
+                request = "".join(f"{line}\r\n" for line in (*request_lines, "")).encode("latin-1")
+                try:
+                    async with asyncio.timeout(request_timeout_seconds):
+                        sample = await connection.get(route, request=request)
+                    stats[route].samples.append(sample)
+                except (
+                    TimeoutError,
+                    OSError,
+                    ValueError,
+                    IndexError,
+                    asyncio.IncompleteReadError,
+                    IncompleteResponseError,
+                ):
+                    errors += 1
+                    await connection.close()  # start over on a fresh connection, like a browser would
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    with contextlib.suppress(TimeoutError):
+        async with asyncio.timeout(deadline_seconds), asyncio.TaskGroup() as task_group:
+            for _ in range(concurrency):
+                _ = task_group.create_task(worker())
+    completed = sum(len(route_stats.samples) for route_stats in stats.values())
+    return LoadReport(
+        routes=tuple(stats[route] for route in routes),
+        errors=errors,
+        abandoned=total_requests - completed - errors,
+        elapsed_seconds=time.perf_counter() - started,
+    )
@@ -1,8 +1,7 @@
-import hashlib
 import logging
-import mimetypes
-import os
 from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import replace
 from pathlib import Path
 
 import pulumi
@@ -12,10 +11,13 @@ from ephemeral_pulumi_deploy import common_tags_native
 from ephemeral_pulumi_deploy import get_aws_account_id
 from ephemeral_pulumi_deploy import get_config_str
 from ephemeral_pulumi_deploy.utils import PROTECTED_ENVS
+from ephemeral_pulumi_deploy.utils import get_config_bool
+from ephemeral_pulumi_deploy.utils import get_config_int
 from lab_auto_pulumi import ManualArtifactsBucket
+from pulumi import CustomResource
 from pulumi import Output
-from pulumi import Resource
 from pulumi import ResourceOptions
+from pulumi import StackReference
 from pulumi import export
 from pulumi_aws.acm import Certificate
 from pulumi_aws.acm.outputs import CertificateDomainValidationOption
@@ -27,74 +29,307 @@ from pulumi_aws_native import cloudfront
 from pulumi_aws_native import s3
 from pulumi_command.local import Command
 
+from .asset_manifest import ManifestEntry
+from .asset_manifest import load_manifest
+from .asset_manifest import save_manifest
+from .asset_scanner import AssetSnapshot
+from .asset_scanner import scan_assets
+from .cache_control import DEFAULT_CACHE_CONTROL_POLICY
+from .cloudfront_behaviors import HTTP_VERSION
+from .cloudfront_behaviors import build_cache_behaviors
+from .cloudfront_behaviors import build_origin_shield
+from .cloudfront_behaviors import create_cache_policies
+from .compression import CompressedVariant
+from .compression import compress_assets
+from .constants import DEPLOY_CACHE_DIRECTORY_NAME
+from .file_hashing import combine_digests
+from .hash_cache import HashCache
+from .instrumentation import phase
+from .instrumentation import record_phases
+from .invalidation import ALL_PATHS
+from .invalidation import compute_invalidation_paths
+from .invalidation import create_cache_warming_command
+from .invalidation import create_invalidation_command
 from .jinja_constants import APP_DIRECTORY_NAME
 from .jinja_constants import APP_DOMAIN_NAME
 from .jinja_constants import ATTACH_ACM_CERT_TO_CLOUDFRONT
+from .s3_sync import ReleaseOptions
+from .s3_sync import S3Sync
+from .s3_sync import build_sync_entries
+from .s3_sync import release_prefix
 
 RAW_DOMAIN_NAME = APP_DOMAIN_NAME.removeprefix("www.")
+ASSET_UPLOAD_MODE_PER_FILE = "per-file"
+ASSET_UPLOAD_MODE_BULK = "bulk"
+ASSET_UPLOAD_MODE_RELEASES = "releases"
+ASSET_MANIFEST_DIGEST_OUTPUT = "app-asset-manifest-digest"
 
 logger = logging.getLogger(__name__)
 
 repo_root = Path(__file__).parent.parent.parent.parent
 
 
-def _get_mime_type(file_path: Path) -> str:
-    content_type, _ = mimetypes.guess_type(file_path)
-    if content_type == "text/javascript":
-        return "application/javascript"  # for some reason in CI, it was returning text/javascript
-    return content_type or "application/octet-stream"
+def compute_directory_hash(snapshot: AssetSnapshot) -> str:
+    """Compute a hash of all files in a directory based on their paths and content."""
+    return combine_digests((record.key, record.digest) for record in snapshot.records)
 
 
-def _compute_directory_hash(base_dir: Path) -> str:
-    """Compute a hash of all files in a directory based on their paths and content."""
-    hash_md5 = hashlib.md5()  # noqa: S324 # we don't care about security here, just if files have changed for creating the invalidation
-
-    for dirpath, _, filenames in sorted(os.walk(base_dir)):
-        for filename in sorted(filenames):
-            file_path = Path(dirpath) / filename
-            rel_path = os.path.relpath(file_path, base_dir)
-
-            # Hash the relative path
-            hash_md5.update(rel_path.encode())
-
-            with file_path.open("rb") as f:
-                hash_md5.update(f.read())
-
-    return hash_md5.hexdigest()
-
-
-def _upload_assets_to_s3(*, bucket_id: Output[str], base_dir: Path) -> list[Resource]:
-    uploads: list[Resource] = []
-    for dirpath, _, filenames in os.walk(base_dir):
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-            relative_path = Path("..") / file_path.relative_to(
-                repo_root
-            )  # ensure that the FileAsset path will work both locally and in CI by using a relative path
-
-            # Compute the S3 key relative to the base directory.
-            # For example, if base_dir is "./upload-dir" and file_path is "./upload-dir/docs/readme.txt",
-            # then s3_key will be "docs/readme.txt".
-            s3_key = os.path.relpath(file_path, base_dir)
-            # Since resource names cannot have slashes, we replace them with dashes.
-            resource_name = append_resource_suffix(s3_key.replace(os.sep, "-"), max_length=200)
-            source_hash = hashlib.md5(file_path.read_bytes()).hexdigest()  # noqa: S324 # we're just using this for change detection, not security
-            uploads.append(
-                BucketObjectv2(
-                    resource_name,
-                    content_type=_get_mime_type(file_path),
-                    bucket=bucket_id,
-                    key=s3_key,
-                    source=pulumi.FileAsset(str(relative_path)),
-                    source_hash=source_hash,
-                    tags=common_tags(),
-                )
+def _manifest_digest(manifest: dict[str, ManifestEntry]) -> str:
+    return combine_digests((key, f"{entry.source_hash}:{entry.content_type}") for key, entry in manifest.items())
+
+
+@dataclass(frozen=True, kw_only=True)
+class UploadedAssets:
+    resources: list[CustomResource]
+    changed_keys: frozenset[str]  # keys added, modified or deleted since the last deploy recorded in the manifest
+    origin_path: Output[str] | None = None  # the release CloudFront serves, when the assets are uploaded as releases
+
+
+def upload_assets_to_s3(  # noqa: PLR0913 # all keyword arguments
+    *,
+    bucket_id: Output[str],
+    snapshot: AssetSnapshot,
+    previous_manifest: dict[str, ManifestEntry],
+    manifest_path: Path,
+    compressed_variants: dict[str, CompressedVariant],
+    root_dir: Path,
+) -> UploadedAssets:
+    """Register an S3 object resource for every file in the snapshot.
+
+    The files (and their compressed variants) have to be somewhere under `root_dir`, which Pulumi runs the program
+    from a directory inside of.
+    """
+    current_manifest: dict[str, ManifestEntry] = {}
+    uploads: list[CustomResource] = []
+    for record in snapshot.records:
+        compressed_variant = compressed_variants.get(record.key)
+        source_path = record.path if compressed_variant is None else compressed_variant.path
+        relative_path = Path("..") / source_path.relative_to(
+            root_dir
+        )  # ensure that the FileAsset path will work both locally and in CI by using a relative path
+        # Since resource names cannot have slashes, we replace them with dashes.
+        resource_name = append_resource_suffix(record.key.replace("/", "-"), max_length=200)
+        current_manifest[record.key] = record.to_manifest_entry()
+        uploads.append(
+            BucketObjectv2(
+                resource_name,
+                content_type=record.content_type,
+                content_encoding=None if compressed_variant is None else compressed_variant.content_encoding,
+                cache_control=DEFAULT_CACHE_CONTROL_POLICY.resolve(record.key),
+                bucket=bucket_id,
+                key=record.key,
+                source=pulumi.FileAsset(str(relative_path)),
+                source_hash=record.digest
+                if compressed_variant is None
+                else f"{record.digest}-{compressed_variant.content_encoding}",
+                tags=common_tags(),
+            )
+        )
+    return _track_uploaded_assets(
+        resources=uploads,
+        previous_manifest=previous_manifest,
+        current_manifest=current_manifest,
+        manifest_path=manifest_path,
+    )
+
+
+def _sync_assets_to_s3(  # noqa: PLR0913 # all keyword arguments, mirroring upload_assets_to_s3
+    *,
+    bucket_id: Output[str],
+    snapshot: AssetSnapshot,
+    previous_manifest: dict[str, ManifestEntry],
+    manifest_path: Path,
+    compressed_variants: dict[str, CompressedVariant],
+    sync_manifest_path: Path,
+    max_workers: int,
+    release: ReleaseOptions | None,
+) -> UploadedAssets:
+    sync = S3Sync(
+        # a separate resource, so that switching to releases and back cleans up after the other layout
+        append_resource_suffix("app-assets-sync" if release is None else "app-assets-releases"),
+        bucket=bucket_id,
+        manifest_path=sync_manifest_path,
+        entries=build_sync_entries(snapshot.records, compressed_variants),
+        max_workers=max_workers,
+        release=release,
+    )
+    export("app-assets-bytes-deduplicated", sync.bytes_deduplicated)
+    uploaded_assets = _track_uploaded_assets(
+        resources=[sync],
+        previous_manifest=previous_manifest,
+        current_manifest={record.key: record.to_manifest_entry() for record in snapshot.records},
+        manifest_path=manifest_path,
+    )
+    if release is None:
+        return uploaded_assets
+    export("app-asset-releases", sync.releases)
+    export("app-asset-served-release", release.served_release_id)
+    served_path = "/" + release_prefix(release.served_release_id).rstrip("/")
+    # derived from the sync's output, so the distribution only switches over once the release is completely uploaded
+    return replace(uploaded_assets, origin_path=sync.releases.apply(lambda _: served_path))
+
+
+def _release_options(snapshot: AssetSnapshot) -> ReleaseOptions:
+    release_id = compute_directory_hash(snapshot)
+    return ReleaseOptions(
+        release_id=release_id,
+        served_release_id=get_config_str("proj:asset_served_release") or release_id,
+        retention=get_config_int("proj:asset_release_retention"),
+    )
+
+
+def _release_invalidation_keys(
+    *,
+    release: ReleaseOptions,
+    snapshot: AssetSnapshot,
+    previous_manifest: dict[str, ManifestEntry],
+    changed_keys: frozenset[str],
+    served_release_path: Path,
+) -> frozenset[str]:
+    """Only files that changed in place need invalidating, since the ones added are new to every cache too.
+
+    That only holds when going from the release of the last build to the next one. Rolling back to an earlier release,
+    or forward from one, changes what's served in ways the manifest doesn't know about, so everything gets invalidated.
+    """
+    current_keys = frozenset(record.key for record in snapshot.records)
+    previously_served = served_release_path.read_text().strip() if served_release_path.exists() else None
+    previous_release_id = combine_digests((key, entry.source_hash) for key, entry in previous_manifest.items())
+    if release.served_release_id != release.release_id or previously_served not in (None, previous_release_id):
+        return current_keys | previous_manifest.keys()
+    return frozenset(key for key in changed_keys if key in current_keys and key in previous_manifest)
+
+
+def _record_served_release(served_release_path: Path, release_id: str) -> None:
+    served_release_path.parent.mkdir(parents=True, exist_ok=True)
+    _ = served_release_path.write_text(release_id, encoding="utf-8")
+
+
+def _track_uploaded_assets(
+    *,
+    resources: list[CustomResource],
+    previous_manifest: dict[str, ManifestEntry],
+    current_manifest: dict[str, ManifestEntry],
+    manifest_path: Path,
+) -> UploadedAssets:
+    changed_keys = frozenset(
+        key
+        for key in previous_manifest.keys() | current_manifest.keys()
+        if key not in previous_manifest
+        or key not in current_manifest
+        or previous_manifest[key].source_hash != current_manifest[key].source_hash
+        or previous_manifest[key].content_type != current_manifest[key].content_type
+    )
+    logger.info(f"{len(changed_keys)} assets added, changed or deleted since the last deploy")
+    current_digest = _manifest_digest(current_manifest)
+    # recorded in the stack itself, so the next deploy can tell whether the manifest it finds locally is this one
+    export(
+        ASSET_MANIFEST_DIGEST_OUTPUT,
+        Output.all(*[resource.id for resource in resources]).apply(lambda _: current_digest),
+    )
+    if not pulumi.runtime.is_dry_run():
+        # only record the manifest once every upload has actually succeeded, so a failed deploy gets retried in full
+        _ = Output.all(*[resource.id for resource in resources]).apply(
+            lambda _: save_manifest(manifest_path, current_manifest)
+        )
+    return UploadedAssets(resources=resources, changed_keys=changed_keys)
+
+
+def _prepare_assets(
+    static_files_dir: Path, *, manifest_path: Path
+) -> tuple[dict[str, ManifestEntry], AssetSnapshot, dict[str, CompressedVariant]]:
+    deploy_cache_dir = repo_root / APP_DIRECTORY_NAME / DEPLOY_CACHE_DIRECTORY_NAME
+    with phase("load_manifest") as span:
+        previous_manifest = load_manifest(manifest_path)
+        span.set(entries=len(previous_manifest))
+    with phase("scan_assets") as span:
+        hash_cache = HashCache(deploy_cache_dir / "file-hashes.json")
+        snapshot = scan_assets(static_files_dir, known_entries=previous_manifest, hash_cache=hash_cache)
+        hash_cache.save()
+        span.set(
+            files=len(snapshot.records),
+            bytes=sum(record.size for record in snapshot.records),
+            bytes_read=snapshot.bytes_read,
+        )
+    with phase("compress_assets") as span:
+        compressed_variants = compress_assets(
+            snapshot.records, cache_dir=deploy_cache_dir / "compressed", owner=pulumi.get_stack()
+        )
+        span.set(variants=len(compressed_variants))
+    return previous_manifest, snapshot, compressed_variants
+
+
+def _invalidate_distribution(  # noqa: PLR0913 # all keyword arguments
+    *,
+    distribution_id: Output[str],
+    snapshot: AssetSnapshot,
+    previous_manifest: dict[str, ManifestEntry],
+    uploaded_assets: UploadedAssets,
+    release: ReleaseOptions | None,
+    wait_for_completion: bool,
+) -> Command:
+    served_release_path = (
+        repo_root / APP_DIRECTORY_NAME / DEPLOY_CACHE_DIRECTORY_NAME / f"served-release.{pulumi.get_stack()}"
+    )
+    with phase("invalidation_paths") as span:
+        directory_hash = compute_directory_hash(snapshot)
+        invalidation_keys = (
+            uploaded_assets.changed_keys
+            if release is None
+            else _release_invalidation_keys(
+                release=release,
+                snapshot=snapshot,
+                previous_manifest=previous_manifest,
+                changed_keys=uploaded_assets.changed_keys,
+                served_release_path=served_release_path,
+            )
+        )
+        invalidation_paths = compute_invalidation_paths(
+            invalidation_keys, max_paths=get_config_int("proj:cloudfront_invalidation_max_paths")
+        )
+        span.set(paths=len(invalidation_paths))
+    # rolling back to another release of the same build still needs to run the invalidation again
+    deploy_marker = directory_hash if release is None else f"{directory_hash}-{release.served_release_id}"
+    # the manifest is only on the machine that last deployed from this checkout, so the changes computed against it
+    # can only be trusted when it's the manifest the stack recorded for its last deploy, e.g. not after a CI deploy
+    last_deploy = StackReference(
+        append_resource_suffix("app-last-deploy"),
+        stack_name=f"{pulumi.get_organization()}/{pulumi.get_project()}/{pulumi.get_stack()}",
+    )
+    previous_manifest_digest = _manifest_digest(previous_manifest)
+
+    def _invalidation_command(resolved_id: str, deployed_manifest_digest: object) -> str:
+        paths = invalidation_paths
+        if deployed_manifest_digest != previous_manifest_digest:
+            logger.warning(
+                "The local asset manifest isn't the one last deployed to the stack, so invalidating everything"
             )
-    return uploads
+            paths = [ALL_PATHS]
+        return f"{create_invalidation_command(distribution_id=resolved_id, paths=paths, wait=wait_for_completion)} && echo {deploy_marker}"
+
+    invalidation = Command(
+        append_resource_suffix("app-cloudfront-invalidation"),
+        create=Output.all(distribution_id, last_deploy.get_output(ASSET_MANIFEST_DIGEST_OUTPUT)).apply(
+            lambda args: _invalidation_command(args[0], args[1])
+        ),
+        opts=ResourceOptions(depends_on=uploaded_assets.resources),
+    )
+    if release is not None and not pulumi.runtime.is_dry_run():
+        served_release_id = release.served_release_id
+        _ = invalidation.id.apply(lambda _: _record_served_release(served_release_path, served_release_id))
+    return invalidation
 
 
 def pulumi_program() -> None:
     """Execute creating the stack."""
+    trace_file = get_config_str("proj:deploy_trace_file")
+    with record_phases(
+        trace_path=repo_root / APP_DIRECTORY_NAME / DEPLOY_CACHE_DIRECTORY_NAME / trace_file if trace_file else None,
+        trace_memory=get_config_bool("proj:deploy_trace_memory"),
+    ):
+        _create_resources()
+
+
+def _create_resources() -> None:
     aws_account_id = get_aws_account_id()
     export("aws-account-id", aws_account_id)
     env = get_config_str("proj:env")
@@ -138,8 +373,44 @@ def pulumi_program() -> None:
         policy_document=policy_json,
     )
     static_files_dir = repo_root / APP_DIRECTORY_NAME / ".output" / "public"
+    # kept outside of .output, since `nuxt generate` wipes that directory on every build
+    manifest_path = (
+        repo_root / APP_DIRECTORY_NAME / DEPLOY_CACHE_DIRECTORY_NAME / f"asset-manifest.{pulumi.get_stack()}.json"
+    )
+
+    previous_manifest, snapshot, compressed_variants = _prepare_assets(static_files_dir, manifest_path=manifest_path)
 
-    all_uploads = _upload_assets_to_s3(bucket_id=app_website_bucket.id, base_dir=static_files_dir)
+    asset_upload_mode = get_config_str("proj:asset_upload_mode")
+    stack = pulumi.get_stack()
+    release = _release_options(snapshot) if asset_upload_mode == ASSET_UPLOAD_MODE_RELEASES else None
+    # resources are only registered here, their creation is timed per resource by Pulumi itself
+    with phase("register_assets", mode=asset_upload_mode) as span:
+        if asset_upload_mode in (ASSET_UPLOAD_MODE_BULK, ASSET_UPLOAD_MODE_RELEASES):
+            uploaded_assets = _sync_assets_to_s3(
+                bucket_id=app_website_bucket.id,
+                snapshot=snapshot,
+                previous_manifest=previous_manifest,
+                manifest_path=manifest_path,
+                compressed_variants=compressed_variants,
+                sync_manifest_path=repo_root
+                / APP_DIRECTORY_NAME
+                / DEPLOY_CACHE_DIRECTORY_NAME
+                / f"s3-sync.{stack}.json",
+                max_workers=get_config_int("proj:asset_upload_concurrency"),
+                release=release,
+            )
+        elif asset_upload_mode == ASSET_UPLOAD_MODE_PER_FILE:
+            uploaded_assets = upload_assets_to_s3(
+                bucket_id=app_website_bucket.id,
+                snapshot=snapshot,
+                previous_manifest=previous_manifest,
+                manifest_path=manifest_path,
+                compressed_variants=compressed_variants,
+                root_dir=repo_root,
+            )
+        else:
+            raise ValueError(f"Unknown asset upload mode {asset_upload_mode!r}")  # noqa: TRY003 # not worth a custom exception for this
+        span.set(resources=len(uploaded_assets.resources), changed=len(uploaded_assets.changed_keys))
     if env in PROTECTED_ENVS:
         certificate = Certificate(
             append_resource_suffix("certificate"),
@@ -158,6 +429,9 @@ def pulumi_program() -> None:
                 ssl_support_method="sni-only",
                 minimum_protocol_version="TLSv1.2_2021",
             )
+        default_cache_behavior, cache_behaviors = build_cache_behaviors(
+            target_origin_id=origin_id, cache_policy_ids=create_cache_policies()
+        )
         app_cloudfront = cloudfront.Distribution(
             append_resource_suffix("app"),
             distribution_config=cloudfront.DistributionConfigArgs(
@@ -174,17 +448,22 @@ def pulumi_program() -> None:
                             origin_protocol_policy="http-only",
                             origin_ssl_protocols=["TLSv1.2"],
                         ),
+                        origin_shield=build_origin_shield(get_config_str("proj:cloudfront_origin_shield_region")),
+                        origin_path=uploaded_assets.origin_path,
                     )
                 ],
-                default_cache_behavior=cloudfront.DistributionDefaultCacheBehaviorArgs(
-                    target_origin_id=origin_id,
-                    viewer_protocol_policy="redirect-to-https",
-                    allowed_methods=["GET", "HEAD"],
-                    cached_methods=["GET", "HEAD"],
-                    forwarded_values=cloudfront.DistributionForwardedValuesArgs(
-                        query_string=False, cookies=cloudfront.DistributionCookiesArgs(forward="none")
-                    ),
-                ),
+                # the bucket's error document is looked up at its root, rather than in the release being served
+                custom_error_responses=None
+                if release is None
+                else [
+                    cloudfront.DistributionCustomErrorResponseArgs(
+                        error_code=error_code, response_code=404, response_page_path="/404.html"
+                    )
+                    for error_code in (403, 404)  # S3 responds with 403 to anyone not allowed to list the bucket
+                ],
+                default_cache_behavior=default_cache_behavior,
+                cache_behaviors=cache_behaviors,
+                http_version=HTTP_VERSION,
                 enabled=True,
                 ipv6_enabled=True,
                 default_root_object="index.html",
@@ -197,13 +476,31 @@ def pulumi_program() -> None:
         )
 
         export("app-cloudfront-domain-name", app_cloudfront.domain_name)
-        _ = Command(
-            append_resource_suffix("app-cloudfront-invalidation"),
-            create=app_cloudfront.id.apply(
-                lambda distribution_id: f'aws cloudfront create-invalidation --distribution-id {distribution_id} --paths "/*" && echo {_compute_directory_hash(static_files_dir)}'
-            ),
-            opts=ResourceOptions(depends_on=all_uploads),
+        cache_warming_concurrency = get_config_int("proj:cache_warming_concurrency")
+        invalidation = _invalidate_distribution(
+            distribution_id=app_cloudfront.id,
+            snapshot=snapshot,
+            previous_manifest=previous_manifest,
+            uploaded_assets=uploaded_assets,
+            release=release,
+            # otherwise the warming could fill the caches back up with what's being invalidated
+            wait_for_completion=cache_warming_concurrency > 0,
         )
+        if cache_warming_concurrency > 0:
+            warming_rate = get_config_int("proj:cache_warming_max_requests_per_second")
+            _ = Command(
+                append_resource_suffix("app-cloudfront-cache-warming"),
+                create=app_cloudfront.domain_name.apply(
+                    lambda domain_name: create_cache_warming_command(
+                        base_url=f"https://{domain_name}",
+                        concurrency=cache_warming_concurrency,
+                        max_requests_per_second=warming_rate,
+                    )
+                ),
+                # the invalidation runs again on every deploy that changes anything, and so does the warming
+                triggers=[invalidation.create],
+                opts=ResourceOptions(depends_on=[invalidation]),
+            )
 
         def _extract_host(options: Sequence[CertificateDomainValidationOption]) -> str:
             record_name = options[0].resource_record_name
@@ -1,13 +1,31 @@
+import argparse
 import logging
 from typing import Any
 
 from ephemeral_pulumi_deploy import run_cli
 from pulumi.automation import ConfigValue
 
-from .program import pulumi_program
+from .startup_profile import format_import_phases
+from .startup_profile import profile_imports
 
 logger = logging.getLogger(__name__)
 
+# parsed ahead of the arguments ephemeral_pulumi_deploy handles, since profiling doesn't need a stack
+startup_parser = argparse.ArgumentParser(add_help=False)
+_ = startup_parser.add_argument(
+    "--profile-startup",
+    action="store_true",
+    help="Report how long the CLI's imports take, aggregated by package, instead of running anything",
+)
+
+
+def pulumi_program() -> None:
+    """Execute creating the stack."""
+    # the provider SDKs take seconds to import, so that cost is only paid once the program actually runs
+    from .program import pulumi_program as program  # noqa: PLC0415 # deliberately deferred, see above
+
+    program()
+
 
 def generate_stack_config() -> dict[str, Any]:
     """Generate the stack configuration."""
@@ -18,10 +36,42 @@ def generate_stack_config() -> dict[str, Any]:
     stack_config["proj:github_repo_name"] = github_repo_name
 
     stack_config["proj:git_repository_url"] = ConfigValue(value=f"https://github.com/ejfine/{github_repo_name}")
+    # above this many paths, the CloudFront invalidation gets collapsed into wildcards on directory prefixes
+    stack_config["proj:cloudfront_invalidation_max_paths"] = ConfigValue(value="100")
+    # the AWS region to use for CloudFront Origin Shield, or blank to leave it disabled
+    stack_config["proj:cloudfront_origin_shield_region"] = ConfigValue(value="")
+    # "per-file" registers a BucketObjectv2 for every file, "bulk" syncs them all through a single S3Sync resource, and
+    # "releases" syncs each build under its own prefix in the bucket and points CloudFront's origin path at it
+    stack_config["proj:asset_upload_mode"] = ConfigValue(value="per-file")
+    # how many releases to keep in the bucket to roll back to, when uploading releases
+    stack_config["proj:asset_release_retention"] = ConfigValue(value="3")
+    # a kept release to serve instead of the one just built, to roll back to it, or blank to serve the latest build
+    stack_config["proj:asset_served_release"] = ConfigValue(value="")
+    # how many requests warming CloudFront's caches after a deploy makes at once, or 0 to not warm them. Warming makes
+    # the deploy wait for the invalidation to complete first, which can take several minutes, so it's off by default
+    stack_config["proj:cache_warming_concurrency"] = ConfigValue(value="0")
+    # the most requests per second warming the caches makes, to keep it from looking like an attack on the site
+    stack_config["proj:cache_warming_max_requests_per_second"] = ConfigValue(value="20")
+    # how many uploads and deletes the bulk sync runs at once
+    stack_config["proj:asset_upload_concurrency"] = ConfigValue(value="32")
+    # file name within the deploy cache to write a trace of the deploy phases to, or blank to not record one
+    stack_config["proj:deploy_trace_file"] = ConfigValue(value="deploy-trace.json")
+    # also record each phase's peak memory allocation, which makes the deploy noticeably slower while tracing
+    stack_config["proj:deploy_trace_memory"] = ConfigValue(value="False")
     return stack_config
 
 
 def main() -> None:
+    startup_args, _ = startup_parser.parse_known_args()
+    if startup_args.profile_startup:
+        phases = profile_imports(
+            [
+                ("CLI startup", "infrastructure.pulumi_deploy"),
+                ("Deferred until the program runs", "infrastructure.program"),
+            ]
+        )
+        print(format_import_phases(phases))  # noqa: T201 # this is a report for the terminal, not a log message
+        return
     run_cli(stack_config=generate_stack_config(), pulumi_program=pulumi_program)
 
 
@@ -0,0 +1,444 @@
+"""Which prerendered routes each source file of the site affects, so a change can be rebuilt and deployed incrementally.
+
+The graph runs from each content file, through the Nuxt Content collections it belongs to and the pages, components,
+layouts and error page that query those collections, to the routes those pages prerender (along with the SPA fallbacks
+the error page renders) and the files each route writes into the built site. Anything else in the app, pages and
+components included, goes into the JavaScript bundle every route loads, so changing it still means a full rebuild.
+
+Index the site after generating it, and later on, ask what a diff affects:
+`uv --directory=./infrastructure run python -m infrastructure.route_dependencies index`
+`uv --directory=./infrastructure run python -m infrastructure.route_dependencies affected --since origin/main`
+"""
+
+import argparse
+import json
+import logging
+import re
+import subprocess
+import sys
+from collections.abc import Iterable
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from pathlib import PurePosixPath
+from typing import Any
+
+from .cache_warmer import APP_DIR
+from .cache_warmer import DEFAULT_PUBLIC_DIR
+from .cache_warmer import prerendered_pages
+from .constants import DEPLOY_CACHE_DIRECTORY_NAME
+from .content_routes import CONTENT_CONFIG_FILE_NAME
+from .content_routes import CONTENT_DIRECTORY_NAME
+from .content_routes import PAGE_COLLECTION_TYPE
+from .content_routes import ContentCollection
+from .content_routes import content_files
+from .content_routes import load_collections
+from .content_routes import page_routes
+from .invalidation import INDEX_DOCUMENT
+from .invalidation import paths_for_key
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_FILE_NAME = "route-dependencies.json"
+SOURCE_DIRECTORY_NAME = "app"  # Nuxt 4's srcDir
+PUBLIC_DIRECTORY_NAME = "public"  # copied into the built site as is
+PAGES_DIRECTORY_NAME = "pages"
+COMPONENTS_DIRECTORY_NAME = "components"
+LAYOUTS_DIRECTORY_NAME = "layouts"
+APP_COMPONENT_FILE_NAME = "app.vue"
+ERROR_COMPONENT_FILE_NAME = "error.vue"
+# the SPA fallbacks Nuxt generates, which render the error component for any route that wasn't prerendered
+FALLBACK_ROUTES = ("/200.html", "/404.html")
+PAYLOAD_FILE_NAME = "_payload.json"
+OG_IMAGE_DIRECTORY = "__og-image__/static"
+NUXT_CONTENT_DIRECTORY = "__nuxt_content"  # where the database dump of each collection is served from
+ROUTE_PATH_ARGUMENT = "route.path"
+_QUERY_PATTERN = re.compile(r"""\b(queryCollection\w*)\(\s*(["'])(\w+)\2""")
+# only `queryCollection(...)` itself can be narrowed down to a single document, the navigation, search and
+# surroundings queries always read the whole collection
+_PATH_FILTER_PATTERN = re.compile(r"""\s*\)\s*\.path\(\s*(?:(["'])(.*?)\1|(route\.path))\s*\)""")
+_HTML_COMMENT_PATTERN = re.compile(r"<!--.*?-->", flags=re.DOTALL)
+_PASCAL_CASE_TAG_PATTERN = re.compile(r"<(?:Lazy)?([A-Z][A-Za-z0-9]*)")
+_KEBAB_CASE_TAG_PATTERN = re.compile(r"<(?:lazy-)?([a-z][a-z0-9]*(?:-[a-z0-9]+)+)")
+_CATCH_ALL_SEGMENT_PATTERN = re.compile(r"^\[\.\.\.\w+\]$")
+_OPTIONAL_SEGMENT_PATTERN = re.compile(r"^\[\[\w+\]\]$")
+_PARAMETER_PATTERN = re.compile(r"\\\[\w+\\\]")  # within a segment that's already been escaped
+_ROUTE_GROUP_PATTERN = re.compile(r"^\(.+\)$")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CollectionQuery:
+    collection: str
+    path: str | None = None  # only the document at this route, rather than the whole collection
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class _VueFile:
+    queries: frozenset[CollectionQuery]
+    components: frozenset[str]  # the names the file's template uses them by
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class _Page:
+    relative_path: str
+    pattern: re.Pattern[str]
+    rank: tuple[int, int, int]  # lower wins when several pages match a route, as in Vue Router
+    static_route: str | None  # for pages without any parameters, which only ever render the one route
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class RouteIndex:
+    dependents: dict[str, tuple[str, ...]]  # every content file, relative to the app directory -> its routes
+    route_outputs: dict[str, tuple[str, ...]]  # route -> the files prerendering it writes, relative to the built site
+    file_outputs: dict[str, tuple[str, ...]]  # content file -> any other files of the built site it's written into
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Impact:
+    full_rebuild: bool  # something every route may depend on changed, so the whole site has to be generated again
+    routes: tuple[str, ...]  # to prerender again
+    output_files: tuple[str, ...]  # to upload (or delete) again, relative to the built site
+
+    @property
+    def invalidation_paths(self) -> list[str]:
+        if self.full_rebuild:
+            return ["/*"]
+        return sorted({path for output_file in self.output_files for path in paths_for_key(output_file)})
+
+
+def _pascal_case(name: str) -> str:
+    return "".join(part[:1].upper() + part[1:] for part in re.split(r"[-_]", name) if part)
+
+
+def component_name(relative_path: PurePosixPath) -> str:
+    """Return the name Nuxt auto-imports a component by, from its path within the components directory."""
+    prefix = "".join(_pascal_case(part) for part in relative_path.parent.parts)
+    name = _pascal_case(relative_path.stem)
+    if name == "Index":
+        return prefix
+    return name if name.startswith(prefix) else f"{prefix}{name}"  # Nuxt drops a prefix the name already starts with
+
+
+def _parse_vue_file(text: str) -> _VueFile:
+    text = _HTML_COMMENT_PATTERN.sub("", text)
+    queries: set[CollectionQuery] = set()
+    for match in _QUERY_PATTERN.finditer(text):
+        path_filter = _PATH_FILTER_PATTERN.match(text, match.end()) if match.group(1) == "queryCollection" else None
+        path = None if path_filter is None else path_filter.group(2) or path_filter.group(3)
+        queries.add(CollectionQuery(collection=match.group(3), path=path))
+    components = {*_PASCAL_CASE_TAG_PATTERN.findall(text), *map(_pascal_case, _KEBAB_CASE_TAG_PATTERN.findall(text))}
+    return _VueFile(queries=frozenset(queries), components=frozenset(components))
+
+
+def _page(relative_path: str, pages_path: PurePosixPath) -> _Page:
+    segments = [segment for segment in pages_path.parent.parts if not _ROUTE_GROUP_PATTERN.match(segment)]
+    if pages_path.stem != "index":
+        segments.append(pages_path.stem)
+    pattern = ""
+    catch_alls = 0
+    parameters = 0
+    for segment in segments:
+        if _CATCH_ALL_SEGMENT_PATTERN.match(segment):
+            pattern += "(?:/.*)?"
+            catch_alls += 1
+        elif _OPTIONAL_SEGMENT_PATTERN.match(segment):
+            pattern += "(?:/[^/]+)?"
+            parameters += 1
+        else:
+            escaped = re.escape(segment)
+            pattern += "/" + _PARAMETER_PATTERN.sub("[^/]+", escaped)
+            parameters += escaped != _PARAMETER_PATTERN.sub("", escaped)
+    return _Page(
+        relative_path=relative_path,
+        pattern=re.compile(f"^{pattern or '/'}/?$"),
+        rank=(catch_alls, parameters, -len(segments)),
+        static_route="/" + "/".join(segments) if catch_alls == parameters == 0 else None,
+    )
+
+
+def _route_output_files(route: str, *, public_dir: Path) -> tuple[str, ...]:
+    directory = route.strip("/")
+    candidates = [f"{directory}/{name}".lstrip("/") for name in (INDEX_DOCUMENT, PAYLOAD_FILE_NAME)]
+    og_image_dir = public_dir / OG_IMAGE_DIRECTORY / directory
+    if og_image_dir.is_dir():
+        candidates.extend(path.relative_to(public_dir).as_posix() for path in og_image_dir.iterdir() if path.is_file())
+    if not public_dir.is_dir():  # not built yet, so everything prerendering could write
+        return tuple(sorted(candidates))
+    return tuple(sorted(candidate for candidate in candidates if (public_dir / candidate).is_file()))
+
+
+def _fallback_output_files(route: str, *, public_dir: Path) -> tuple[str, ...]:
+    output_file = route.removeprefix("/")
+    if public_dir.is_dir() and not (public_dir / output_file).is_file():
+        return ()
+    return (output_file,)
+
+
+def _collection_output_files(collection: str, *, public_dir: Path) -> tuple[str, ...]:
+    dump_dir = public_dir / NUXT_CONTENT_DIRECTORY / collection
+    if not dump_dir.is_dir():
+        return ()
+    return tuple(sorted(path.relative_to(public_dir).as_posix() for path in dump_dir.rglob("*") if path.is_file()))
+
+
+class _DependencyScanner:
+    """Resolves which vue files, and which collection queries, end up rendering each route."""
+
+    def __init__(self, source_dir: Path) -> None:
+        super().__init__()
+        self.vue_files = {
+            path.relative_to(source_dir.parent).as_posix(): _parse_vue_file(path.read_text(encoding="utf-8"))
+            for path in sorted(source_dir.rglob("*.vue"))
+        }
+        components_dir = source_dir / COMPONENTS_DIRECTORY_NAME
+        self._components = {
+            component_name(PurePosixPath(path.relative_to(components_dir).as_posix())): relative_path
+            for relative_path in self.vue_files
+            if (path := source_dir.parent / relative_path).is_relative_to(components_dir)
+        }
+        pages_dir = source_dir / PAGES_DIRECTORY_NAME
+        self.pages = [
+            _page(relative_path, PurePosixPath(path.relative_to(pages_dir).as_posix()))
+            for relative_path in self.vue_files
+            if (path := source_dir.parent / relative_path).is_relative_to(pages_dir)
+        ]
+        layouts_dir = source_dir / LAYOUTS_DIRECTORY_NAME
+        # every page renders within the app component and a layout
+        self.shell_files = [
+            relative_path
+            for relative_path in self.vue_files
+            if relative_path == f"{SOURCE_DIRECTORY_NAME}/{APP_COMPONENT_FILE_NAME}"
+            or (source_dir.parent / relative_path).is_relative_to(layouts_dir)
+        ]
+        # rendered instead of the app component, rather than within it
+        self.fallback_files = [
+            relative_path
+            for relative_path in self.vue_files
+            if relative_path == f"{SOURCE_DIRECTORY_NAME}/{ERROR_COMPONENT_FILE_NAME}"
+        ]
+
+    def page_for(self, route: str) -> _Page | None:
+        matching = [page for page in self.pages if page.pattern.match(route)]
+        return min(matching, key=lambda page: page.rank) if matching else None
+
+    def rendering_files(self, relative_path: str) -> set[str]:
+        """Return the vue file along with every component it renders, however deeply nested."""
+        found: set[str] = set()
+        pending = [relative_path]
+        while pending:
+            current = pending.pop()
+            if current in found:
+                continue
+            found.add(current)
+            # tags that aren't components of the app are HTML elements or come from a module, like Nuxt UI's
+            pending.extend(
+                self._components[name] for name in self.vue_files[current].components if name in self._components
+            )
+        return found
+
+
+def _documents_queried(
+    query: CollectionQuery, *, route: str, documents: dict[str, list[tuple[str, str | None]]]
+) -> Iterable[str]:
+    path = route if query.path == ROUTE_PATH_ARGUMENT else query.path
+    return (
+        relative_path
+        for relative_path, document_route in documents.get(query.collection, [])
+        if path is None or document_route == path
+    )
+
+
+def build_index(app_dir: Path, *, public_dir: Path) -> RouteIndex:
+    """Work out every route of the site and the content that goes into rendering each of them.
+
+    The routes are the ones prerendered into `public_dir` when it's been built, along with those of the content pages
+    and the pages without any parameters, which covers the routes a build would add.
+    """
+    collections = load_collections(app_dir / CONTENT_CONFIG_FILE_NAME)
+    content_dir = app_dir / CONTENT_DIRECTORY_NAME
+    scanner = _DependencyScanner(app_dir / SOURCE_DIRECTORY_NAME)
+    routes = set(page_routes(content_dir, collections))
+    if public_dir.is_dir():
+        routes.update(prerendered_pages(public_dir))
+    routes.update(page.static_route for page in scanner.pages if page.static_route is not None)
+
+    documents, file_outputs = _index_content(content_dir, collections, public_dir=public_dir)
+    dependents: dict[str, set[str]] = {relative_path: set() for relative_path in file_outputs}
+    route_outputs: dict[str, tuple[str, ...]] = {}
+    rendering_roots: dict[str, list[str]] = {}
+    for route in sorted(routes):
+        page = scanner.page_for(route)
+        if page is None:
+            logger.warning(f"No page renders {route}, so nothing is known to depend on it")
+            continue
+        route_outputs[route] = _route_output_files(route, public_dir=public_dir)
+        rendering_roots[route] = [page.relative_path, *scanner.shell_files]
+    if scanner.fallback_files:
+        for route in FALLBACK_ROUTES:
+            route_outputs[route] = _fallback_output_files(route, public_dir=public_dir)
+            rendering_roots[route] = scanner.fallback_files
+    for route, roots in rendering_roots.items():
+        rendering_files = {file for root in roots for file in scanner.rendering_files(root)}
+        for relative_path in rendering_files:
+            for query in scanner.vue_files[relative_path].queries:
+                for document in _documents_queried(query, route=route, documents=documents):
+                    dependents[document].add(route)
+    return RouteIndex(
+        dependents={relative_path: tuple(sorted(routes)) for relative_path, routes in sorted(dependents.items())},
+        route_outputs=route_outputs,
+        file_outputs={relative_path: outputs for relative_path, outputs in sorted(file_outputs.items()) if outputs},
+    )
+
+
+def _index_content(
+    content_dir: Path, collections: Sequence[ContentCollection], *, public_dir: Path
+) -> tuple[dict[str, list[tuple[str, str | None]]], dict[str, tuple[str, ...]]]:
+    """Return the documents of each collection with their routes, and the files of the built site each is dumped to."""
+    documents: dict[str, list[tuple[str, str | None]]] = {collection.name: [] for collection in collections}
+    file_outputs: dict[str, tuple[str, ...]] = {}
+    for relative_path in content_files(content_dir):
+        outputs: set[str] = set()
+        for collection in collections:
+            if (source := collection.source_for(relative_path)) is None:
+                continue
+            # data collections have no routes, but can still be queried by the path a route would have
+            documents[collection.name].append(
+                (
+                    f"{CONTENT_DIRECTORY_NAME}/{relative_path}",
+                    source.route_for(relative_path) if collection.type == PAGE_COLLECTION_TYPE else None,
+                )
+            )
+            outputs.update(_collection_output_files(collection.name, public_dir=public_dir))
+        file_outputs[f"{CONTENT_DIRECTORY_NAME}/{relative_path}"] = tuple(sorted(outputs))
+    return documents, file_outputs
+
+
+def load_index(index_path: Path) -> RouteIndex | None:
+    """Load the index saved by the last build, where a missing, unreadable or outdated one is just treated as absent."""
+    if not index_path.exists():
+        return None
+    try:
+        raw: dict[str, Any] = json.loads(index_path.read_text(encoding="utf-8"))
+        if raw.get("version") != INDEX_VERSION:
+            logger.info(f"Ignoring route dependency index {index_path} written with a different version")
+            return None
+        return RouteIndex(
+            **{
+                field_name: {key: tuple(values) for key, values in raw[field_name].items()}
+                for field_name in ("dependents", "route_outputs", "file_outputs")
+            }
+        )
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        logger.warning(f"Ignoring unreadable route dependency index {index_path}", exc_info=True)
+        return None
+
+
+def save_index(index_path: Path, index: RouteIndex) -> None:
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": INDEX_VERSION,
+        "dependents": index.dependents,
+        "route_outputs": index.route_outputs,
+        "file_outputs": index.file_outputs,
+    }
+    tmp_path = index_path.with_suffix(f"{index_path.suffix}.tmp")
+    _ = tmp_path.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+    _ = tmp_path.replace(index_path)
+
+
+def affected(changed_files: Iterable[str], *, indexes: Sequence[RouteIndex]) -> Impact:
+    """Work out what changing the given files, relative to the app directory, means for the build and the deploy.
+
+    Pass the index of the site as it was built last along with the one of the current tree: deleted files are only
+    in the former, added ones only in the latter, and routes that no longer exist still need their files removed.
+    """
+    routes: set[str] = set()
+    output_files: set[str] = set()
+    full_rebuild = False
+    for changed_file in changed_files:
+        if changed_file.startswith(f"{PUBLIC_DIRECTORY_NAME}/"):
+            output_files.add(changed_file.removeprefix(f"{PUBLIC_DIRECTORY_NAME}/"))
+            continue
+        indexed = [index for index in indexes if changed_file in index.dependents]
+        if not indexed:
+            logger.info(f"{changed_file} isn't tied to specific routes, so the whole site has to be generated again")
+            full_rebuild = True
+            continue
+        for index in indexed:
+            routes.update(index.dependents[changed_file])
+            output_files.update(index.file_outputs.get(changed_file, ()))
+    for index in indexes:
+        output_files.update(output for route in routes for output in index.route_outputs.get(route, ()))
+    return Impact(full_rebuild=full_rebuild, routes=tuple(sorted(routes)), output_files=tuple(sorted(output_files)))
+
+
+def changed_files_since(revision: str, *, app_dir: Path) -> list[str]:
+    """List the files of the app changed in the working tree since the revision, including untracked ones."""
+    diff_commands = (
+        ["git", "diff", "--name-only", "--no-renames", "--relative", revision, "--", "."],
+        ["git", "ls-files", "--others", "--exclude-standard", "--", "."],
+    )
+    changed: set[str] = set()
+    for command in diff_commands:
+        result = subprocess.run(command, cwd=app_dir, capture_output=True, text=True, check=True)  # noqa: S603 # the revision is passed as a single argument, never through a shell
+        changed.update(line for line in result.stdout.splitlines() if line)
+    return sorted(changed)
+
+
+def format_impact(impact: Impact) -> str:
+    lines = [f"Full rebuild: {'yes' if impact.full_rebuild else 'no'}", f"Routes to prerender ({len(impact.routes)}):"]
+    lines.extend(f"  {route}" for route in impact.routes)
+    lines.append(f"Files to upload ({len(impact.output_files)}):")
+    lines.extend(f"  {output_file}" for output_file in impact.output_files)
+    lines.append(f"Paths to invalidate: {' '.join(impact.invalidation_paths) or '-'}")
+    return "\n".join(lines)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Index which routes each source file affects, and query it by diff.")
+    _ = parser.add_argument("--app-dir", type=Path, default=APP_DIR)
+    _ = parser.add_argument("--public-dir", type=Path, default=DEFAULT_PUBLIC_DIR, help="The built site")
+    _ = parser.add_argument(
+        "--index-path",
+        type=Path,
+        default=None,
+        help=f"Where the index is saved, by default {DEPLOY_CACHE_DIRECTORY_NAME}/{INDEX_FILE_NAME} in the app",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _ = subparsers.add_parser("index", help="Index the site as it's currently built, and save the index")
+    affected_parser = subparsers.add_parser("affected", help="Report what a set of changed files affects")
+    changes_group = affected_parser.add_mutually_exclusive_group(required=True)
+    _ = changes_group.add_argument("--since", help="A git revision to diff the working tree against")
+    _ = changes_group.add_argument("--files", nargs="+", help="Changed files, relative to the app directory")
+    _ = affected_parser.add_argument("--json", action="store_true", help="Output JSON rather than a report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    index_path: Path = args.index_path or args.app_dir / DEPLOY_CACHE_DIRECTORY_NAME / INDEX_FILE_NAME
+    current_index = build_index(args.app_dir, public_dir=args.public_dir)
+    if args.command == "index":
+        save_index(index_path, current_index)
+        logger.info(f"Indexed {len(current_index.route_outputs)} routes into {index_path}")
+        return 0
+
+    changed_files: list[str] = args.files or changed_files_since(args.since, app_dir=args.app_dir)
+    previous_index = load_index(index_path)
+    if previous_index is None:
+        logger.warning(f"No saved index at {index_path}, so deleted files will be treated as affecting every route")
+    impact = affected(changed_files, indexes=[index for index in (previous_index, current_index) if index is not None])
+    if args.json:
+        output = {
+            "full_rebuild": impact.full_rebuild,
+            "routes": impact.routes,
+            "output_files": impact.output_files,
+            "invalidation_paths": impact.invalidation_paths,
+        }
+        print(json.dumps(output, indent=2))  # noqa: T201 # this is the output of the command
+    else:
+        logger.info(f"{len(changed_files)} changed files:\n{format_impact(impact)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,490 @@
+"""Syncs the static site to S3 as a single Pulumi resource, rather than one BucketObjectv2 per file."""
+
+import base64
+import json
+import logging
+from collections.abc import Collection
+from collections.abc import Mapping
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import replace
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import override
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from pulumi import Input
+from pulumi import Output
+from pulumi import ResourceOptions
+from pulumi.dynamic import CreateResult
+from pulumi.dynamic import DiffResult
+from pulumi.dynamic import Resource
+from pulumi.dynamic import ResourceProvider
+from pulumi.dynamic import UpdateResult
+
+from .asset_scanner import AssetRecord
+from .cache_control import DEFAULT_CACHE_CONTROL_POLICY
+from .cache_control import CacheControlPolicy
+from .compression import CompressedVariant
+from .file_hashing import combine_digests
+from .file_hashing import hash_files
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import CopyObjectRequestTypeDef
+    from mypy_boto3_s3.type_defs import ObjectIdentifierTypeDef
+    from mypy_boto3_s3.type_defs import PutObjectRequestTypeDef
+
+logger = logging.getLogger(__name__)
+
+SYNC_MANIFEST_VERSION = 1
+DEFAULT_MAX_WORKERS = 32
+DELETE_BATCH_SIZE = 1000  # the most keys a single DeleteObjects request accepts
+S3_CLOCK_RESOLUTION = timedelta(seconds=1)  # both the Date header and LastModified are only precise to the second
+RELEASES_PREFIX = "releases/"
+INDEX_DOCUMENT = "index.html"
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class SyncEntry:
+    key: str
+    path: str  # absolute path of the body to upload, which is the compressed variant when there is one
+    etag: str  # MD5 of the body, which is what S3 reports as the ETag of an object uploaded in a single part
+    content_type: str
+    content_encoding: str | None
+    cache_control: str
+
+    @property
+    def metadata(self) -> str:
+        return f"{self.content_type}|{self.content_encoding or ''}|{self.cache_control}"
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ReleaseOptions:
+    release_id: str  # what the files are uploaded as, which names the prefix they're stored under
+    served_release_id: str  # what gets served, which is an earlier release when rolling back to it
+    retention: int  # how many releases to keep in the bucket
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class SyncResult:
+    uploaded: int
+    copied: int  # created with a server-side copy of an identical object, rather than uploaded
+    metadata_updated: int
+    deleted: int
+    unchanged: int
+    bytes_uploaded: int
+    bytes_deduplicated: int  # what the copies would have cost to upload
+    synced_at: datetime | None  # S3's clock at the last write, or None if nothing needed writing
+
+
+def build_sync_entries(
+    records: Sequence[AssetRecord],
+    compressed_variants: Mapping[str, CompressedVariant],
+    *,
+    cache_control_policy: CacheControlPolicy = DEFAULT_CACHE_CONTROL_POLICY,
+) -> list[SyncEntry]:
+    """Describe each asset as the object it gets stored as, with the body and headers it's served with."""
+    # S3 compares ETags against what was uploaded, which for compressed files is the variant rather than the original
+    variant_keys = [record.key for record in records if record.key in compressed_variants]
+    variant_etags = dict(
+        zip(variant_keys, hash_files([compressed_variants[key].path for key in variant_keys]), strict=True)
+    )
+    entries: list[SyncEntry] = []
+    for record in records:
+        compressed_variant = compressed_variants.get(record.key)
+        entries.append(
+            SyncEntry(
+                key=record.key,
+                path=str((record.path if compressed_variant is None else compressed_variant.path).resolve()),
+                etag=variant_etags.get(record.key, record.digest),
+                content_type=record.content_type,
+                content_encoding=None if compressed_variant is None else compressed_variant.content_encoding,
+                cache_control=cache_control_policy.resolve(record.key),
+            )
+        )
+    return entries
+
+
+def release_prefix(release_id: str) -> str:
+    return f"{RELEASES_PREFIX}{release_id}/"
+
+
+def _as_release(entries: Sequence[SyncEntry], *, release_id: str) -> list[SyncEntry]:
+    prefix = release_prefix(release_id)
+    keys = {entry.key for entry in entries}
+    # behind an origin path, the S3 website endpoint's redirect from `/blog` to `/blog/` would include the release
+    # prefix in its Location, so every index document is also stored under its directory's name to be served directly
+    aliases = [
+        replace(entry, key=entry.key.removesuffix(f"/{INDEX_DOCUMENT}"))
+        for entry in entries
+        if entry.key.endswith(f"/{INDEX_DOCUMENT}") and entry.key.removesuffix(f"/{INDEX_DOCUMENT}") not in keys
+    ]
+    return [replace(entry, key=f"{prefix}{entry.key}") for entry in (*entries, *aliases)]
+
+
+def retained_releases(previous: Sequence[str], *, current: str, served: str, retention: int) -> list[str]:
+    """Order the releases from the most recently deployed, and drop the ones beyond the retention count.
+
+    The release being served and the one just uploaded are always kept, whatever the retention count.
+    """
+    history = list(dict.fromkeys([served, current, *previous]))
+    return history[: max(retention, len({served, current}))]
+
+
+def save_sync_manifest(manifest_path: Path, entries: Sequence[SyncEntry]) -> None:
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"version": SYNC_MANIFEST_VERSION, "entries": [asdict(entry) for entry in entries]}
+    tmp_path = manifest_path.with_suffix(f"{manifest_path.suffix}.tmp")
+    _ = tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+    _ = tmp_path.replace(manifest_path)
+
+
+def load_sync_manifest(manifest_path: Path) -> list[SyncEntry]:
+    raw: dict[str, Any] = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if raw.get("version") != SYNC_MANIFEST_VERSION:
+        raise ValueError(f"{manifest_path} was written with an unsupported version {raw.get('version')}")  # noqa: TRY003 # not worth a custom exception for this
+    return [SyncEntry(**entry) for entry in raw["entries"]]
+
+
+def content_digest(entries: Sequence[SyncEntry]) -> str:
+    return combine_digests((entry.key, entry.etag) for entry in entries)
+
+
+def metadata_digest(entries: Sequence[SyncEntry]) -> str:
+    return combine_digests((entry.key, entry.metadata) for entry in entries)
+
+
+def create_s3_client(*, max_workers: int, endpoint_url: str | None = None) -> "S3Client":
+    """Create an S3 client whose connection pool is big enough to be shared by every worker thread.
+
+    `endpoint_url` allows pointing at a local S3 stand-in (e.g. moto's server mode) to exercise a sync offline.
+    """
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url or None,
+        config=Config(max_pool_connections=max_workers, retries={"mode": "adaptive", "max_attempts": 10}),
+    )
+
+
+def list_bucket_etags(client: "S3Client", bucket: str, *, prefix: str = "") -> dict[str, tuple[str, datetime]]:
+    """Return the ETag and last modified time of every object in the bucket under the prefix, keyed by S3 key."""
+    objects: dict[str, tuple[str, datetime]] = {}
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get("Contents", []):
+            if "Key" in s3_object and "ETag" in s3_object and "LastModified" in s3_object:
+                objects[s3_object["Key"]] = (s3_object["ETag"].strip('"'), s3_object["LastModified"])
+    return objects
+
+
+def _response_date(response: Mapping[str, Any]) -> datetime:
+    # the Date header is S3's own clock, which is what LastModified is compared against when deleting. S3 always sends
+    # it, but local stand-ins may not
+    date_header: str | None = response["ResponseMetadata"]["HTTPHeaders"].get("date")
+    return datetime.now(tz=UTC) if date_header is None else parsedate_to_datetime(date_header)
+
+
+def _upload(client: "S3Client", bucket: str, entry: SyncEntry) -> datetime:
+    with Path(entry.path).open("rb") as body:
+        request: PutObjectRequestTypeDef = {
+            "Bucket": bucket,
+            "Key": entry.key,
+            "Body": body,
+            "ContentType": entry.content_type,
+            "CacheControl": entry.cache_control,
+            # S3 rejects the upload if the body got corrupted on the way
+            "ContentMD5": base64.b64encode(bytes.fromhex(entry.etag)).decode(),
+        }
+        if entry.content_encoding is not None:
+            request["ContentEncoding"] = entry.content_encoding
+        response = client.put_object(**request)
+    return _response_date(response)
+
+
+def _copy(client: "S3Client", bucket: str, entry: SyncEntry, *, source_key: str) -> datetime:
+    # the copy gets the entry's own metadata, and copying an object onto itself just replaces its metadata server-side
+    request: CopyObjectRequestTypeDef = {
+        "Bucket": bucket,
+        "Key": entry.key,
+        "CopySource": {"Bucket": bucket, "Key": source_key},
+        "MetadataDirective": "REPLACE",
+        "ContentType": entry.content_type,
+        "CacheControl": entry.cache_control,
+    }
+    if entry.content_encoding is not None:
+        request["ContentEncoding"] = entry.content_encoding
+    response = client.copy_object(**request)
+    return _response_date(response)
+
+
+def _delete_batch(client: "S3Client", bucket: str, keys: Sequence[str]) -> datetime:
+    objects: list[ObjectIdentifierTypeDef] = [{"Key": key} for key in keys]
+    response = client.delete_objects(Bucket=bucket, Delete={"Objects": objects, "Quiet": True})
+    if errors := response.get("Errors"):
+        raise RuntimeError(f"Failed to delete {len(errors)} objects from {bucket}, e.g. {errors[0]}")  # noqa: TRY003 # not worth a custom exception for this
+    return _response_date(response)
+
+
+def sync_to_bucket(  # noqa: PLR0913 # all but the client are keyword arguments
+    client: "S3Client",
+    *,
+    bucket: str,
+    entries: Sequence[SyncEntry],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    refresh_metadata: bool,
+    prefix: str = "",
+    copy_source_prefix: str | None = None,
+) -> SyncResult:
+    """Make the part of the bucket under `prefix` contain exactly the given entries, only transferring what differs.
+
+    Objects whose ETag already matches are not uploaded again. When `refresh_metadata` is set, their metadata is
+    rewritten in place instead, since listing a bucket doesn't report each object's metadata to compare against.
+
+    Content is only uploaded once: objects with the same ETag as one already in the bucket (or one uploaded earlier in
+    this sync) are created with a server-side copy of it instead. Those sources can also come from outside of `prefix`,
+    anywhere under `copy_source_prefix`, which has to contain `prefix`.
+    """
+    listed = list_bucket_etags(client, bucket, prefix=prefix if copy_source_prefix is None else copy_source_prefix)
+    existing = {key: found for key, found in listed.items() if key.startswith(prefix)}
+    changed = [entry for entry in entries if (found := existing.get(entry.key)) is None or found[0] != entry.etag]
+    changed_keys = {entry.key for entry in changed}
+    metadata_updates = [entry for entry in entries if refresh_metadata and entry.key not in changed_keys]
+    desired_keys = {entry.key for entry in entries}
+    deletes = sorted(key for key in existing if key not in desired_keys)
+
+    # objects that are staying as they are can be copied from, as can anything outside of the prefix since the sync
+    # leaves it alone, while the ones about to be deleted can't
+    copy_sources = {etag: key for key, (etag, _) in listed.items() if key not in existing}
+    copy_sources.update({entry.etag: entry.key for entry in entries if entry.key not in changed_keys})
+    uploads: list[SyncEntry] = []
+    copies_of_existing: list[tuple[SyncEntry, str]] = []
+    copies_of_uploads: list[tuple[SyncEntry, str]] = []
+    for entry in changed:
+        if (source_key := copy_sources.get(entry.etag)) is not None:
+            (copies_of_existing if source_key not in changed_keys else copies_of_uploads).append((entry, source_key))
+        else:
+            uploads.append(entry)
+            copy_sources[entry.etag] = entry.key
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-sync") as executor:
+        futures = [executor.submit(_upload, client, bucket, entry) for entry in uploads]
+        futures.extend(
+            executor.submit(_copy, client, bucket, entry, source_key=source_key)
+            for entry, source_key in copies_of_existing
+        )
+        futures.extend(
+            executor.submit(_copy, client, bucket, entry, source_key=entry.key) for entry in metadata_updates
+        )
+        futures.extend(
+            executor.submit(_delete_batch, client, bucket, deletes[start : start + DELETE_BATCH_SIZE])
+            for start in range(0, len(deletes), DELETE_BATCH_SIZE)
+        )
+        write_dates = [future.result() for future in futures]
+        # the rest can only be copied once the object they're a copy of has been uploaded
+        futures = [
+            executor.submit(_copy, client, bucket, entry, source_key=source_key)
+            for entry, source_key in copies_of_uploads
+        ]
+        write_dates.extend(future.result() for future in futures)
+
+    copies = [entry for entry, _ in copies_of_existing + copies_of_uploads]
+    result = SyncResult(
+        uploaded=len(uploads),
+        copied=len(copies),
+        metadata_updated=len(metadata_updates),
+        deleted=len(deletes),
+        unchanged=len(entries) - len(changed) - len(metadata_updates),
+        bytes_uploaded=sum(Path(entry.path).stat().st_size for entry in uploads),
+        bytes_deduplicated=sum(Path(entry.path).stat().st_size for entry in copies),
+        synced_at=max(write_dates, default=None),
+    )
+    logger.info(
+        f"Synced {len(entries)} objects to {bucket}: {result.uploaded} uploaded ({result.bytes_uploaded} bytes), {result.copied} copied from identical objects (saving {result.bytes_deduplicated} bytes), {result.metadata_updated} metadata updated, {result.deleted} deleted, {result.unchanged} unchanged"
+    )
+    return result
+
+
+def prune_releases(client: "S3Client", *, bucket: str, keep: Collection[str]) -> int:
+    """Delete every release other than the ones to keep, returning how many objects were deleted."""
+    keys = sorted(
+        key
+        for key in list_bucket_etags(client, bucket, prefix=RELEASES_PREFIX)
+        if key.removeprefix(RELEASES_PREFIX).split("/")[0] not in keep
+    )
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        _ = _delete_batch(client, bucket, keys[start : start + DELETE_BATCH_SIZE])
+    return len(keys)
+
+
+def delete_synced_objects(client: "S3Client", *, bucket: str, synced_at: datetime) -> int:
+    """Delete the objects last written by a sync, returning how many were deleted.
+
+    Anything written after the sync is left alone. That way switching back to one BucketObjectv2 per file doesn't lose
+    the files those resources upload, since Pulumi creates them before deleting the sync resource.
+    """
+    try:
+        existing = list_bucket_etags(client, bucket)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchBucket":
+            return 0
+        raise
+    keys = sorted(
+        key for key, (_, last_modified) in existing.items() if last_modified < synced_at + S3_CLOCK_RESOLUTION
+    )
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        _ = _delete_batch(client, bucket, keys[start : start + DELETE_BATCH_SIZE])
+    return len(keys)
+
+
+class S3SyncProvider(ResourceProvider):
+    """Dynamic provider that syncs a local manifest of files to a bucket.
+
+    Only the digests of the manifest are kept in the state, so the state stays the same size however many files there
+    are. The manifest file itself just needs to exist while the program is being deployed.
+
+    Given a `release_id`, the files are synced under that release's own prefix instead of the root of the bucket, and
+    the releases beyond the retention count are deleted afterwards.
+    """
+
+    def _sync(
+        self,
+        props: dict[str, Any],
+        *,
+        refresh_metadata: bool,
+        previous_synced_at: str | None,
+        previous_releases: Sequence[str],
+    ) -> dict[str, Any]:
+        entries = load_sync_manifest(Path(props["manifest_path"]))
+        max_workers = int(props["max_workers"])
+        client = create_s3_client(max_workers=max_workers, endpoint_url=props.get("endpoint_url"))
+        release_id: str | None = props.get("release_id")
+        served_release_id: str | None = props.get("served_release_id")
+        if served_release_id not in (release_id, *previous_releases):
+            raise ValueError(f"Release {served_release_id} can't be served, since it isn't one of {previous_releases}")  # noqa: TRY003 # not worth a custom exception for this
+        result = sync_to_bucket(
+            client,
+            bucket=props["bucket"],
+            entries=entries,
+            max_workers=max_workers,
+            refresh_metadata=refresh_metadata,
+            prefix="" if release_id is None else release_prefix(release_id),
+            copy_source_prefix=None if release_id is None else RELEASES_PREFIX,
+        )
+        releases: list[str] | None = None
+        if release_id is not None and served_release_id is not None:
+            releases = retained_releases(
+                previous_releases,
+                current=release_id,
+                served=served_release_id,
+                retention=int(props["release_retention"]),
+            )
+            pruned = prune_releases(client, bucket=props["bucket"], keep=releases)
+            logger.info(f"Keeping releases {releases} in {props['bucket']}, {pruned} objects of older ones deleted")
+        synced_at = result.synced_at.isoformat() if result.synced_at is not None else previous_synced_at
+        return {
+            **props,
+            "object_count": len(entries),
+            "bytes_deduplicated": result.bytes_deduplicated,
+            "synced_at": synced_at or datetime.now(tz=UTC).isoformat(),
+            "releases": releases,
+        }
+
+    @override
+    def create(self, props: dict[str, Any]) -> CreateResult:
+        # the bucket may already hold these objects with other metadata (e.g. uploaded by BucketObjectv2 resources)
+        outs = self._sync(props, refresh_metadata=True, previous_synced_at=None, previous_releases=[])
+        return CreateResult(id_=props["bucket"], outs=outs)
+
+    @override
+    def diff(self, _id: str, _olds: dict[str, Any], _news: dict[str, Any]) -> DiffResult:
+        changed = [
+            name
+            for name in (
+                "bucket",
+                "content_digest",
+                "metadata_digest",
+                "endpoint_url",
+                "release_id",
+                "served_release_id",
+                "release_retention",
+            )
+            if _olds.get(name) != _news.get(name)
+        ]
+        return DiffResult(changes=bool(changed), replaces=["bucket"] if "bucket" in changed else [])
+
+    @override
+    def update(self, _id: str, _olds: dict[str, Any], _news: dict[str, Any]) -> UpdateResult:
+        outs = self._sync(
+            _news,
+            # a new release starts out empty, but syncing it can reuse objects of the old one with other metadata
+            refresh_metadata=_olds.get("metadata_digest") != _news.get("metadata_digest")
+            or _olds.get("release_id") != _news.get("release_id"),
+            previous_synced_at=_olds.get("synced_at"),
+            previous_releases=_olds.get("releases") or [],
+        )
+        return UpdateResult(outs=outs)
+
+    @override
+    def delete(self, _id: str, _props: dict[str, Any]) -> None:
+        client = create_s3_client(max_workers=int(_props["max_workers"]), endpoint_url=_props.get("endpoint_url"))
+        if _props.get("release_id") is not None:
+            # nothing but this resource writes releases
+            deleted = prune_releases(client, bucket=_props["bucket"], keep=())
+        else:
+            deleted = delete_synced_objects(
+                client, bucket=_props["bucket"], synced_at=datetime.fromisoformat(_props["synced_at"])
+            )
+        logger.info(f"Deleted {deleted} synced objects from {_props['bucket']}")
+
+
+class S3Sync(Resource, module="infrastructure", name="S3Sync"):
+    # set by Pulumi from the provider's outputs
+    object_count: Output[int]  # pyright: ignore[reportUninitializedInstanceVariable] # see above
+    bytes_deduplicated: Output[int]  # pyright: ignore[reportUninitializedInstanceVariable] # by the most recent sync
+    synced_at: Output[str]  # pyright: ignore[reportUninitializedInstanceVariable] # see above
+    releases: Output[list[str] | None]  # pyright: ignore[reportUninitializedInstanceVariable] # most recent first, only when syncing a release
+
+    def __init__(  # noqa: PLR0913 # all keyword arguments, the same as any other Pulumi resource
+        self,
+        resource_name: str,
+        *,
+        bucket: Input[str],
+        manifest_path: Path,
+        entries: Sequence[SyncEntry],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        endpoint_url: str | None = None,
+        release: ReleaseOptions | None = None,
+        opts: ResourceOptions | None = None,
+    ):
+        if release is not None:
+            entries = _as_release(entries, release_id=release.release_id)
+        save_sync_manifest(manifest_path, entries)
+        super().__init__(
+            S3SyncProvider(),
+            resource_name,
+            {
+                "bucket": bucket,
+                "manifest_path": str(manifest_path.resolve()),
+                "content_digest": content_digest(entries),
+                "metadata_digest": metadata_digest(entries),
+                "max_workers": max_workers,
+                "endpoint_url": endpoint_url,
+                "release_id": None if release is None else release.release_id,
+                "served_release_id": None if release is None else release.served_release_id,
+                "release_retention": None if release is None else release.retention,
+                "object_count": None,
+                "bytes_deduplicated": None,
+                "synced_at": None,
+                "releases": None,
+            },
+            opts,
+        )
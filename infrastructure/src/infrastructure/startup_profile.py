@@ -0,0 +1,87 @@
+"""Reports where the import time of the deploy CLI goes, aggregated by top-level package."""
+
+import re
+import subprocess
+import sys
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(?P<self_us>\d+) \|\s+(?P<cumulative_us>\d+) \|\s*(?P<module>\S+)$")
+PHASE_MARKER = "--- startup profile phase ---"
+DEFAULT_TOP_PACKAGES = 15
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class PackageImportTime:
+    package: str
+    self_us: int  # summed over every module in the package, so nothing is counted twice
+    module_count: int
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ImportPhase:
+    name: str
+    packages: tuple[PackageImportTime, ...]  # slowest first
+
+    @property
+    def total_us(self) -> int:
+        return sum(package.self_us for package in self.packages)
+
+
+def aggregate_import_times(importtime_lines: Sequence[str]) -> tuple[PackageImportTime, ...]:
+    """Sum the self time `-X importtime` reports for each module into its top-level package, slowest first."""
+    self_us: dict[str, int] = {}
+    module_counts: dict[str, int] = {}
+    for line in importtime_lines:
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        package = match["module"].split(".", 1)[0]
+        self_us[package] = self_us.get(package, 0) + int(match["self_us"])
+        module_counts[package] = module_counts.get(package, 0) + 1
+    return tuple(
+        sorted(
+            (
+                PackageImportTime(package=package, self_us=time_us, module_count=module_counts[package])
+                for package, time_us in self_us.items()
+            ),
+            key=lambda package: package.self_us,
+            reverse=True,
+        )
+    )
+
+
+def profile_imports(phases: Sequence[tuple[str, str]]) -> list[ImportPhase]:
+    """Import each phase's module in turn in a fresh interpreter, attributing the imports to the phase that caused them.
+
+    A fresh interpreter is needed, since anything this process has already imported wouldn't be timed again.
+    """
+    code = "\n".join(
+        f"import sys; print({PHASE_MARKER!r}, file=sys.stderr, flush=True); import {module}" for _, module in phases
+    )
+    result = subprocess.run(  # noqa: S603 # the command is built entirely from our own module names
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    # the interpreter's own startup imports come before the first marker, and get attributed to the first phase too
+    startup, *phase_outputs = result.stderr.split(PHASE_MARKER)
+    phase_outputs[0] = startup + phase_outputs[0]
+    return [
+        ImportPhase(name=name, packages=aggregate_import_times(output.splitlines()))
+        for (name, _), output in zip(phases, phase_outputs, strict=True)
+    ]
+
+
+def format_import_phases(phases: Sequence[ImportPhase], *, top: int = DEFAULT_TOP_PACKAGES) -> str:
+    lines: list[str] = []
+    for phase in phases:
+        lines.append(f"{phase.name}: {phase.total_us / 1000:.0f} ms")
+        lines.extend(
+            f"  {package.package:<30} {package.self_us / 1000:>8.1f} ms {package.module_count:>6} modules"
+            for package in phase.packages[:top]
+        )
+        if len(phase.packages) > top:
+            rest = phase.packages[top:]
+            lines.append(
+                f"  {f'({len(rest)} other packages)':<30} {sum(package.self_us for package in rest) / 1000:>8.1f} ms"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+BENCHMARK_MARKER = "benchmark"
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        default=False,
+        help="Run the deploy pipeline benchmarks, which take several minutes and need a few GB of disk",
+    )
+    parser.addoption(
+        "--benchmark-baseline",
+        type=Path,
+        default=None,
+        help="Fail the benchmarks that regressed against these results, saved by `python -m infrastructure.benchmark`",
+    )
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    if config.getoption("--run-benchmarks"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmarks only run with --run-benchmarks")
+    for item in items:
+        if BENCHMARK_MARKER in item.keywords:
+            item.add_marker(skip_benchmark)
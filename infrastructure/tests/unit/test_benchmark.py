@@ -0,0 +1,122 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+from infrastructure.benchmark import DEFAULT_FILE_COUNTS
+from infrastructure.benchmark import DEFAULT_MAX_RESOURCE_FILE_COUNT
+from infrastructure.benchmark import DEFAULT_MEDIA_FILE_COUNT
+from infrastructure.benchmark import DEFAULT_MEDIA_FILE_SIZE_MB
+from infrastructure.benchmark import PhaseResult
+from infrastructure.benchmark import find_regressions
+from infrastructure.benchmark import load_results
+from infrastructure.benchmark import main
+from infrastructure.benchmark import run_benchmarks
+
+ALL_PHASES = ("scan_cold", "directory_hash", "scan_warm", "upload_resources", "adler32", "adler32_parallel")
+
+
+def _phase_result(*, wall_time_seconds: float, peak_rss_bytes: int = 0) -> PhaseResult:
+    return PhaseResult(
+        file_count=100,
+        phase="scan_cold",
+        wall_time_seconds=wall_time_seconds,
+        peak_rss_bytes=peak_rss_bytes,
+        read_bytes=None,
+    )
+
+
+def test_Given_a_small_site__When_run_from_the_cli__Then_every_phase_is_measured_and_matches_itself(tmp_path: Path):
+    output_path = tmp_path / "results.json"
+
+    exit_code = main(
+        [
+            "run",
+            "--file-counts",
+            "20",
+            "--media-file-count",
+            "1",
+            "--media-file-size-mb",
+            "1",
+            "--work-dir",
+            str(tmp_path),
+            "--output",
+            str(output_path),
+        ]
+    )
+
+    assert exit_code == 0
+    assert [result.phase for result in load_results(output_path)] == list(ALL_PHASES)
+    assert main(["compare", str(output_path), str(output_path)]) == 0
+
+
+def test_Given_a_site_above_the_resource_limit__Then_the_skipped_phase_and_the_limit_are_reported(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    output_path = tmp_path / "results.json"
+    max_resource_file_count = 10
+
+    exit_code = main(
+        [
+            "run",
+            "--file-counts",
+            "20",
+            "--media-file-count",
+            "1",
+            "--media-file-size-mb",
+            "1",
+            "--max-resource-file-count",
+            str(max_resource_file_count),
+            "--work-dir",
+            str(tmp_path),
+            "--output",
+            str(output_path),
+        ]
+    )
+
+    assert exit_code == 0
+    assert "upload_resources" not in [result.phase for result in load_results(output_path)]
+    assert json.loads(output_path.read_text())["max_resource_file_count"] == max_resource_file_count
+    assert any(
+        record.levelno == logging.WARNING and "Skipping upload_resources" in record.getMessage()
+        for record in caplog.records
+    )
+
+
+@pytest.mark.parametrize(
+    ("current", "expected_metrics"),
+    [
+        pytest.param(_phase_result(wall_time_seconds=1.1), [], id="within-threshold"),
+        pytest.param(_phase_result(wall_time_seconds=2.0), ["wall_time_seconds"], id="slower"),
+        pytest.param(
+            _phase_result(wall_time_seconds=1.0, peak_rss_bytes=1024 * 1024 * 1024),
+            ["peak_rss_bytes"],
+            id="more-memory",
+        ),
+    ],
+)
+def test_Given_a_baseline__Then_only_metrics_worse_than_the_threshold_are_regressions(
+    current: PhaseResult, expected_metrics: list[str]
+):
+    regressions = find_regressions([_phase_result(wall_time_seconds=1.0)], [current], threshold=0.2)
+
+    assert [regression.metric for regression in regressions] == expected_metrics
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("file_count", DEFAULT_FILE_COUNTS)
+def test_Benchmark_the_deploy_pipeline(tmp_path: Path, pytestconfig: pytest.Config, file_count: int):
+    results = run_benchmarks(
+        file_counts=[file_count],
+        media_file_count=DEFAULT_MEDIA_FILE_COUNT,
+        media_file_size=DEFAULT_MEDIA_FILE_SIZE_MB * 1024 * 1024,
+        work_dir=tmp_path,
+    )
+
+    expected_phases = [
+        phase for phase in ALL_PHASES if phase != "upload_resources" or file_count <= DEFAULT_MAX_RESOURCE_FILE_COUNT
+    ]
+    assert [result.phase for result in results] == expected_phases
+    baseline_path: Path | None = pytestconfig.getoption("--benchmark-baseline")
+    if baseline_path is not None:
+        assert find_regressions(load_results(baseline_path), results) == []
@@ -0,0 +1,184 @@
+import json
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+from typing import override
+
+import pulumi
+import pytest
+from infrastructure.cache_control import DEFAULT_CACHE_CONTROL_POLICY
+from infrastructure.cloudfront_behaviors import CACHING_OPTIMIZED_MANAGED_POLICY_ID
+from infrastructure.edge_emulator import Response
+from infrastructure.edge_emulator import cache_ttl
+from infrastructure.edge_emulator import find_behavior
+from infrastructure.jinja_constants import APP_DIRECTORY_NAME
+from infrastructure.program import pulumi_program
+from infrastructure.pulumi_deploy import generate_stack_config
+from pulumi.automation import ConfigValue
+from pulumi.runtime import MockCallArgs
+from pulumi.runtime import MockResourceArgs
+
+DISTRIBUTION_TYPE = "aws-native:cloudfront:Distribution"
+CACHE_POLICY_TYPE = "aws-native:cloudfront:CachePolicy"
+
+
+class _RecordingMocks(pulumi.runtime.Mocks):
+    def __init__(self) -> None:
+        super().__init__()
+        self.resources: list[MockResourceArgs] = []
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[str, Any]]:
+        self.resources.append(args)
+        inputs: dict[str, Any] = args.inputs  # pyright: ignore[reportUnknownMemberType,reportUnknownVariableType] # the inputs are untyped in the Pulumi SDK
+        outputs: dict[str, Any] = {**inputs}
+        # attributes the program reads back, which the real providers would have set
+        if args.typ == CACHE_POLICY_TYPE:
+            outputs["awsId"] = f"{args.name}-aws-id"
+        outputs.setdefault("websiteUrl", "http://bucket.s3-website-us-east-1.amazonaws.com")
+        outputs.setdefault("domainName", "d111111abcdef8.cloudfront.net")
+        outputs.setdefault("arn", "arn:aws:acm:us-east-1:123456789012:certificate/abc")
+        outputs.setdefault(
+            "domainValidationOptions",
+            [{"resourceRecordName": "_abc.rytermedia.com.", "resourceRecordValue": "_def.acm-validations.aws."}],
+        )
+        if args.typ == "pulumi:pulumi:StackReference":
+            outputs["outputs"] = {}
+        return f"{args.name}-id", outputs
+
+    @override
+    def call(self, args: MockCallArgs) -> tuple[dict[str, Any], list[tuple[str, str]] | None]:
+        return {"accountId": "123456789012", "json": "{}"}, []
+
+    def inputs_of(self, typ: str) -> list[dict[str, Any]]:
+        return [resource.inputs for resource in self.resources if resource.typ == typ]  # pyright: ignore[reportUnknownMemberType] # the inputs are untyped in the Pulumi SDK
+
+
+@pytest.fixture(scope="module")
+def mocks(tmp_path_factory: pytest.TempPathFactory) -> _RecordingMocks:
+    repo_root = tmp_path_factory.mktemp("repo")
+    public_dir = repo_root / APP_DIRECTORY_NAME / ".output" / "public"
+    for key in ("index.html", "blog/index.html", "_nuxt/entry.B4x9Kz1q.js"):
+        path = public_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_text(f"content of {key}")
+    stack_config = {
+        key: value.value if isinstance(value, ConfigValue) else value for key, value in generate_stack_config().items()
+    }
+    # the distribution is only created for the protected environments
+    stack_config |= {"proj:env": "prod", "proj:deploy_trace_file": ""}
+    recording_mocks = _RecordingMocks()
+    pulumi.runtime.set_mocks(recording_mocks, project="rytermedia-com", stack="test", preview=False)
+    pulumi.runtime.set_all_config({key: json.dumps({"value": value}) for key, value in stack_config.items()})
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr("infrastructure.program.repo_root", Path(repo_root))
+
+        @pulumi.runtime.test  # pyright: ignore[reportUnknownMemberType] # the decorator is untyped in the Pulumi SDK
+        def run_program() -> None:
+            pulumi_program()
+
+        run_program()
+    return recording_mocks
+
+
+@pytest.fixture(scope="module")
+def distribution_config(mocks: _RecordingMocks) -> dict[str, Any]:
+    (distribution,) = mocks.inputs_of(DISTRIBUTION_TYPE)
+    return distribution["distributionConfig"]
+
+
+@pytest.fixture(scope="module")
+def cache_policies(mocks: _RecordingMocks) -> dict[str, dict[str, Any]]:
+    """Key the config of each custom cache policy by the ID the distribution refers to it by."""
+    return {
+        f"{resource.name}-aws-id": resource.inputs["cachePolicyConfig"]  # pyright: ignore[reportUnknownMemberType] # the inputs are untyped in the Pulumi SDK
+        for resource in mocks.resources
+        if resource.typ == CACHE_POLICY_TYPE
+    }
+
+
+def _policy_ids_by_path_pattern(distribution_config: dict[str, Any]) -> dict[str | None, str]:
+    policy_ids: dict[str | None, str] = {None: distribution_config["defaultCacheBehavior"]["cachePolicyId"]}
+    for behavior in distribution_config["cacheBehaviors"]:
+        policy_ids[behavior["pathPattern"]] = behavior["cachePolicyId"]
+    return policy_ids
+
+
+@pytest.mark.parametrize(
+    "path_pattern",
+    [
+        pytest.param("/_nuxt/*", id="nuxt-assets"),
+        pytest.param("/_derived/*", id="derived-images"),
+    ],
+)
+def test_Then_fingerprinted_assets_use_the_managed_caching_optimized_policy(
+    distribution_config: dict[str, Any], path_pattern: str
+):
+    assert _policy_ids_by_path_pattern(distribution_config)[path_pattern] == CACHING_OPTIMIZED_MANAGED_POLICY_ID
+
+
+@pytest.mark.parametrize(
+    ("path_pattern", "expected_ttls"),
+    [
+        pytest.param("/images/*", (0, 86400, 604800), id="images"),
+        pytest.param(None, (0, 300, 3600), id="default-html"),
+    ],
+)
+def test_Then_custom_cache_policy_ttls_match_the_path_pattern(
+    distribution_config: dict[str, Any],
+    cache_policies: dict[str, dict[str, Any]],
+    path_pattern: str | None,
+    expected_ttls: tuple[int, int, int],
+):
+    policy = cache_policies[_policy_ids_by_path_pattern(distribution_config)[path_pattern]]
+
+    assert (policy["minTtl"], policy["defaultTtl"], policy["maxTtl"]) == expected_ttls
+
+
+@pytest.mark.parametrize(
+    ("request_path", "s3_key"),
+    [
+        pytest.param("/blog/", "blog/index.html", id="html"),
+        pytest.param("/blog/_payload.json", "blog/_payload.json", id="payload"),
+    ],
+)
+def test_Then_pages_browsers_revalidate_are_kept_at_the_edge_for_the_html_behaviors_default_ttl(
+    request_path: str, s3_key: str
+):
+    spec = find_behavior(request_path)
+    response = Response(
+        status=HTTPStatus.OK, headers={"Cache-Control": DEFAULT_CACHE_CONTROL_POLICY.resolve(s3_key)}, body=b""
+    )
+
+    assert "max-age=0" in response.headers["Cache-Control"]
+    assert spec.ttls is not None
+    assert cache_ttl(response, spec.ttls) == spec.ttls.default_ttl > 0
+
+
+def test_Then_custom_cache_policies_keep_accept_encoding_in_the_cache_key_and_nothing_else(
+    cache_policies: dict[str, dict[str, Any]],
+):
+    assert cache_policies
+    for policy in cache_policies.values():
+        parameters = policy["parametersInCacheKeyAndForwardedToOrigin"]
+        assert parameters["enableAcceptEncodingGzip"] is True
+        assert parameters["enableAcceptEncodingBrotli"] is True
+        assert parameters["cookiesConfig"] == {"cookieBehavior": "none"}
+        assert parameters["headersConfig"] == {"headerBehavior": "none"}
+        assert parameters["queryStringsConfig"] == {"queryStringBehavior": "none"}
+
+
+def test_Then_every_behavior_serves_the_s3_origin_compressed_over_https(distribution_config: dict[str, Any]):
+    (origin,) = distribution_config["origins"]
+    behaviors = [distribution_config["defaultCacheBehavior"], *distribution_config["cacheBehaviors"]]
+
+    for behavior in behaviors:
+        assert behavior["targetOriginId"] == origin["id"]
+        assert behavior["viewerProtocolPolicy"] == "redirect-to-https"
+        assert behavior["compress"] is True
+        assert behavior["allowedMethods"] == ["GET", "HEAD"]
+        assert behavior["cachedMethods"] == ["GET", "HEAD"]
+
+
+def test_Then_the_distribution_serves_http2_and_http3(distribution_config: dict[str, Any]):
+    assert distribution_config["httpVersion"] == "http2and3"
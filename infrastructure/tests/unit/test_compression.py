@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+from infrastructure.asset_scanner import AssetRecord
+from infrastructure.compression import COMPRESSIBLE_CONTENT_TYPES
+from infrastructure.compression import compress_assets
+from infrastructure.content_types import TEXT_MEDIA_TYPES
+
+
+def _record(site_dir: Path, key: str, content: str) -> AssetRecord:
+    path = site_dir / key
+    _ = path.write_text(content * 200)
+    stat = path.stat()
+    return AssetRecord(
+        key=key,
+        path=path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        digest=f"digest-of-{key.replace('.', '-')}",
+        content_type="text/html; charset=utf-8",
+    )
+
+
+@pytest.fixture
+def site_dir(tmp_path: Path) -> Path:
+    site_dir = tmp_path / "site"
+    site_dir.mkdir()
+    return site_dir
+
+
+def test_Given_another_stack_uses_a_cached_variant__When_this_stack_stops_using_it__Then_it_is_kept(
+    site_dir: Path, tmp_path: Path
+):
+    cache_dir = tmp_path / "compressed"
+    shared = _record(site_dir, "shared.html", "<p>shared</p>")
+    only_dev = _record(site_dir, "dev.html", "<p>dev</p>")
+    _ = compress_assets([shared], cache_dir=cache_dir, owner="prod")
+    _ = compress_assets([shared, only_dev], cache_dir=cache_dir, owner="dev")
+
+    _ = compress_assets([], cache_dir=cache_dir, owner="dev")
+
+    assert sorted(path.name for path in cache_dir.iterdir() if path.is_file()) == [f"{shared.digest}.gz"]
+
+
+def test_Given_a_corrupt_references_file__When_compressing__Then_nothing_is_pruned(site_dir: Path, tmp_path: Path):
+    cache_dir = tmp_path / "compressed"
+    record = _record(site_dir, "index.html", "<p>index</p>")
+    _ = compress_assets([record], cache_dir=cache_dir, owner="dev")
+    _ = (cache_dir / "references" / "prod.json").write_text("{not json")
+
+    _ = compress_assets([], cache_dir=cache_dir, owner="dev")
+
+    assert (cache_dir / f"{record.digest}.gz").exists()
+
+
+def test_Then_every_text_media_type_is_compressible():
+    assert TEXT_MEDIA_TYPES <= COMPRESSIBLE_CONTENT_TYPES
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from infrastructure.hash_cache import HashCache
+
+
+def _write_files(directory: Path, names: list[str]) -> list[Path]:
+    paths = [directory / name for name in names]
+    for path in paths:
+        _ = path.write_text(path.name)
+    return paths
+
+
+def test_Given_every_file_is_a_hit__When_saving__Then_the_cache_file_is_not_rewritten(tmp_path: Path):
+    cache_path = tmp_path / "file-hashes.json"
+    paths = _write_files(tmp_path, ["a.txt", "b.txt"])
+    cache = HashCache(cache_path)
+    for path in paths:
+        cache.put(path, path.stat(), f"digest-of-{path.name}")
+    cache.save()
+    cache = HashCache(cache_path)
+    _ = cache_path.write_text("any rewrite would replace this")
+
+    cached = [cache.get(path, path.stat()) for path in paths]
+    cache.save()
+
+    assert cached == ["digest-of-a.txt", "digest-of-b.txt"]
+    assert cache_path.read_text() == "any rewrite would replace this"
+
+
+def test_Given_more_entries_than_the_limit__When_saving__Then_the_least_recently_used_are_evicted(tmp_path: Path):
+    cache_path = tmp_path / "file-hashes.json"
+    first, second, third = _write_files(tmp_path, ["a.txt", "b.txt", "c.txt"])
+    cache = HashCache(cache_path, max_entries=2)
+    cache.put(first, first.stat(), "digest-of-a")
+    cache.put(second, second.stat(), "digest-of-b")
+    cache.save()
+
+    cache = HashCache(cache_path, max_entries=2)
+    _ = cache.get(first, first.stat())
+    cache.put(third, third.stat(), "digest-of-c")
+    cache.save()
+
+    cache = HashCache(cache_path, max_entries=2)
+    assert [cache.get(path, path.stat()) for path in (first, second, third)] == ["digest-of-a", None, "digest-of-c"]
@@ -0,0 +1,92 @@
+import importlib.util
+import random
+import sys
+import zlib
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+HASH_GIT_FILES_PATH = Path(__file__).parents[3] / ".github" / "workflows" / "hash_git_files.py"
+
+
+def _load_hash_git_files() -> ModuleType:
+    # the script lives with the workflows rather than in a package, so it's loaded straight from its path
+    spec = importlib.util.spec_from_file_location("hash_git_files", HASH_GIT_FILES_PATH)
+    assert spec is not None
+    assert spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+hash_git_files = _load_hash_git_files()
+
+
+@pytest.fixture
+def repo_files(tmp_path: Path) -> list[str]:
+    generator = random.Random(42)
+    contents = {
+        "README.md": b"# readme\n",
+        "empty.txt": b"",
+        "src/app.py": b"print('hello')\n" * 100,
+        # bigger than a single read in either mode, so the chunks get folded together too
+        "assets/large.bin": generator.randbytes(hash_git_files.PARALLEL_READ_SIZE * 2 + 123),
+        "assets/unicode-ñame.txt": "ümlaut".encode(),
+    }
+    for name, content in contents.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_bytes(content)
+    return list(contents)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2, None])
+def test_When_computed_in_parallel__Then_checksum_matches_compute_adler32(
+    tmp_path: Path, repo_files: list[str], max_workers: int | None
+):
+    expected = hash_git_files.compute_adler32(tmp_path, repo_files)
+
+    actual = hash_git_files.compute_adler32_parallel(tmp_path, repo_files, max_workers=max_workers)
+
+    assert actual == expected
+
+
+def test_Given_files_in_a_different_order__When_computed_in_parallel__Then_checksum_matches_compute_adler32(
+    tmp_path: Path, repo_files: list[str]
+):
+    expected = hash_git_files.compute_adler32(tmp_path, repo_files)
+
+    actual = hash_git_files.compute_adler32_parallel(tmp_path, list(reversed(repo_files)))
+
+    assert actual == expected
+
+
+def test_Given_a_directory_among_the_files__When_computed_in_parallel__Then_checksum_matches_compute_adler32(
+    tmp_path: Path, repo_files: list[str]
+):
+    files = [*repo_files, "src"]
+
+    assert hash_git_files.compute_adler32_parallel(tmp_path, files) == hash_git_files.compute_adler32(tmp_path, files)
+
+
+def test_Given_no_files__When_computed_in_parallel__Then_checksum_is_the_adler32_starting_value(tmp_path: Path):
+    assert hash_git_files.compute_adler32_parallel(tmp_path, []) == hash_git_files.compute_adler32(tmp_path, []) == 1
+
+
+@pytest.mark.parametrize(
+    ("first", "second"),
+    [
+        pytest.param(b"", b"", id="both-empty"),
+        pytest.param(b"abc", b"", id="second-empty"),
+        pytest.param(b"", b"abc", id="first-empty"),
+        pytest.param(b"hello ", b"world", id="short"),
+        # long enough for the sums to wrap around the modulus
+        pytest.param(b"\xff" * 10_000, b"\x00\xff" * 70_000, id="wrapping"),
+    ],
+)
+def test_adler32_combine_matches_checksumming_the_concatenated_data(first: bytes, second: bytes):
+    combined = hash_git_files.adler32_combine(zlib.adler32(first), zlib.adler32(second), len(second))
+
+    assert combined == zlib.adler32(first + second)
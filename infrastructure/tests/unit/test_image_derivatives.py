@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pytest
+from infrastructure.image_derivatives import WEBP
+from infrastructure.image_derivatives import WIDTH_BUCKETS
+from infrastructure.image_derivatives import build_image_derivatives
+from PIL import Image
+
+
+def _derived_widths(public_dir: Path, *, original_width: int) -> list[int]:
+    _ = Image.new("RGB", (original_width, original_width // 2), color=(200, 100, 50)).save(public_dir / "photo.jpg")
+
+    derived = build_image_derivatives(public_dir, formats=[WEBP], max_workers=1)
+
+    return [variant.width for variant in derived["/photo.jpg"].variants]
+
+
+@pytest.mark.parametrize(
+    ("original_width", "expected_widths"),
+    [
+        pytest.param(200, [200], id="smaller-than-every-bucket"),
+        pytest.param(600, [320, 600], id="between-buckets"),
+        pytest.param(640, [320, 640], id="exactly-a-bucket"),
+        pytest.param(3000, list(WIDTH_BUCKETS), id="larger-than-every-bucket"),
+    ],
+)
+def test_Given_an_original_width__Then_its_full_resolution_is_the_largest_derivative_up_to_the_top_bucket(
+    tmp_path: Path, original_width: int, expected_widths: list[int]
+):
+    assert _derived_widths(tmp_path, original_width=original_width) == expected_widths
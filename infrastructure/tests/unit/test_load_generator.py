@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections.abc import Coroutine
+from typing import Any
+
+from infrastructure.invalidation import create_cache_warming_command
+from infrastructure.invalidation import create_invalidation_command
+from infrastructure.load_generator import LoadReport
+from infrastructure.load_generator import run_load
+
+MAX_SECONDS_TO_GIVE_UP = 5  # well beyond the deadline, but well short of the request timeout
+
+
+async def _run_load_against_unresponsive_server(
+    *, request_timeout_seconds: float, deadline_seconds: float | None
+) -> LoadReport:
+    async def never_respond(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        _ = await reader.read()  # until the client gives up and closes the connection
+        writer.close()
+
+    server = await asyncio.start_server(never_respond, host="127.0.0.1", port=0)
+    async with server:
+        host, port = server.sockets[0].getsockname()[:2]
+        return await run_load(
+            f"http://{host}:{port}",
+            ["/", "/about"],
+            requests_per_route=2,
+            concurrency=1,
+            request_timeout_seconds=request_timeout_seconds,
+            deadline_seconds=deadline_seconds,
+        )
+
+
+def _run(coroutine: Coroutine[Any, Any, LoadReport]) -> LoadReport:
+    # unlike asyncio.run, this leaves the current event loop in place, which the Pulumi mocks in other tests rely on
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_Given_a_server_that_never_responds__Then_every_request_times_out_as_an_error():
+    report = _run(_run_load_against_unresponsive_server(request_timeout_seconds=0.05, deadline_seconds=None))
+
+    assert (report.request_count, report.errors, report.abandoned) == (0, 4, 0)
+
+
+def test_Given_a_deadline_shorter_than_the_requests__Then_the_rest_are_abandoned_at_the_deadline():
+    started = time.perf_counter()
+
+    report = _run(_run_load_against_unresponsive_server(request_timeout_seconds=60, deadline_seconds=0.2))
+
+    assert time.perf_counter() - started < MAX_SECONDS_TO_GIVE_UP
+    assert (report.request_count, report.errors, report.abandoned) == (0, 0, 4)
+
+
+def test_When_waiting_for_an_invalidation__Then_the_waiter_giving_up_does_not_fail_the_command():
+    command = create_invalidation_command(distribution_id="E123", paths=["/*"], wait=True)
+
+    assert command.endswith(
+        """&& (aws cloudfront wait invalidation-completed --distribution-id E123 --id "$INVALIDATION_ID" || echo 'Gave up waiting for the invalidation to complete')"""
+    )
+
+
+def test_Then_the_cache_warming_command_is_the_same_on_every_machine():
+    command = create_cache_warming_command(
+        base_url="https://d111111abcdef8.cloudfront.net", concurrency=8, max_requests_per_second=20
+    )
+
+    assert command.startswith("uv run python -m infrastructure.cache_warmer ")
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+import pytest
+from infrastructure.jinja_constants import APP_DIRECTORY_NAME
+from infrastructure.route_dependencies import FALLBACK_ROUTES
+from infrastructure.route_dependencies import affected
+from infrastructure.route_dependencies import build_index
+
+APP_DIR = Path(__file__).parents[3] / APP_DIRECTORY_NAME
+# the error page lists the blog's navigation, so every blog post is in the fallback pages
+BLOG_POST = next(f"content/blog/{path.name}" for path in sorted((APP_DIR / "content" / "blog").glob("*.md")))
+
+
+@pytest.mark.parametrize("fallback_route", FALLBACK_ROUTES)
+def test_Given_a_blog_post_changes__Then_the_fallback_pages_rendering_the_error_page_are_affected(
+    tmp_path: Path, fallback_route: str
+):
+    index = build_index(APP_DIR, public_dir=tmp_path / "not-built-yet")
+
+    impact = affected([BLOG_POST], indexes=[index])
+
+    assert fallback_route in impact.routes
+    assert fallback_route.removeprefix("/") in impact.output_files
+
+
+def test_Given_a_built_site_without_a_fallback_page__Then_no_output_is_expected_for_it(tmp_path: Path):
+    _ = (tmp_path / "404.html").write_text("<html></html>")
+
+    index = build_index(APP_DIR, public_dir=tmp_path)
+
+    assert index.route_outputs["/404.html"] == ("404.html",)
+    assert index.route_outputs["/200.html"] == ()
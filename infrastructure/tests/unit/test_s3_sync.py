@@ -0,0 +1,352 @@
+import hashlib
+from collections.abc import Iterator
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Any
+
+import pytest
+from infrastructure.s3_sync import S3SyncProvider
+from infrastructure.s3_sync import SyncEntry
+from infrastructure.s3_sync import content_digest
+from infrastructure.s3_sync import create_s3_client
+from infrastructure.s3_sync import metadata_digest
+from infrastructure.s3_sync import release_prefix
+from infrastructure.s3_sync import save_sync_manifest
+from infrastructure.s3_sync import sync_to_bucket
+from moto import mock_aws
+
+if TYPE_CHECKING:
+    from botocore.model import OperationModel
+    from mypy_boto3_s3 import S3Client
+
+BUCKET = "test-bucket"
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+HTML_CACHE_CONTROL = "public, max-age=0, s-maxage=300, must-revalidate"
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator["S3Client"]:
+    # moto never sends these anywhere, but botocore refuses to sign requests without them
+    for name, value in (
+        ("AWS_ACCESS_KEY_ID", "testing"),
+        ("AWS_SECRET_ACCESS_KEY", "testing"),
+        ("AWS_DEFAULT_REGION", "us-east-1"),
+    ):
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    with mock_aws():
+        client = create_s3_client(max_workers=4)
+        _ = client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _entry(
+    site_dir: Path,
+    key: str,
+    content: bytes,
+    *,
+    content_type: str = HTML_CONTENT_TYPE,
+    cache_control: str = HTML_CACHE_CONTROL,
+) -> SyncEntry:
+    path = site_dir / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _ = path.write_bytes(content)
+    return SyncEntry(
+        key=key,
+        path=str(path),
+        etag=hashlib.md5(content).hexdigest(),  # noqa: S324 # it's what S3 reports as the ETag, not for security
+        content_type=content_type,
+        content_encoding=None,
+        cache_control=cache_control,
+    )
+
+
+def _bucket_keys(client: "S3Client") -> list[str]:
+    return sorted(s3_object.get("Key", "") for s3_object in client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+def _record_requests(client: "S3Client") -> list[tuple[str, dict[str, Any]]]:
+    requests: list[tuple[str, dict[str, Any]]] = []
+
+    def record(params: dict[str, Any], model: "OperationModel", **_: object) -> None:
+        requests.append((model.name, dict(params)))
+
+    client.meta.events.register("provide-client-params.s3.*", record)
+    return requests
+
+
+def _requests_of(requests: list[tuple[str, dict[str, Any]]], operation: str) -> list[dict[str, Any]]:
+    return sorted((params for name, params in requests if name == operation), key=lambda params: params["Key"])
+
+
+def _headers(client: "S3Client", key: str) -> tuple[str, str]:
+    response = client.head_object(Bucket=BUCKET, Key=key)
+    return response.get("ContentType", ""), response.get("CacheControl", "")
+
+
+def test_Given_an_empty_bucket__Then_every_entry_is_uploaded_with_its_headers(s3_client: "S3Client", tmp_path: Path):
+    entries = [
+        _entry(tmp_path, "index.html", b"<p>home</p>"),
+        _entry(tmp_path, "logo.svg", b"<svg/>", content_type="image/svg+xml", cache_control="public, max-age=86400"),
+    ]
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=entries, refresh_metadata=False)
+
+    assert (result.uploaded, result.unchanged, result.deleted) == (2, 0, 0)
+    assert result.bytes_uploaded == len(b"<p>home</p>") + len(b"<svg/>")
+    assert result.synced_at is not None
+    assert _headers(s3_client, "index.html") == (HTML_CONTENT_TYPE, HTML_CACHE_CONTROL)
+    assert _headers(s3_client, "logo.svg") == ("image/svg+xml", "public, max-age=86400")
+
+
+def test_Given_objects_with_matching_etags__Then_nothing_is_written(s3_client: "S3Client", tmp_path: Path):
+    entries = [_entry(tmp_path, "index.html", b"<p>home</p>"), _entry(tmp_path, "about/index.html", b"<p>about</p>")]
+    _ = sync_to_bucket(s3_client, bucket=BUCKET, entries=entries, refresh_metadata=False)
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=entries, refresh_metadata=False)
+
+    assert (result.uploaded, result.copied, result.metadata_updated, result.unchanged) == (0, 0, 0, 2)
+    assert result.synced_at is None
+
+
+def test_Given_a_changed_entry__Then_only_it_is_uploaded(s3_client: "S3Client", tmp_path: Path):
+    home = _entry(tmp_path, "index.html", b"<p>home</p>")
+    _ = sync_to_bucket(
+        s3_client, bucket=BUCKET, entries=[home, _entry(tmp_path, "a.html", b"<p>a</p>")], refresh_metadata=False
+    )
+
+    result = sync_to_bucket(
+        s3_client,
+        bucket=BUCKET,
+        entries=[home, _entry(tmp_path, "a.html", b"<p>a, edited</p>")],
+        refresh_metadata=False,
+    )
+
+    assert (result.uploaded, result.unchanged) == (1, 1)
+    assert s3_client.get_object(Bucket=BUCKET, Key="a.html")["Body"].read() == b"<p>a, edited</p>"
+
+
+def test_Given_objects_no_longer_in_the_site__Then_they_are_deleted(s3_client: "S3Client", tmp_path: Path):
+    home = _entry(tmp_path, "index.html", b"<p>home</p>")
+    stale = _entry(tmp_path, "old/index.html", b"<p>old</p>")
+    _ = sync_to_bucket(s3_client, bucket=BUCKET, entries=[home, stale], refresh_metadata=False)
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=[home], refresh_metadata=False)
+
+    assert result.deleted == 1
+    assert _bucket_keys(s3_client) == ["index.html"]
+
+
+def test_Given_a_prefix__Then_objects_outside_of_it_are_left_alone(s3_client: "S3Client", tmp_path: Path):
+    _ = sync_to_bucket(
+        s3_client, bucket=BUCKET, entries=[_entry(tmp_path, "index.html", b"<p>root</p>")], refresh_metadata=False
+    )
+    prefixed = _entry(tmp_path, "releases/r1/index.html", b"<p>release</p>")
+
+    result = sync_to_bucket(
+        s3_client, bucket=BUCKET, entries=[prefixed], refresh_metadata=False, prefix=release_prefix("r1")
+    )
+
+    assert result.deleted == 0
+    assert _bucket_keys(s3_client) == ["index.html", "releases/r1/index.html"]
+
+
+@pytest.mark.parametrize(
+    ("changes", "expected_headers"),
+    [
+        pytest.param({"cache_control": "no-store"}, (HTML_CONTENT_TYPE, "no-store"), id="cache-control"),
+        pytest.param(
+            {"content_type": "text/plain; charset=utf-8"},
+            ("text/plain; charset=utf-8", HTML_CACHE_CONTROL),
+            id="content-type",
+        ),
+    ],
+)
+def test_Given_only_the_metadata_changed__When_refreshing_it__Then_it_is_rewritten_without_uploading(
+    s3_client: "S3Client", tmp_path: Path, changes: dict[str, str], expected_headers: tuple[str, str]
+):
+    entry = _entry(tmp_path, "index.html", b"<p>home</p>")
+    _ = sync_to_bucket(s3_client, bucket=BUCKET, entries=[entry], refresh_metadata=False)
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=[replace(entry, **changes)], refresh_metadata=True)
+
+    assert (result.uploaded, result.metadata_updated) == (0, 1)
+    assert _headers(s3_client, "index.html") == expected_headers
+
+
+def test_Given_identical_files_under_different_keys__Then_each_is_uploaded_once_and_copied_with_its_own_headers(
+    s3_client: "S3Client", tmp_path: Path
+):
+    logo = b"<svg>logo</svg>"
+    page = b"<p>same page</p>"
+    entries = [
+        _entry(tmp_path, "logo.svg", logo, content_type="image/svg+xml", cache_control="public, max-age=86400"),
+        _entry(tmp_path, "brand/logo.svg", logo, content_type="image/svg+xml", cache_control="no-cache"),
+        _entry(tmp_path, "logo.txt", logo, content_type="text/plain; charset=utf-8", cache_control="no-store"),
+        _entry(tmp_path, "a/index.html", page),
+        _entry(tmp_path, "b/index.html", page),
+    ]
+    requests = _record_requests(s3_client)
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=entries, refresh_metadata=False)
+
+    puts = _requests_of(requests, "PutObject")
+    copies = _requests_of(requests, "CopyObject")
+    assert len(puts) == len({entry.etag for entry in entries})
+    assert [(copy["Key"], copy["MetadataDirective"], copy["ContentType"], copy["CacheControl"]) for copy in copies] == [
+        (entry.key, "REPLACE", entry.content_type, entry.cache_control)
+        for entry in sorted(entries, key=lambda entry: entry.key)
+        if entry.key not in {put["Key"] for put in puts}
+    ]
+    assert (result.uploaded, result.copied) == (len(puts), len(copies))
+    assert result.bytes_deduplicated == 2 * len(logo) + len(page)
+    for entry in entries:
+        assert _headers(s3_client, entry.key) == (entry.content_type, entry.cache_control)
+        assert s3_client.get_object(Bucket=BUCKET, Key=entry.key)["Body"].read() == Path(entry.path).read_bytes()
+
+
+def test_Given_a_new_key_identical_to_an_object_already_in_the_bucket__Then_it_is_copied_from_that_object(
+    s3_client: "S3Client", tmp_path: Path
+):
+    original = _entry(tmp_path, "a/index.html", b"<p>same page</p>")
+    _ = sync_to_bucket(s3_client, bucket=BUCKET, entries=[original], refresh_metadata=False)
+    duplicate = _entry(tmp_path, "b/index.html", b"<p>same page</p>", cache_control="no-store")
+    requests = _record_requests(s3_client)
+
+    result = sync_to_bucket(s3_client, bucket=BUCKET, entries=[original, duplicate], refresh_metadata=False)
+
+    assert _requests_of(requests, "PutObject") == []
+    [copy] = _requests_of(requests, "CopyObject")
+    assert (copy["Key"], copy["CopySource"], copy["CacheControl"]) == (
+        duplicate.key,
+        {"Bucket": BUCKET, "Key": original.key},
+        "no-store",
+    )
+    assert (result.uploaded, result.copied, result.unchanged) == (0, 1, 1)
+    assert result.bytes_deduplicated == Path(duplicate.path).stat().st_size
+
+
+def test_Given_a_copy_source_prefix__Then_identical_objects_from_an_earlier_release_are_copied(
+    s3_client: "S3Client", tmp_path: Path
+):
+    _ = sync_to_bucket(
+        s3_client,
+        bucket=BUCKET,
+        entries=[_entry(tmp_path, f"{release_prefix('r1')}index.html", b"<p>home</p>")],
+        refresh_metadata=False,
+        prefix=release_prefix("r1"),
+    )
+    requests = _record_requests(s3_client)
+
+    result = sync_to_bucket(
+        s3_client,
+        bucket=BUCKET,
+        entries=[_entry(tmp_path, f"{release_prefix('r2')}index.html", b"<p>home</p>")],
+        refresh_metadata=False,
+        prefix=release_prefix("r2"),
+        copy_source_prefix="releases/",
+    )
+
+    [copy] = _requests_of(requests, "CopyObject")
+    assert copy["CopySource"] == {"Bucket": BUCKET, "Key": "releases/r1/index.html"}
+    assert (result.uploaded, result.copied, result.deleted) == (0, 1, 0)
+
+
+def _provider_props(tmp_path: Path, entries: list[SyncEntry], **overrides: object) -> dict[str, Any]:
+    manifest_path = tmp_path / f"sync-manifest-{content_digest(entries)}-{metadata_digest(entries)}.json"
+    save_sync_manifest(manifest_path, entries)
+    return {
+        "bucket": BUCKET,
+        "manifest_path": str(manifest_path),
+        "content_digest": content_digest(entries),
+        "metadata_digest": metadata_digest(entries),
+        "max_workers": 4,
+        "endpoint_url": None,
+        "release_id": None,
+        "served_release_id": None,
+        "release_retention": None,
+        **overrides,
+    }
+
+
+def _created_outputs(provider: S3SyncProvider, props: dict[str, Any]) -> dict[str, Any]:
+    outs = provider.create(props).outs
+    assert outs is not None
+    return outs
+
+
+def test_Given_the_cache_control_changed__When_the_provider_updates__Then_the_metadata_is_refreshed(
+    s3_client: "S3Client", tmp_path: Path
+):
+    entry = _entry(tmp_path, "index.html", b"<p>home</p>")
+    provider = S3SyncProvider()
+    olds = _created_outputs(provider, _provider_props(tmp_path, [entry]))
+    news = _provider_props(tmp_path, [replace(entry, cache_control="no-store")])
+
+    outs = provider.update(BUCKET, olds, news).outs
+
+    assert _headers(s3_client, "index.html") == (HTML_CONTENT_TYPE, "no-store")
+    assert outs is not None
+    assert outs["object_count"] == 1
+
+
+def test_Given_a_new_release__When_the_provider_updates__Then_releases_beyond_the_retention_are_pruned(
+    s3_client: "S3Client", tmp_path: Path
+):
+    provider = S3SyncProvider()
+    first = _entry(tmp_path, f"{release_prefix('r1')}index.html", b"<p>one</p>")
+    second = _entry(tmp_path, f"{release_prefix('r2')}index.html", b"<p>two</p>")
+    olds = _created_outputs(
+        provider, _provider_props(tmp_path, [first], release_id="r1", served_release_id="r1", release_retention=1)
+    )
+
+    outs = provider.update(
+        BUCKET,
+        olds,
+        _provider_props(tmp_path, [second], release_id="r2", served_release_id="r2", release_retention=1),
+    ).outs
+
+    assert outs is not None
+    assert outs["releases"] == ["r2"]
+    assert _bucket_keys(s3_client) == ["releases/r2/index.html"]
+
+
+def test_Given_a_synced_bucket__When_the_provider_deletes__Then_the_synced_objects_are_removed(
+    s3_client: "S3Client", tmp_path: Path
+):
+    provider = S3SyncProvider()
+    outs = _created_outputs(provider, _provider_props(tmp_path, [_entry(tmp_path, "index.html", b"<p>home</p>")]))
+
+    provider.delete(BUCKET, outs)
+
+    assert _bucket_keys(s3_client) == []
+
+
+@pytest.mark.parametrize(
+    ("changed", "expected_changes", "expected_replaces"),
+    [
+        pytest.param({}, False, [], id="nothing"),
+        pytest.param({"synced_at": "2026-01-01T00:00:00+00:00", "object_count": 3}, False, [], id="outputs-only"),
+        pytest.param({"content_digest": "other"}, True, [], id="content"),
+        pytest.param({"metadata_digest": "other"}, True, [], id="metadata"),
+        pytest.param({"release_id": "r2"}, True, [], id="release"),
+        pytest.param({"bucket": "other-bucket"}, True, ["bucket"], id="bucket"),
+    ],
+)
+def test_Given_changed_props__Then_the_provider_diff_updates_or_replaces(
+    changed: dict[str, Any], expected_changes: bool, expected_replaces: list[str]
+):
+    olds = {
+        "bucket": BUCKET,
+        "content_digest": "content",
+        "metadata_digest": "metadata",
+        "release_id": "r1",
+        "synced_at": "2025-01-01T00:00:00+00:00",
+        "object_count": 2,
+    }
+
+    result = S3SyncProvider().diff(BUCKET, olds, {**olds, **changed})
+
+    assert result.changes is expected_changes
+    assert result.replaces == expected_replaces
@@ -0,0 +1,112 @@
+import logging
+from pathlib import Path
+
+import pytest
+from infrastructure.asset_scanner import scan_assets
+from infrastructure.cache_control import DEFAULT_CACHE_CONTROL
+from infrastructure.cache_control import DEFAULT_CACHE_CONTROL_POLICY
+from infrastructure.cache_control import IMMUTABLE_CACHE_CONTROL
+from infrastructure.cache_control import MEDIA_CACHE_CONTROL
+from infrastructure.cache_control import REVALIDATE_CACHE_CONTROL
+from infrastructure.cache_control import CacheControlPolicy
+from infrastructure.compression import compress_assets
+from infrastructure.s3_sync import SyncEntry
+from infrastructure.s3_sync import build_sync_entries
+
+logger = logging.getLogger(__name__)
+
+HTML = "text/html; charset=utf-8"
+JSON = "application/json; charset=utf-8"
+TEXT = b"lorem ipsum dolor sit amet " * 100  # big enough to be worth compressing
+SAMPLE_BUILD: dict[str, bytes] = {
+    "index.html": b"<!DOCTYPE html>" + TEXT,
+    "200.html": b"<!DOCTYPE html>",
+    "blog/index.html": b"<!DOCTYPE html>" + TEXT,
+    "blog/_payload.json": b'{"data": "' + TEXT + b'"}',
+    "_nuxt/entry.B4x9Kz1q.js": TEXT,
+    "_nuxt/entry.Dk3x0a9Z.css": TEXT,
+    "_nuxt/builds/latest.json": b'{"id": "' + TEXT + b'"}',
+    "_nuxt/builds/meta/0b1c2d3e.json": b"{}",
+    "_nuxt/inter.woff2": b"wOF2" + bytes(2000),
+    "_derived/manifest.json": b"{}",
+    "_derived/3f9a1c2b7d4e-640.webp": b"RIFF\x00\x00\x00\x00WEBPVP8 ",
+    "_derived/3f9a1c2b7d4e-640.avif": b"\x00\x00\x00\x1cftypavif",
+    "images/hero.JPG": b"\xff\xd8\xff\xe0",
+    "images/logo.png": b"\x89PNG\r\n\x1a\n",
+    "images/logo.svg": b"<svg xmlns='http://www.w3.org/2000/svg'>" + TEXT + b"</svg>",
+    "favicon.ico": b"\x00\x00\x01\x00" + bytes(2000),
+    "videos/reel.mp4": b"\x00\x00\x00\x18ftypmp42",
+    "robots.txt": b"User-agent: *\n",
+    "sitemap.xml": b"<?xml version='1.0'?><urlset>" + TEXT + b"</urlset>",
+}
+
+
+def _dump(entries: list[SyncEntry]) -> str:
+    return "\n".join(
+        f"{entry.key:<36} {entry.content_type:<40} {entry.content_encoding or '-':<6} {entry.cache_control}"
+        for entry in entries
+    )
+
+
+@pytest.fixture
+def sample_build(tmp_path: Path) -> Path:
+    build_dir = tmp_path / "public"
+    for key, content in SAMPLE_BUILD.items():
+        path = build_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_bytes(content)
+    return build_dir
+
+
+def test_Given_a_sample_build__Then_every_object_gets_the_headers_for_its_content_type(
+    sample_build: Path, tmp_path: Path
+):
+    snapshot = scan_assets(sample_build, known_entries={})
+    compressed_variants = compress_assets(snapshot.records, cache_dir=tmp_path / "compressed", owner="test")
+
+    entries = build_sync_entries(snapshot.records, compressed_variants)
+
+    logger.info(f"Resolved headers for the sample build:\n{_dump(entries)}")
+    assert {entry.key: (entry.content_type, entry.content_encoding, entry.cache_control) for entry in entries} == {
+        "200.html": (HTML, None, REVALIDATE_CACHE_CONTROL),
+        "_derived/3f9a1c2b7d4e-640.avif": ("image/avif", None, IMMUTABLE_CACHE_CONTROL),
+        "_derived/3f9a1c2b7d4e-640.webp": ("image/webp", None, IMMUTABLE_CACHE_CONTROL),
+        "_derived/manifest.json": (JSON, None, REVALIDATE_CACHE_CONTROL),
+        "_nuxt/builds/latest.json": (JSON, "gzip", REVALIDATE_CACHE_CONTROL),
+        "_nuxt/builds/meta/0b1c2d3e.json": (JSON, None, REVALIDATE_CACHE_CONTROL),
+        "_nuxt/entry.B4x9Kz1q.js": ("application/javascript; charset=utf-8", "gzip", IMMUTABLE_CACHE_CONTROL),
+        "_nuxt/entry.Dk3x0a9Z.css": ("text/css; charset=utf-8", "gzip", IMMUTABLE_CACHE_CONTROL),
+        "_nuxt/inter.woff2": ("font/woff2", None, IMMUTABLE_CACHE_CONTROL),
+        "blog/_payload.json": (JSON, "gzip", REVALIDATE_CACHE_CONTROL),
+        "blog/index.html": (HTML, "gzip", REVALIDATE_CACHE_CONTROL),
+        "favicon.ico": ("image/x-icon", "gzip", MEDIA_CACHE_CONTROL),
+        "images/hero.JPG": ("image/jpeg", None, MEDIA_CACHE_CONTROL),
+        "images/logo.png": ("image/png", None, MEDIA_CACHE_CONTROL),
+        "images/logo.svg": ("image/svg+xml; charset=utf-8", "gzip", MEDIA_CACHE_CONTROL),
+        "index.html": (HTML, "gzip", REVALIDATE_CACHE_CONTROL),
+        "robots.txt": ("text/plain; charset=utf-8", None, DEFAULT_CACHE_CONTROL),
+        "sitemap.xml": ("application/xml; charset=utf-8", "gzip", DEFAULT_CACHE_CONTROL),
+        "videos/reel.mp4": ("video/mp4", None, MEDIA_CACHE_CONTROL),
+    }
+
+
+@pytest.mark.parametrize(
+    ("s3_key", "expected"),
+    [
+        pytest.param("_nuxt/builds/meta/0b1c2d3e.json", REVALIDATE_CACHE_CONTROL, id="build-manifest-before-bundles"),
+        pytest.param("_nuxt/deeply/nested/chunk.js", IMMUTABLE_CACHE_CONTROL, id="glob-crosses-directories"),
+        pytest.param("IMAGES/PHOTO.WEBP", MEDIA_CACHE_CONTROL, id="case-insensitive"),
+        pytest.param("downloads/brochure.pdf", DEFAULT_CACHE_CONTROL, id="no-rule-matches"),
+    ],
+)
+def test_rules_resolve_in_order(s3_key: str, expected: str):
+    assert DEFAULT_CACHE_CONTROL_POLICY.resolve(s3_key) == expected
+
+
+def test_Given_no_rules__Then_every_key_gets_the_default():
+    policy = CacheControlPolicy([], default=DEFAULT_CACHE_CONTROL)
+
+    assert policy.resolve_all(["index.html", "_nuxt/app.js"]) == {
+        "index.html": DEFAULT_CACHE_CONTROL,
+        "_nuxt/app.js": DEFAULT_CACHE_CONTROL,
+    }
@@ -0,0 +1,36 @@
+// Written by `python -m infrastructure.image_derivatives` before the site is generated. When it hasn't been run (e.g. a
+// quick local dev server), the glob matches nothing and images fall back to their originals.
+type DerivedVariant = { src: string; width: number; height: number; type: string };
+type DerivedImage = { digest: string; width: number; height: number; variants: DerivedVariant[] };
+type DerivedManifest = { version: number; images: Record<string, DerivedImage> };
+
+// set by nuxt.config.ts to whether public/_derived existed when the build started
+declare const __DERIVED_IMAGES_EXPECTED__: boolean | undefined;
+const derivedImagesExpected = typeof __DERIVED_IMAGES_EXPECTED__ !== "undefined" && __DERIVED_IMAGES_EXPECTED__;
+
+// relative to this file, since an absolute glob would resolve against the Vite root, which is app/ rather than the
+// project root that public/ is in
+const manifests = import.meta.glob<DerivedManifest>("../../public/_derived/manifest.json", {
+  eager: true,
+  import: "default",
+});
+if (derivedImagesExpected && !Object.keys(manifests).length) {
+  // fail the build, rather than quietly serving every image at its original size
+  throw new Error(
+    "public/_derived exists but its manifest.json wasn't found, rerun `python -m infrastructure.image_derivatives`",
+  );
+}
+const derivedImages: Record<string, DerivedImage> = Object.values(manifests)[0]?.images ?? {};
+
+export type DerivedSource = { type: string; srcset: string };
+
+export function getDerivedSources(src: string): DerivedSource[] {
+  const image = derivedImages[src];
+  if (!image) return [];
+  const byType = new Map<string, string[]>();
+  for (const variant of image.variants) {
+    byType.set(variant.type, [...(byType.get(variant.type) ?? []), `${variant.src} ${variant.width}w`]);
+  }
+  // the manifest lists the most compact format first, and browsers use the first <source> whose type they support
+  return [...byType].map(([type, candidates]) => ({ type, srcset: candidates.join(", ") }));
+}
@@ -12,6 +12,9 @@ BUCKET_NAME="$1"
 SCRIPT_DIR="$(dirname "$0")"
 APP_PROJECT_DIR="$(realpath "$SCRIPT_DIR")"
 
+# the site links to the responsive variants of its photos when they exist, as they do in CI
+uv --directory="$APP_PROJECT_DIR"/../infrastructure run python -m infrastructure.image_derivatives
+
 (cd $APP_PROJECT_DIR && npm run generate)
 
 aws s3 sync --delete "$APP_PROJECT_DIR"/.output/public/ "s3://$BUCKET_NAME"
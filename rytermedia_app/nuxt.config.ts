@@ -1,5 +1,12 @@
 // https://nuxt.com/docs/api/configuration/nuxt-config
+import { existsSync } from "node:fs";
+import { fileURLToPath } from "node:url";
 import { defineNuxtConfig } from "nuxt/config";
+
+// written by `python -m infrastructure.image_derivatives`, and app/utils/derived-images.ts fails the build if it has
+// been run but its manifest can't be found
+const derivedImagesExpected = existsSync(fileURLToPath(new URL("./public/_derived", import.meta.url)));
+
 export default defineNuxtConfig({
   compatibilityDate: "2024-11-01",
   future: {
@@ -30,6 +37,9 @@ export default defineNuxtConfig({
     },
   },
   vite: {
+    define: {
+      __DERIVED_IMAGES_EXPECTED__: JSON.stringify(derivedImagesExpected),
+    },
     server: {
       watch: {
         usePolling: true, // this seems to be explicitly needed when in a devcontainer in order for hot reloading to work